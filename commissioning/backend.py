@@ -0,0 +1,37 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import os
+import sys
+
+# Installation directory of smcdbusclient on the robot
+SMCDBUSCLIENT_DIR = "/opt/ezw/usr/lib"
+
+# In-process simulator of smcdbusclient, see sim/smcdbusclient/simulator.py
+SIMULATOR_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "sim")
+
+
+def name() -> str:
+    """Backend selected by the SWD_BACKEND environment variable: "dbus" (default), "sim" or "replay"."""
+
+    return os.environ.get("SWD_BACKEND", "dbus")
+
+
+def setup():
+    """Make smcdbusclient importable.
+
+    The simulator is used when the SWD_BACKEND environment variable is "sim",
+    and for its types when it is "replay", with the enumerations of the recording
+    (see recording.py), the library installed with swd-services otherwise.
+    """
+
+    if name() in ("sim", "replay"):
+        if SIMULATOR_DIR not in sys.path:
+            sys.path.insert(0, SIMULATOR_DIR)
+        if name() == "replay":
+            import recording
+
+            recording.install_enums()
+    elif SMCDBUSCLIENT_DIR not in sys.path:
+        sys.path.append(SMCDBUSCLIENT_DIR)
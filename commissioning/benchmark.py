@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Benchmark of the commissioning and check flows.
+
+The flows of the left and right motors run repeatedly against the simulator of
+smcdbusclient, with a configurable latency. The median duration of every phase
+(restore, reset, steps of the plan, storeParameters, checks) and the number of
+D-Bus calls are compared to a baseline, and the benchmark fails when a phase is
+slower than the baseline by more than the budget, or issues more calls.
+
+The startup flow measures, in fresh interpreters, the import of the commissioning
+module and the creation of the clients up to the first call.
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# Baseline of the benchmark, recorded with --update-baseline
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "baseline.json")
+
+SIDES = ["left", "right"]
+
+# Run in a fresh interpreter by the startup flow
+STARTUP = """
+import time
+start = time.perf_counter()
+import commissioning
+imported = time.perf_counter()
+swd = commissioning.SWDClients("swd_left")
+swd.nmt_client.getNMTState()
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def call_count(simulator) -> int:
+    return sum(simulator.call_counts().values())
+
+
+def run_flows(side: str, simulator) -> Dict[str, dict]:
+    """Commission a factory motor, commission it again incrementally and check it.
+
+    The "bulk" flows do the same with the bulk download of the standard objects,
+    see dcf.py. Returns the duration of the phases and the number of calls of
+    every flow.
+    """
+
+    import commissioning
+    import check_commissioning
+    import profiles
+
+    plan = profiles.compile_profile(profiles.PROFILES[side])
+    simulator.forget_devices()
+
+    results = {}
+    for flow, incremental, bulk in [
+        ("commission", False, False),
+        ("incremental", True, False),
+        ("bulk", False, True),
+        ("incremental bulk", True, True),
+        ("check", None, False),
+    ]:
+        swd = commissioning.SWDClients(plan.instance_id, bool(incremental))
+        calls = call_count(simulator)
+
+        start = time.perf_counter()
+        with redirect_stdout(io.StringIO()):
+            if incremental is None:
+                mismatches = check_commissioning.check_motor(swd, plan)
+            else:
+                commissioning.commission(swd, plan, bulk=bulk)
+        swd.timings["total"] = time.perf_counter() - start
+
+        if incremental is None and mismatches:
+            raise commissioning.CommissioningError(f"{side}: {len(mismatches)} mismatch(es) after commissioning")
+
+        results[f"{side} {flow}"] = {"phases": swd.timings, "calls": call_count(simulator) - calls}
+
+    return results
+
+
+def run_startup(runs: int, backend: str, sim_config: dict) -> dict:
+    """Median startup time of `runs` fresh interpreters using `backend`."""
+
+    env = {**os.environ, "SWD_BACKEND": backend, "SWD_SIM_CONFIG": json.dumps(sim_config)}
+    env.pop("SWD_TRACE", None)
+
+    phases: Dict[str, List[float]] = {"import": [], "first call": [], "total": []}
+    for _ in range(0, runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", STARTUP], cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=subprocess.PIPE, text=True, check=True).stdout
+        phases["total"].append(time.perf_counter() - start)
+
+        imported, first_call = output.split()
+        phases["import"].append(float(imported))
+        phases["first call"].append(float(first_call))
+
+    return {"phases": {phase: round(statistics.median(durations), 6) for phase, durations in phases.items()}, "calls": 1}
+
+
+def run_benchmark(runs: int, simulator) -> Dict[str, dict]:
+    """Median duration of the phases over `runs` runs of every flow."""
+
+    samples: Dict[str, List[dict]] = {}
+    for _ in range(0, runs):
+        for side in SIDES:
+            for flow, result in run_flows(side, simulator).items():
+                samples.setdefault(flow, []).append(result)
+
+    flows = {}
+    for flow, results in samples.items():
+        phases = {}
+        for result in results:
+            for phase, duration in result["phases"].items():
+                phases.setdefault(phase, []).append(duration)
+
+        flows[flow] = {
+            "phases": {phase: round(statistics.median(durations), 6) for phase, durations in phases.items()},
+            "calls": max(result["calls"] for result in results),
+        }
+
+    return flows
+
+
+def compare(results: dict, baseline: dict, budget: float, slack: float) -> List[str]:
+    """Return a description of every regression of `results` against `baseline`."""
+
+    regressions = []
+
+    for flow, expected in baseline["flows"].items():
+        if flow not in results["flows"]:
+            regressions.append(f"{flow}: missing")
+            continue
+        actual = results["flows"][flow]
+
+        if actual["calls"] > expected["calls"]:
+            regressions.append(f"{flow}: {actual['calls']} calls instead of {expected['calls']}")
+
+        for phase, duration in expected["phases"].items():
+            if phase not in actual["phases"]:
+                # Phases may disappear, e.g. a step made unnecessary
+                continue
+            if actual["phases"][phase] > duration * (1 + budget) + slack:
+                regressions.append(f"{flow}: {phase} took {actual['phases'][phase] * 1000:.1f}ms instead of {duration * 1000:.1f}ms")
+
+    return regressions
+
+
+def print_results(results: dict, baseline: dict):
+    print(f"{'flow':<24}  {'phase':<32}  {'baseline':>10}  {'current':>10}  {'delta':>7}")
+
+    for flow, actual in results["flows"].items():
+        expected = baseline.get("flows", {}).get(flow, {"phases": {}})
+        for phase, duration in actual["phases"].items():
+            if phase in expected["phases"]:
+                reference = expected["phases"][phase]
+                delta = f"{(duration - reference) / reference * 100:+.0f}%" if reference else ""
+                print(f"{flow:<24}  {phase:<32}  {reference * 1000:>8.1f}ms  {duration * 1000:>8.1f}ms  {delta:>7}")
+            else:
+                print(f"{flow:<24}  {phase:<32}  {'-':>10}  {duration * 1000:>8.1f}ms  {'':>7}")
+        print(f"{flow:<24}  {'D-Bus calls':<32}  {expected.get('calls', '-'):>10}  {actual['calls']:>10}")
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Benchmark the commissioning and check flows against the simulator")
+    parser.add_argument("--runs", type=int, default=5, help="number of runs of every flow (default: %(default)s)")
+    parser.add_argument("--latency", type=float, default=0.002, help="latency of every D-Bus call, in seconds (default: %(default)s)")
+    parser.add_argument("--store-time", type=float, default=0.05, help="duration of storing all the parameters, in seconds (default: %(default)s)")
+    parser.add_argument("--boot-time", type=float, default=0.1, help="duration of a reset, in seconds (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE, help="baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--budget", type=float, default=0.25, help="allowed slowdown of a phase, relative to the baseline (default: %(default)s)")
+    parser.add_argument("--slack", type=float, default=0.005, help="allowed slowdown of a phase, in seconds (default: %(default)s)")
+    parser.add_argument("--startup-backend", choices=["sim", "dbus"], default="sim", help="backend of the startup flow (default: %(default)s)")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    args = parser.parse_args(argv)
+
+    # The flows always run against the simulator
+    os.environ["SWD_BACKEND"] = "sim"
+    import backend
+
+    backend.setup()
+    from smcdbusclient import simulator
+
+    config = {"latency": args.latency, "store_time": args.store_time, "boot_time": args.boot_time, "runs": args.runs, "startup_backend": args.startup_backend}
+    sim_config = {"latency": args.latency, "store_time": args.store_time, "boot_time": args.boot_time, "errors": {}, "state_dir": None}
+    simulator.configure(**sim_config)
+
+    results = {"config": config, "flows": run_benchmark(args.runs, simulator)}
+    results["flows"]["startup"] = run_startup(args.runs, args.startup_backend, sim_config)
+
+    baseline = {}
+    if os.path.isfile(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_results(results, baseline)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not baseline:
+        print(f"\nNo baseline in {args.baseline}, run with --update-baseline to record one")
+        sys.exit(1)
+
+    if baseline["config"] != config:
+        print(f"\nWarning: the baseline was recorded with {baseline['config']}")
+
+    regressions = compare(results, baseline, args.budget, args.slack)
+    if regressions:
+        print("\nRegressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+
+    print("\nNo regression")
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1:])
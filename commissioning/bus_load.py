@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Offline analysis of the CAN bus load of the PDOs and SRDOs of the profiles.
+
+The profiles of the nodes sharing the bus are analyzed together: the frames of
+the bus are the SYNC, the valid TPDOs of every node, the valid RPDOs (sent by the
+controller when no analyzed node sends them) and both frames of every SRDO. A
+frame shared by two profiles (the TPDO of one node received by the other one, an
+SRDO configured on both motors) is counted once.
+
+Every frame is counted with its worst-case length, bit stuffing included, and the
+worst-case latency of every frame is computed with the response time analysis of
+CAN (fixed priority by COB-ID, non-preemptive). For every SRDO, the latency of the
+normal frame must fit in its SCT with the refresh time, and the latency of the
+inverted frame in its SRVT.
+
+    python3 bus_load.py --sync-period 10
+"""
+
+import argparse
+import math
+import sys
+from typing import Dict, List, Optional
+
+import profiles
+from profiles import Plan
+
+# COB-ID of the SYNC frame
+SYNC_COB_ID = 0x80
+
+# Bus load above which a warning is reported
+LOAD_WARNING = 0.7
+
+
+class Frame:
+    """Periodic frame of the bus."""
+
+    def __init__(self, cob_id: int, name: str, producer: str, size: int, period: float):
+        self.cob_id = cob_id
+        self.name = name
+        self.producer = producer
+        self.size = size
+        self.period = period
+        self.bits = frame_bits(size)
+        self.latency: Optional[float] = None
+
+
+class SRDO:
+    """SRDO of the bus, seen by its producer and its consumer."""
+
+    def __init__(self, can_id1: int, can_id2: int):
+        self.can_id1 = can_id1
+        self.can_id2 = can_id2
+        # (SCT, SRVT, instance, SRDO) of every profile configuring the SRDO, times in ms
+        self.ends: List[tuple] = []
+
+    @property
+    def producer(self) -> tuple:
+        # The producer sends the SRDO every refresh time, set in place of the SCT,
+        # and the consumer monitors it with a longer SCT
+        return min(self.ends)
+
+    @property
+    def name(self) -> str:
+        return " ".join(self.producer[2:])
+
+    @property
+    def refresh_time(self) -> int:
+        return self.producer[0]
+
+    @property
+    def sct(self) -> Optional[int]:
+        return max(self.ends)[0] if len(self.ends) > 1 else None
+
+    @property
+    def srvt(self) -> int:
+        return min(srvt for sct, srvt, instance_id, name in self.ends)
+
+
+def frame_bits(size: int) -> int:
+    """Worst-case length of a standard CAN frame with `size` data bytes, bit stuffing and interframe space included."""
+    return 34 + 8 * size + 13 + (34 + 8 * size - 1) // 4
+
+
+def bitrate(plans: List[Plan]) -> Optional[int]:
+    """Bitrate of the bus in kbit/s, from the network parameters of the profiles."""
+
+    rates = set()
+    for plan in plans:
+        for operation in plan.operations:
+            if operation.getter == "getNetworkParameters" and "bit_timing" in operation.expected:
+                rates.add(int(operation.expected["bit_timing"].name[len("BT_") :]))
+
+    if len(rates) > 1:
+        raise profiles.ProfileError(f"the profiles use different bitrates: {', '.join(f'{rate} kbit/s' for rate in sorted(rates))}")
+    return rates.pop() if rates else None
+
+
+def bus_frames(plans: List[Plan], sync_period: float, warnings: List[str]) -> Dict[int, Frame]:
+    """Frames of the bus by COB-ID, and the warnings about the assumptions made."""
+
+    frames = {SYNC_COB_ID: Frame(SYNC_COB_ID, "SYNC", "controller", 0, sync_period)}
+
+    def add(frame: Frame):
+        other = frames.get(frame.cob_id)
+        if other is None:
+            frames[frame.cob_id] = frame
+        elif other.producer == frame.producer or frame.producer == "controller":
+            pass
+        elif other.producer == "controller":
+            frames[frame.cob_id] = frame
+        else:
+            warnings.append(f"COB-ID 0x{frame.cob_id:03X} is sent by {other.producer} ({other.name}) and {frame.producer} ({frame.name})")
+
+    for direction in ["TPDO", "RPDO"]:
+        for plan in plans:
+            mappings = {operation.args[0]: operation.expected for operation in plan.operations if operation.getter == f"get{direction}MappingParameters"}
+
+            for operation in plan.operations:
+                if operation.getter != f"get{direction}CommunicationParameters" or not operation.expected["cob_id.valid"]:
+                    continue
+
+                pdo = operation.args[0]
+                name = f"{plan.instance_id} {direction}{pdo.value + 1}"
+                transmission_type = operation.expected["transmission_type"]
+
+                if pdo in mappings:
+                    size = math.ceil(sum(item & 0xFF for item in mappings[pdo]) / 8)
+                else:
+                    size = 8
+                    warnings.append(f"{name}: mapping not in the profile, 8 bytes assumed")
+
+                if 1 <= transmission_type.value <= 240:
+                    period = sync_period * transmission_type.value
+                else:
+                    period = sync_period
+                    warnings.append(f"{name}: {transmission_type.name} counted at every SYNC")
+
+                add(Frame(operation.expected["cob_id.can_id"], name, plan.instance_id if direction == "TPDO" else "controller", size, period))
+
+    return frames
+
+
+def bus_srdos(plans: List[Plan]) -> List[SRDO]:
+    """SRDOs of the bus, the ones configured on two nodes being merged."""
+
+    srdos: Dict[tuple, SRDO] = {}
+    for plan in plans:
+        for operation in plan.operations:
+            if operation.getter != "getSRDOParameters" or not operation.expected.get("valid"):
+                continue
+            fields = operation.expected
+            srdo = srdos.setdefault((fields["can_id1"], fields["can_id2"]), SRDO(fields["can_id1"], fields["can_id2"]))
+            srdo.ends.append((fields["sct"], fields["srvt"], plan.instance_id, operation.args[0].name))
+
+    return list(srdos.values())
+
+
+def response_times(frames: List[Frame], bit_time: float):
+    """Worst-case latency of every frame, from its queuing to the end of its transmission.
+
+    The latency of a frame which can miss its period is left to None.
+    """
+
+    for frame in frames:
+        higher = [other for other in frames if other.cob_id < frame.cob_id]
+        blocking = max(other.bits for other in frames if other.cob_id >= frame.cob_id) * bit_time
+        transmission = frame.bits * bit_time
+
+        # Queuing delay: blocked by one lower priority frame, and preempted by the
+        # higher priority ones released meanwhile
+        delay = blocking
+        while True:
+            next_delay = blocking + sum(math.ceil((delay + bit_time) / other.period) * other.bits * bit_time for other in higher)
+            if next_delay + transmission > frame.period:
+                frame.latency = None
+                break
+            if next_delay == delay:
+                frame.latency = delay + transmission
+                break
+            delay = next_delay
+
+
+def analyze(plans: List[Plan], sync_period: float, rate: Optional[int] = None, srdo_size: int = 8) -> dict:
+    """Analyze the bus of the nodes of `plans`, `sync_period` and the latencies being in seconds."""
+
+    warnings: List[str] = []
+    errors: List[str] = []
+
+    rate = rate or bitrate(plans)
+    if rate is None:
+        raise profiles.ProfileError("no bit_timing in the profiles, the bitrate is required")
+    bit_time = 1 / (rate * 1000)
+
+    frames = bus_frames(plans, sync_period, warnings)
+
+    srdos = bus_srdos(plans)
+    for srdo in srdos:
+        producer = srdo.producer[2]
+        frames[srdo.can_id1] = Frame(srdo.can_id1, f"{srdo.name} normal", producer, srdo_size, srdo.refresh_time / 1000)
+        frames[srdo.can_id2] = Frame(srdo.can_id2, f"{srdo.name} inverted", producer, srdo_size, srdo.refresh_time / 1000)
+    if srdos:
+        warnings.append(f"SRDO frames counted with {srdo_size} bytes")
+
+    frames = sorted(frames.values(), key=lambda frame: frame.cob_id)
+    response_times(frames, bit_time)
+
+    load = sum(frame.bits * bit_time / frame.period for frame in frames)
+    if load >= 1:
+        errors.append(f"bus saturated: {load * 100:.1f}% load")
+    elif load > LOAD_WARNING:
+        warnings.append(f"bus load above {LOAD_WARNING * 100:.0f}%: {load * 100:.1f}%")
+
+    # Every synchronous frame is sent right after the SYNC, they must all fit in one period
+    burst = sum(frame.bits for frame in frames if frame.period == sync_period) * bit_time
+    if burst > sync_period:
+        errors.append(f"the frames sent at every SYNC take {burst * 1000:.2f}ms, more than the SYNC period")
+
+    for frame in frames:
+        if frame.latency is None:
+            errors.append(f"{frame.name} (0x{frame.cob_id:03X}) can miss its period of {frame.period * 1000:g}ms")
+
+    by_cob_id = {frame.cob_id: frame for frame in frames}
+    for srdo in srdos:
+        normal = by_cob_id[srdo.can_id1].latency
+        inverted = by_cob_id[srdo.can_id2].latency
+        if srdo.sct is None:
+            warnings.append(f"{srdo.name}: consumer not in the profiles, SCT not checked")
+        elif normal is None or srdo.refresh_time / 1000 + normal > srdo.sct / 1000:
+            errors.append(f"{srdo.name}: refresh time {srdo.refresh_time}ms and latency exceed the SCT of {srdo.sct}ms")
+        if inverted is None or inverted > srdo.srvt / 1000:
+            errors.append(f"{srdo.name}: latency of the inverted frame exceeds the SRVT of {srdo.srvt}ms")
+
+    return {"bitrate": rate, "sync_period": sync_period, "frames": frames, "srdos": srdos, "load": load, "burst": burst, "warnings": warnings, "errors": errors}
+
+
+def print_report(report: dict):
+    print(f"Bus: {report['bitrate']} kbit/s, SYNC every {report['sync_period'] * 1000:g}ms\n")
+
+    print(f"{'COB-ID':<7}  {'frame':<28}  {'producer':<12}  {'bytes':>5}  {'bits':>4}  {'period':>9}  {'load':>6}  {'latency':>9}")
+    for frame in report["frames"]:
+        bit_time = 1 / (report["bitrate"] * 1000)
+        latency = f"{frame.latency * 1000:.3f}ms" if frame.latency is not None else "-"
+        print(
+            f"0x{frame.cob_id:03X}    {frame.name:<28}  {frame.producer:<12}  {frame.size:>5}  {frame.bits:>4}  {frame.period * 1000:>7g}ms  "
+            f"{frame.bits * bit_time / frame.period * 100:>5.2f}%  {latency:>9}"
+        )
+
+    print(f"\nBus load: {report['load'] * 100:.2f}%")
+    print(f"Frames at every SYNC: {report['burst'] * 1000:.3f}ms of {report['sync_period'] * 1000:g}ms")
+
+    if report["srdos"]:
+        print(f"\n{'SRDO':<24}  {'COB-IDs':<11}  {'refresh':>8}  {'SCT':>6}  {'SRVT':>6}")
+        for srdo in report["srdos"]:
+            sct = f"{srdo.sct}ms" if srdo.sct is not None else "-"
+            print(f"{srdo.name:<24}  0x{srdo.can_id1:03X}/0x{srdo.can_id2:03X}  {srdo.refresh_time:>6}ms  {sct:>6}  {srdo.srvt:>4}ms")
+
+    for title, messages in [("Assumptions", report["warnings"]), ("Errors", report["errors"])]:
+        if messages:
+            print(f"\n{title}:")
+            for message in messages:
+                print(f"  {message}")
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compute the CAN bus load and the worst-case latencies of the PDOs and SRDOs of the profiles")
+    parser.add_argument("profiles", nargs="*", help="profiles of the nodes of the bus (default: both motors)")
+    parser.add_argument("--sync-period", type=float, required=True, help="period of the SYNC, in ms")
+    parser.add_argument("--bitrate", type=int, help="bitrate of the bus, in kbit/s (default: bit_timing of the profiles)")
+    parser.add_argument("--srdo-bytes", type=int, default=8, choices=range(0, 9), metavar="{0..8}", help="data bytes of every SRDO frame (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    if args.sync_period <= 0:
+        parser.error("--sync-period must be positive")
+    if args.bitrate is not None and args.bitrate <= 0:
+        parser.error("--bitrate must be positive")
+
+    plans = [profiles.compile_profile(path) for path in args.profiles or profiles.PROFILES.values()]
+    report = analyze(plans, args.sync_period / 1000, args.bitrate, args.srdo_bytes)
+    print_report(report)
+
+    if report["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except profiles.ProfileError as e:
+        print(f"Invalid profile: {e}")
+        sys.exit(1)
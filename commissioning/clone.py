@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Clone the configuration of a reference motor to other motors.
+
+The configuration of the reference motor is read in one batched pass and turned
+into a profile, whose COB-IDs following the predefined connection set are
+written relative to $NODE_ID. A profile is derived from it for every target,
+with its own instance, node ID and overrides, then the targets are commissioned
+concurrently and checked:
+
+    python3 clone.py swd_left targets.json
+
+The targets file lists the motors to configure:
+
+    {
+        "targets": [
+            {
+                "name": "swd_right_5", "instance_id": "swd_right", "node_id": 5, "mirror": true,
+                "overrides": {"safety_control_word_mapping": {
+                    "CAN_2": ["STO", "STO", "SDIP_1", "SDIP_1", "SLS_1", "SLS_1", "NONE", "NONE"],
+                    "SAFEIN_1": ["STO", "STO", "NONE", "NONE", "NONE", "NONE"]
+                }}
+            }
+        ]
+    }
+
+`mirror` is for the other motor of an SRDO pair: the CAN IDs of its two SRDOs are
+exchanged and its polarities inverted. The mapping of the safety control words
+depends on the wiring of the motors, it cannot be mirrored and must be given with
+the overrides of a mirrored target. `overrides` is merged into the profile of the target, e.g. {"polarity": {"velocity_polarity": false}}.
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import json
+import os
+import sys
+import threading
+from typing import Dict, List, Optional, Union
+
+import commissioning
+from commissioning import SWDClients
+
+import check_commissioning
+
+import profiles
+from profiles import Operation, Plan
+
+from snapshot import read_snapshot
+
+import verification
+
+from smcdbusclient.communication import PDOId
+from smcdbusclient.safe_motion import STOId, SLSId, SafetyControlWordId
+from smcdbusclient.srdo import SRDOId
+
+# COB-ID of the first PDO of every direction in the predefined connection set,
+# the next PDOs being 0x100 apart
+PREDEFINED_COB_IDS = {"TPDO": 0x180, "RPDO": 0x200}
+
+# Fields of the objects of the profile, see profiles.compile_profile_data()
+VELOCITY_MODE_FIELDS = ["vl_velocity_acceleration_delta_speed", "vl_velocity_deceleration_delta_speed"]
+SLS_FIELDS = ["velocity_limit_u32", "time_to_velocity_monitoring", "time_for_velocity_in_limits"]
+SWD_FIELDS = ["motctrl_speed_pid_p", "motctrl_speed_pid_i", "motctrl_speed_pid_d"]
+
+
+def reference_operations(od: Dict[str, dict]) -> List[Operation]:
+    """Operations reading every object of a profile, the raw entries of `od` included."""
+
+    operations = [Operation("network", "communication_client", "getNetworkParameters", None)]
+    for direction in PREDEFINED_COB_IDS:
+        for pdo in PDOId:
+            operations.append(Operation("communication", "communication_client", f"get{direction}CommunicationParameters", None, (pdo,)))
+            operations.append(Operation("communication", "communication_client", f"get{direction}MappingParameters", None, (pdo,)))
+    operations.append(Operation("polarity", "pds_client", "getPolarityParameters", None))
+    operations += [Operation("srdo", "srdo_client", "getSRDOParameters", None, (srdo,), value_index=1) for srdo in SRDOId]
+    operations += [Operation("srdo", "safe_motion_client", "getSafetyControlWordMapping", None, (scw,)) for scw in SafetyControlWordId]
+    operations.append(Operation("ramps", "velocity_mode_client", "getVelocityModeParameters", None))
+    operations += [Operation("sto", "safe_motion_client", "getSTOParameters", None, (sto,)) for sto in STOId]
+    operations += [Operation("sls", "safe_motion_client", "getSLSParameters", None, (sls,)) for sls in SLSId]
+    operations += [Operation("od", "can_open_client", f"getValue{entry['type']}", None, (profiles.parse_int(index, 0),)) for index, entry in od.items()]
+    operations.append(Operation("swd", "manufacturer_client", "getSWDParameters", None))
+    return operations
+
+
+def cob_id_expression(can_id: int, predefined: int, node_id: int) -> str:
+    if can_id == predefined + node_id:
+        return f"0x{predefined:X} + $NODE_ID"
+    return f"0x{can_id:X}"
+
+
+def read_reference(swd: SWDClients, od: Optional[Dict[str, dict]] = None) -> dict:
+    """Read the configuration of a motor, return it as a profile.
+
+    `od` is the "od" section of a profile, telling the raw entries to read.
+    """
+
+    od = od or {}
+    operations = reference_operations(od)
+    snapshot = read_snapshot(swd, operations)
+
+    values = {}
+    for operation in operations:
+        value, error = snapshot.read(operation)
+        commissioning.check(operation.call_name(operation.getter), error)
+        values[operation.name] = value
+
+    network = values["NetworkParameters()"]
+    node_id = network.node_id
+    profile = {
+        "name": swd.instance_id,
+        "instance_id": swd.instance_id,
+        "node_id": node_id,
+        "network": {"bit_timing": network.bit_timing.name, "rt_activated": bool(network.rt_activated)},
+    }
+
+    for direction, first in PREDEFINED_COB_IDS.items():
+        section = profile[direction.lower()] = {}
+        for pdo in PDOId:
+            communication = values[f"{direction}CommunicationParameters({pdo.name})"]
+            mapping = values[f"{direction}MappingParameters({pdo.name})"]
+            section[pdo.name] = {
+                "cob_id": cob_id_expression(communication.cob_id.can_id, first + 0x100 * pdo.value, node_id),
+                "valid": bool(communication.cob_id.valid),
+                "flag": bool(communication.cob_id.flag),
+                "transmission_type": communication.transmission_type.name,
+            }
+            if mapping.nb:
+                section[pdo.name]["mapping"] = [profiles.format_arg(item) for item in list(mapping.items)[: mapping.nb]]
+
+    polarity = values["PolarityParameters()"]
+    profile["polarity"] = {"velocity_polarity": bool(polarity.velocity_polarity), "position_polarity": bool(polarity.position_polarity)}
+
+    profile["srdo"] = {}
+    for srdo in SRDOId:
+        params = values[f"SRDOParameters({srdo.name})"]
+        if params.valid:
+            profile["srdo"][srdo.name] = {"can_id1": f"0x{params.can_id1:X}", "can_id2": f"0x{params.can_id2:X}", "sct": params.sct, "srvt": params.srvt}
+
+    profile["safety_control_word_mapping"] = {}
+    for scw in SafetyControlWordId:
+        mapping = values[f"SafetyControlWordMapping({scw.name})"]
+        functions = []
+        while hasattr(mapping, f"safety_function_{len(functions)}"):
+            functions.append(getattr(mapping, f"safety_function_{len(functions)}").name)
+        profile["safety_control_word_mapping"][scw.name] = functions
+
+    ramps = values["VelocityModeParameters()"]
+    profile["velocity_mode"] = {field: getattr(ramps, field) for field in VELOCITY_MODE_FIELDS}
+    profile["sto"] = {sto.name: {"restart_acknowledge_behavior": bool(values[f"STOParameters({sto.name})"].restart_acknowledge_behavior)} for sto in STOId}
+    profile["sls"] = {sls.name: {field: getattr(values[f"SLSParameters({sls.name})"], field) for field in SLS_FIELDS} for sls in SLSId}
+    profile["od"] = {index: {**entry, "value": values[f"Value{entry['type']}({profiles.format_arg(profiles.parse_int(index, 0))})"]} for index, entry in od.items()}
+    profile["swd"] = {field: getattr(values["SWDParameters()"], field) for field in SWD_FIELDS}
+
+    return profile
+
+
+def merge(profile: dict, overrides: dict):
+    """Merge `overrides` into `profile`, recursively."""
+
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(profile.get(key), dict):
+            merge(profile[key], value)
+        else:
+            profile[key] = value
+
+
+def target_profile(reference: dict, target: dict) -> dict:
+    """Profile of a target, derived from the profile of the reference motor."""
+
+    for key in ["name", "instance_id", "node_id"]:
+        if key not in target:
+            raise profiles.ProfileError(f"target without {key}")
+
+    profile = copy.deepcopy(reference)
+    profile["name"] = target["name"]
+    profile["instance_id"] = target["instance_id"]
+    profile["node_id"] = target["node_id"]
+
+    if target.get("mirror"):
+        # The safety control words of the other motor are wired differently
+        if not target.get("overrides", {}).get("safety_control_word_mapping"):
+            raise profiles.ProfileError(f"{target['name']}: mirror needs the safety_control_word_mapping in the overrides")
+
+        srdos = list(profile["srdo"].values())
+        if len(srdos) != 2:
+            raise profiles.ProfileError(f"{target['name']}: mirror expects 2 SRDOs, the reference has {len(srdos)}")
+        for key in ["can_id1", "can_id2"]:
+            srdos[0][key], srdos[1][key] = srdos[1][key], srdos[0][key]
+        for key in profile["polarity"]:
+            profile["polarity"][key] = not profile["polarity"][key]
+
+    merge(profile, target.get("overrides", {}))
+    return profile
+
+
+def clone(plans: List[Plan], incremental: bool = False) -> Dict[str, Union[List[verification.Mismatch], Exception]]:
+    """Commission the targets concurrently, then check them.
+
+    The final resets are synchronized, so that SRDO partners restart together.
+    Returns the mismatches of every instance, or the exception it raised.
+    """
+
+    barrier = threading.Barrier(len(plans))
+
+    def sync():
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            commissioning.check("wait for the other targets", 0)
+
+    def run(plan: Plan):
+        threading.current_thread().name = plan.instance_id
+
+        try:
+            swd = SWDClients(plan.instance_id, incremental)
+            commissioning.commission(swd, plan, sync)
+        except Exception:
+            # Release the targets waiting for this one
+            barrier.abort()
+            raise
+
+        return check_commissioning.check_motor(SWDClients(plan.instance_id), plan)
+
+    with ThreadPoolExecutor(max_workers=len(plans)) as executor:
+        futures = {plan.instance_id: executor.submit(run, plan) for plan in plans}
+
+    results = {}
+    for instance_id, future in futures.items():
+        error = future.exception()
+        results[instance_id] = future.result() if error is None else error
+
+    return results
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Clone the configuration of a reference motor to other motors")
+    parser.add_argument("reference", help="swd-services instance of the reference motor, e.g. swd_left")
+    parser.add_argument("targets", help="targets file")
+    parser.add_argument("--od", help="profile whose raw 'od' entries are cloned (default: profile of the reference instance, if any)")
+    parser.add_argument("--save", metavar="DIR", help="write the profile of the reference and of every target in DIR")
+    parser.add_argument("--dry-run", action="store_true", help="only read the reference and write the profiles")
+    parser.add_argument("--incremental", action="store_true", help="only write the parameters that differ on every target")
+    args = parser.parse_args(argv)
+
+    with open(args.targets) as f:
+        targets = json.load(f)["targets"]
+    if not targets:
+        parser.error("no target")
+
+    od_profile = args.od or next((path for path in profiles.PROFILES.values() if profiles.compile_profile(path).instance_id == args.reference), None)
+    od = {}
+    if od_profile is not None:
+        with open(od_profile) as f:
+            od = json.load(f).get("od", {})
+
+    commissioning.load_dbus_session()
+    reference = read_reference(SWDClients(args.reference), od)
+    target_profiles = [target_profile(reference, target) for target in targets]
+
+    # Validate every profile before touching any target
+    plans = [profiles.compile_profile_data(profile) for profile in target_profiles]
+    if len({plan.instance_id for plan in plans}) != len(plans):
+        raise profiles.ProfileError("several targets with the same instance")
+
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for profile in [reference] + target_profiles:
+            path = os.path.join(args.save, f"{profile['name']}.json")
+            with open(path, "w") as f:
+                json.dump(profile, f, indent=4)
+                f.write("\n")
+            print(f"Profile written to {path}")
+
+    if args.dry_run:
+        return
+
+    print()
+    results = clone(plans, args.incremental)
+
+    print()
+    failed = False
+    for instance_id, result in results.items():
+        if isinstance(result, Exception):
+            print(f"{instance_id} : clone failed ({result})")
+            failed = True
+        elif result:
+            print(f"{instance_id} : {len(result)} mismatch(es) after cloning")
+            for mismatch in result:
+                print(f"  {mismatch}")
+            failed = True
+        else:
+            print(f"{instance_id} : cloned and checked")
+
+    if failed:
+        print("\nClone failed !")
+        sys.exit(1)
+
+    # Exit with success
+    print("\nClone succeeded !")
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except profiles.ProfileError as e:
+        print(f"Invalid profile: {e}")
+        sys.exit(1)
+    except commissioning.CommissioningError:
+        print("\nClone failed !")
+        sys.exit(1)
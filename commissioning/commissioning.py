@@ -3,235 +3,488 @@
 #
 
 import sys
-from typing import List
+from contextlib import contextmanager
+import copy
+import importlib
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
 
-sys.path.append("/opt/ezw/usr/lib")
+import backend
 
-from colorama import Fore, Style
+backend.setup()
 
-from smcdbusclient.communication import NetworkParameters, BitTiming, PDOCommunicationParameters, PDOTransmissionType, PDOId, CommunicationDBusClient, PDOMappingParameters
-from smcdbusclient.pds import PolarityParameters, PDSDBusClient
-from smcdbusclient.safe_motion import STOId, SLSId, SafetyFunctionId, SafetyWordMapping, SafeMotionDBusClient
+from profiles import Operation, Plan, Step
 
-from smcdbusclient.nmt import NMTDBusClient
+from snapshot import Snapshot, read_snapshot
 
-from smcdbusclient.velocity_mode import VelocityModeDBusClient
+import recording
+from recording import Recorder
 
-from smcdbusclient.srdo import SRDODBusClient, SRDOId
+import tracing
+from tracing import Tracer
 
-from smcdbusclient.can_open import CANOpenDBusClient
+import verification
 
-# global
-nmt_client = None
-pds_client = None
-safe_motion_client = None
-velocity_mode_client = None
-srdo_client = None
-communication_client = None
+from journal import Journal
 
-# Helpers
+# Module and class of every D-Bus client, imported and created on first use
+CLIENTS = {
+    "nmt_client": ("smcdbusclient.nmt", "NMTDBusClient"),
+    "pds_client": ("smcdbusclient.pds", "PDSDBusClient"),
+    "safe_motion_client": ("smcdbusclient.safe_motion", "SafeMotionDBusClient"),
+    "velocity_mode_client": ("smcdbusclient.velocity_mode", "VelocityModeDBusClient"),
+    "srdo_client": ("smcdbusclient.srdo", "SRDODBusClient"),
+    "communication_client": ("smcdbusclient.communication", "CommunicationDBusClient"),
+    "can_open_client": ("smcdbusclient.can_open", "CANOpenDBusClient"),
+    "manufacturer_client": ("smcdbusclient.manufacturer", "ManufacturerDBusClient"),
+}
 
+# Serial number of the identity object, as the argument of the getValue* methods
+IDENTITY_SERIAL_NUMBER = 0x1018_04_00
 
-def check(msg: str, error: int):
-    if error == 1:  # ERROR_NONE
-        print(f"{msg} : {Fore.GREEN}OK{Style.RESET_ALL}")
+# Clients of the process, by (instance ID, client name)
+_clients: Dict[Tuple[str, str], Any] = {}
+_clients_lock = threading.Lock()
+
+
+def dbus_client(instance_id: str, name: str):
+    """D-Bus client `name` of an instance, shared by every SWDClients of the process."""
+
+    key = (instance_id, name)
+    with _clients_lock:
+        if key in _clients:
+            return _clients[key]
+
+    if backend.name() == "replay":
+        client = recording.default_replay().client(instance_id, name[: -len("_client")])
     else:
-        print(f"{msg} : {Fore.RED}Failed{Style.RESET_ALL}")
+        module, cls = CLIENTS[name]
+        client = getattr(importlib.import_module(module), cls)(instance_id)
+
+    with _clients_lock:
+        return _clients.setdefault(key, client)
 
-        # Exit
-        print("\nCommissioning failed !")
-        sys.exit(1)
 
+class CommissioningError(Exception):
+    """Raised by check() when a D-Bus call failed or returned an unexpected value."""
 
-def list_to_swm(l: List[SafetyFunctionId]):
-    ret = SafetyWordMapping()
-    for i in range(0, len(l)):
-        setattr(ret, "safety_function_" + str(i), l[i])
-    return ret
 
+class SWDClients:
+    """D-Bus clients and commissioning state of one SWD instance.
 
-# Updaters
+    The clients (`nmt_client`, `pds_client`, ... see CLIENTS) are created on first use.
+    """
 
+    def __init__(self, instance_id: str, incremental: bool = False, tracer: Optional[Tracer] = None, recorder: Optional[Recorder] = None):
+        self.instance_id = instance_id
 
-def update_network_parameters(node_id: int):
+        # Record every call with its result, by default when SWD_RECORD is set
+        self.recorder = recorder or recording.default_recorder()
 
-    network = NetworkParameters()
+        # Record a span for every call, by default when SWD_TRACE is set
+        self.tracer = tracer or tracing.default_tracer()
 
-    network.node_id = node_id
-    network.bit_timing = BitTiming.BT_1000
-    network.rt_activated = True
+        # Incremental mode: read the current value of every object, and only write
+        # the ones that differ from the target configuration
+        self.incremental = incremental
 
-    error = communication_client.setNetworkParameters(network)
-    check(f"setNetworkParameters(node_id={node_id})", error)
+        # Number of parameter writes issued since the clients were created
+        self.writes = 0
 
+        # Storage blocks (BlocId names) modified and not stored yet
+        self.dirty: Set[str] = set()
 
-def update_communication_parameters(node_id: int):
+        # Objects written, in order, see rollback()
+        self.written: List[Operation] = []
 
-    params = PDOCommunicationParameters()
-    mapping = PDOMappingParameters()
+        # Cumulated duration of the commissioning phases, by name, see timed()
+        self.timings: Dict[str, float] = {}
 
-    params.cob_id.can_id = 0x180 + node_id  # 0x180 + $NODE_ID
-    params.cob_id.valid = True
-    params.cob_id.flag = True
-    params.transmission_type = PDOTransmissionType.PDO_SYNC_1
+        # Reader of the objects with SDOs on the CAN bus, for the checks, see sdo.SDONode
+        self.sdo = None
 
-    # Set the COB ID of the TPDO_1
-    params.cob_id.can_id = 0x180 + node_id  # 0x180 + $NODE_ID
-    error = communication_client.setTPDOCommunicationParameters(PDOId.PDO_1, params)
-    check("setTPDOCommunicationParameters(PDOId.PDO_1)", error)
+    def __getattr__(self, name: str):
+        if name not in CLIENTS:
+            raise AttributeError(name)
 
-    params.cob_id.valid = False
+        client = dbus_client(self.instance_id, name)
+        if self.recorder is not None:
+            client = self.recorder.wrap(client, name[: -len("_client")], self.instance_id)
+        if self.tracer is not None:
+            client = self.tracer.wrap(client, name[: -len("_client")], self.instance_id)
 
-    # Set the COB ID of the TPDO_2
-    params.cob_id.can_id = 0x280 + node_id  # 0x280 + $NODE_ID
-    error = communication_client.setTPDOCommunicationParameters(PDOId.PDO_2, params)
-    check("setTPDOCommunicationParameters(PDOId.PDO_2)", error)
+        setattr(self, name, client)
+        return client
 
-    params.cob_id.valid = True
+    def write(self, msg: str, setter, *args):
+        error = setter(*args)
+        check(msg, error)
+        self.writes += 1
 
-    # Set the COB ID of the TPDO_3
-    params.cob_id.can_id = 0x380 + node_id  # 0x380 + $NODE_ID
-    error = communication_client.setTPDOCommunicationParameters(PDOId.PDO_3, params)
-    check("setTPDOCommunicationParameters(PDOId.PDO_3)", error)
 
-    # Set the COB ID of the TPDO_4
-    params.cob_id.can_id = 0x480 + node_id  # 0x480 + $NODE_ID
-    error = communication_client.setTPDOCommunicationParameters(PDOId.PDO_4, params)
-    check("setTPDOCommunicationParameters(PDOId.PDO_4)", error)
+# Helpers
 
-    params.cob_id.valid = True
 
-    # Set the COB ID of the RPDO_1
-    params.cob_id.can_id = 0x200 + node_id  # 0x200 + $NODE_ID
-    error = communication_client.setRPDOCommunicationParameters(PDOId.PDO_1, params)
-    check("setRPDOCommunicationParameters(PDOId.PDO_1)", error)
+def check(msg: str, error: int, fatal: bool = True):
+    # Prefix messages with the instance when motors are commissioned concurrently
+    thread = threading.current_thread()
+    if thread is not threading.main_thread():
+        msg = f"[{thread.name}] {msg}"
 
-    params.cob_id.valid = False
+    from colorama import Fore, Style
 
-    # Set the COB ID of the RPDO_2
-    params.cob_id.can_id = 0x300 + node_id  # 0x300 + $NODE_ID
-    error = communication_client.setRPDOCommunicationParameters(PDOId.PDO_2, params)
-    check("setRPDOCommunicationParameters(PDOId.PDO_2)", error)
+    if error == 1:  # ERROR_NONE
+        print(f"{msg} : {Fore.GREEN}OK{Style.RESET_ALL}")
+    else:
+        print(f"{msg} : {Fore.RED}Failed{Style.RESET_ALL}")
 
-    # Set the COB ID of the RPDO_3
-    params.cob_id.can_id = 0x400 + node_id  # 0x400 + $NODE_ID
-    error = communication_client.setRPDOCommunicationParameters(PDOId.PDO_3, params)
-    check("setRPDOCommunicationParameters(PDOId.PDO_3)", error)
+        if fatal:
+            raise CommissioningError(msg)
 
-    params.cob_id.valid = True
 
-    # Set the COB ID of the RPDO_4
-    params.cob_id.can_id = 0x500 + node_id  # 0x500 + $NODE_ID
-    error = communication_client.setRPDOCommunicationParameters(PDOId.PDO_4, params)
-    check("setRPDOCommunicationParameters(PDOId.PDO_4)", error)
+@contextmanager
+def timed(swd: SWDClients, name: str) -> Iterator[None]:
+    """Add the duration of the block to the `name` phase of `swd.timings`, and to the trace."""
 
-    # TPDO1 communication mapping
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        swd.timings[name] = swd.timings.get(name, 0.0) + duration
+        if swd.tracer is not None:
+            swd.tracer.phase(swd.instance_id, name, start, duration)
 
-    # - safety_controlword_safein_1
 
-    mapping.nb = 1
-    mapping.items.clear()
-    mapping.items.append(0x2620_02_08)
+def wait_nmt_state(
+    swd: SWDClients,
+    states: Optional[Sequence[Any]] = None,
+    timeout: float = 5.0,
+    settle: float = 0.1,
+) -> float:
+    """Wait until the node reports one of `states` after a reset, return the elapsed time.
 
-    communication_client.setTPDOMappingParameters(PDOId.PDO_1, mapping)
-    check("setTPDOMappingParameters(PDOId.PDO_1)", error)
+    The NMT state is polled with an increasing period, starting at 10ms to catch fast
+    boots and growing up to 200ms to keep the load low on slow ones. A state read
+    before the node was seen rebooting (D-Bus error or BOOT_UP) is only trusted once
+    `settle` seconds elapsed, so the state preceding the reset is not taken for the
+    new one. Returns -1 if the node did not come back within `timeout` seconds.
+    """
 
-    # TPDO3 communication mapping
+    from smcdbusclient.nmt import NMTState
 
-    # - statusword
-    # - position_value or hall_encoder
+    if states is None:
+        states = (NMTState.PRE_OPERATIONAL, NMTState.OPERATIONAL)
 
-    mapping.nb = 2
-    mapping.items.clear()
-    mapping.items.append(0x6041_00_10)
-    mapping.items.append(0x6064_00_20)  # position_value
-    # mapping.items.append(0x2305_06_20)  # hall_encoder
+    start = time.monotonic()
+    period = 0.01
+    rebooted = False
 
-    communication_client.setTPDOMappingParameters(PDOId.PDO_3, mapping)
-    check("setTPDOMappingParameters(PDOId.PDO_3)", error)
+    while True:
+        elapsed = time.monotonic() - start
 
+        state, error = swd.nmt_client.getNMTState()
+        if error != 1 or state == NMTState.BOOT_UP:
+            rebooted = True
+        elif state in states and (rebooted or elapsed >= settle):
+            return elapsed
 
-def update_polarity_parameters(polarity: bool):
+        if elapsed >= timeout:
+            return -1
 
-    params = PolarityParameters()
-    params.velocity_polarity = polarity
-    params.position_polarity = polarity
+        time.sleep(min(period, max(timeout - elapsed, 0)))
+        period = min(period * 2, 0.2)
 
-    error = pds_client.setPolarityParameters(params)
-    check(f"setPolarityParameters({polarity})", error)
 
+def reset_node(swd: SWDClients, msg: str, timeout: float = 5.0):
+    """Reset the node and wait until it is back to PRE_OPERATIONAL or OPERATIONAL."""
 
-def disable_SRDO_parameters():
+    from smcdbusclient.nmt import NMTCommand
 
-    # Modify every SRDO
-    for srdo in SRDOId:
-        (
-            _,
-            params,
-            _,
-            error,
-        ) = srdo_client.getSRDOParameters(srdo)
-        check(f"getSRDOParameters({srdo.name})", error)
+    error = swd.nmt_client.setNMTState(NMTCommand.RESET_NODE)
+    check(msg, error)
 
-        params.valid = False
+    elapsed = wait_nmt_state(swd, timeout=timeout)
+    if elapsed < 0:
+        check(f"wait_nmt_state(timeout={timeout}s)", 0)
+    check(f"wait_nmt_state() in {elapsed:.3f}s", 1)
 
-        error = srdo_client.setSRDOParameters(srdo, params)
-        check(f"setSRDOParameters({srdo.name})", error)
 
-    error = srdo_client.setSRDOConfigurationValidity()
-    check("setSRDOConfigurationValidity()", error)
+def read_serial_number(swd: SWDClients) -> Optional[int]:
+    """Serial number of the motor, from its identity object, None if it can not be read."""
 
+    value, error = swd.can_open_client.getValueUInt32(IDENTITY_SERIAL_NUMBER)
+    check("getValueUInt32(0x1018_04_00)", error, fatal=False)
+    return value if error == 1 else None
 
-def update_ramps(vl_acc_delta_speed, vl_dec_delta_speed):
-    params, error = velocity_mode_client.getVelocityModeParameters()
-    check("getVelocityModeParameters()", error)
 
-    params.vl_velocity_acceleration_delta_speed = vl_acc_delta_speed
-    params.vl_velocity_deceleration_delta_speed = vl_dec_delta_speed
+# Plan execution
 
-    error = velocity_mode_client.setVelocityModeParameters(params)
-    check("setVelocityParameters()", error)
 
+def apply_step(swd: SWDClients, step: Step, snapshot: Optional[Snapshot] = None) -> bool:
+    """Write the objects of a step, return True if any object was written.
 
-def update_STO_parameters(status):
-    params, signature, error = safe_motion_client.getSTOParameters(STOId.STO_1)
-    check("getSTOParameters(STOId.STO_1)", error)
+    In incremental mode, every object is read, from `snapshot` if given, and only
+    the ones that differ from the plan are written. When none differs, the
+    `on_write` call of the step is still made if its `state` is not in effect, e.g.
+    an SRDO configuration which is not valid.
+    """
 
-    params.restart_acknowledge_behavior = status
+    written = False
 
-    error = safe_motion_client.setSTOParameters(STOId.STO_1, params)
-    check("setSTOParameters(STOId.STO_1)", error)
+    for operation in step.operations:
+        if operation.setter is None:
+            continue
 
+        current = None
+        if swd.incremental or operation.read_before_write:
+            if snapshot is not None and operation in snapshot:
+                # The snapshot keeps the value read, e.g. for rollback()
+                current, error = snapshot.read(operation)
+                current = copy.deepcopy(current)
+            else:
+                current, error = operation.read(swd)
+            check(operation.call_name(operation.getter), error)
 
-def update_SLS_parameters(vl_limit, vl_time_monitoring):
-    params, signature, error = safe_motion_client.getSLSParameters(SLSId.SLS_1)
-    check("getLSParameters(SLSId.SLS_1)", error)
+            if swd.incremental and operation.matches(current):
+                continue
 
-    params.velocity_limit_u32 = vl_limit
-    params.time_to_velocity_monitoring = vl_time_monitoring
-    params.time_for_velocity_in_limits = vl_time_monitoring
+        # Recorded before the write, a rejected write may still have modified the object
+        if operation not in swd.written:
+            swd.written.append(operation)
+        swd.write(operation.call_name(operation.setter), operation.write, swd, operation.target(current))
+        swd.dirty.add(operation.bloc)
+        written = True
 
-    error = safe_motion_client.setSLSParameters(SLSId.SLS_1, params)
-    check("setSLSParameters(SLSId.SLS_1)", error)
+    if written and step.on_write is not None:
+        client, method, bloc = step.on_write
+        error = getattr(getattr(swd, client), method)()
+        check(f"{method}()", error)
+        swd.dirty.add(bloc)
 
+    elif swd.incremental and step.on_write is not None and step.state is not None:
+        if snapshot is not None and step.state in snapshot:
+            state, error = snapshot.read(step.state)
+        else:
+            state, error = step.state.read(swd)
+        check(step.state.call_name(step.state.getter), error)
 
-def update_error_behavior():
-    error = can_open_client.setValueUInt8(0x1029_02_00, 1)  # error_behavior_syserr_for_error => 1 (no change of the NMT state)
-    check("update_error_behavior()", error)
+        if not step.state.matches(state):
+            client, method, bloc = step.on_write
+            swd.write(f"{method}()", getattr(getattr(swd, client), method))
+            swd.dirty.add(bloc)
+            written = True
+
+    return written
+
+
+def store_parameters(swd: SWDClients):
+    """Store the blocks modified since the last store, one block at a time.
+
+    A block unknown to smcdbusclient is stored with BlocId.ALL.
+    """
+
+    from smcdbusclient.communication import BlocId
+
+    blocs = sorted({BlocId[name] if name in BlocId.__members__ else BlocId.ALL for name in swd.dirty}, key=lambda bloc: bloc.name)
+    if BlocId.ALL in blocs:
+        blocs = [BlocId.ALL]
+
+    for bloc in blocs:
+        start = time.perf_counter()
+        with timed(swd, f"storeParameters({bloc.name})"):
+            error = swd.communication_client.storeParameters(bloc)
+        check(f"storeParameters({bloc.name}) in {time.perf_counter() - start:.3f}s", error)
+
+    swd.dirty.clear()
+
+
+def rollback(swd: SWDClients, snapshot: Snapshot, plan: Plan):
+    """Write back the objects written since the clients were created, to their value in `snapshot`.
+
+    Only the objects actually written are restored, in reverse order. Then the
+    `on_write` call of their steps is made again if their `state` was in effect in
+    `snapshot`, e.g. the SRDO configuration validity, cleared by the motor when an
+    SRDO is written. Failures are reported but do not stop the rollback.
+    """
+
+    for operation in reversed(swd.written):
+        value, error = snapshot.read(operation)
+        if error == 1:
+            error = operation.write(swd, value)
+        check(f"rollback {operation.call_name(operation.setter)}", error, fatal=False)
+
+    restored = {operation.step for operation in swd.written}
+    for step in plan.steps:
+        if step.name not in restored or step.on_write is None or step.state is None or step.state not in snapshot:
+            continue
+        value, error = snapshot.read(step.state)
+        if error != 1 or not step.state.matches(value):
+            continue
+        client, method, bloc = step.on_write
+        error = getattr(getattr(swd, client), method)()
+        check(f"rollback {method}()", error, fatal=False)
+
+    swd.written = []
+
+
+def resume_steps(swd: SWDClients, plan: Plan, journal: Journal) -> Set[str]:
+    """Verify the steps applied before an interruption, return the names of the ones still applied.
+
+    Their blocks are stored again, as the interruption may have happened before the store.
+    """
+
+    steps = [step for step in plan.steps if step.name in journal.steps]
+    operations = [operation for step in steps for operation in step.operations if operation.setter is not None]
+    with timed(swd, "verify journal"):
+        snapshot = read_snapshot(swd, operations)
+
+    applied = set()
+    for step in steps:
+        step_operations = [operation for operation in step.operations if operation.setter is not None]
+        mismatches = [mismatch for operation in step_operations for mismatch in verification.verify_operation(snapshot, operation)]
+        check(f"verify {step.name} parameters", 0 if mismatches else 1, fatal=False)
+        if mismatches:
+            continue
+
+        applied.add(step.name)
+        swd.dirty.update(operation.bloc for operation in step_operations)
+        if step.on_write is not None:
+            swd.dirty.add(step.on_write[2])
+
+    return applied
+
+
+def commission(
+    swd: SWDClients,
+    plan: Plan,
+    sync: Optional[Callable[[], None]] = None,
+    snapshot: Optional[Snapshot] = None,
+    transaction: bool = False,
+    bulk: bool = False,
+    workers: Optional[int] = None,
+) -> bool:
+    """Commission the motor with `plan`, return False if it was already commissioned.
+
+    `sync` is called once the parameters are stored, right before the final reset,
+    so that both motors of the SRDO pair can be reset together. In incremental mode,
+    the current state of the motor is taken from `snapshot` when given.
+
+    A full commissioning records its progress in a journal: when interrupted, the
+    next commissioning skips the factory restore, verifies the steps already
+    applied and continues from the first step not applied.
+
+    In transaction mode, which requires the incremental mode, the written objects
+    are read back and verified before being stored. If a write or the verification
+    fails, the written objects are restored to their value in the snapshot, and
+    CommissioningError is raised: neither the factory parameters are restored nor
+    the motor reset, and nothing is stored.
+
+    With `bulk`, which excludes the transaction mode, the objects with a standard
+    CANopen layout are downloaded from the DCF of the plan through the CANopen
+    service, `workers` objects at a time (default: dcf.WORKERS), and the other ones
+    written by their services, see dcf.py. In incremental mode, only the entries
+    which differ from the snapshot are downloaded.
+    """
+
+    if transaction and not swd.incremental:
+        raise ValueError("transaction mode requires the incremental mode")
+    if bulk and transaction:
+        raise ValueError("bulk download can not be rolled back")
+
+    entries = None
+    full_plan = plan
+    if bulk:
+        import dcf
+
+        entries, plan = dcf.split_plan(plan)
+
+    from smcdbusclient.communication import BlocId
+
+    journal = None
+    applied: Set[str] = set()
+
+    if not swd.incremental:
+        serial_number = read_serial_number(swd)
+        journal = Journal.load(swd.instance_id, plan.hash, serial_number)
+
+        if journal is None:
+            # Restore factory parameters
+            with timed(swd, "restoreDefaultParameters"):
+                error = swd.communication_client.restoreDefaultParameters(BlocId.ALL)
+            check("Restore factory parameters", 1)  # error)
+
+            # Reset to apply parameters
+            with timed(swd, "reset after restore"):
+                reset_node(swd, "Reset to apply parameters")
+
+            journal = Journal(swd.instance_id, plan.hash, serial_number)
+            journal.save()
+        else:
+            print(f"Resuming interrupted commissioning, {len(journal.steps)} step(s) applied")
+            applied = resume_steps(swd, plan, journal)
+
+    # Read the current state of the motor once, with the state of the steps, see apply_step() and rollback()
+    states = plan.states
+    if not swd.incremental:
+        snapshot = None
+    elif snapshot is None:
+        with timed(swd, "snapshot"):
+            snapshot = read_snapshot(swd, [operation for operation in full_plan.operations if operation.setter is not None] + states)
+    elif any(state not in snapshot for state in states):
+        with timed(swd, "snapshot"):
+            snapshot = Snapshot(snapshot.instance_id, {**snapshot.results, **read_snapshot(swd, [state for state in states if state not in snapshot]).results})
+
+    if entries is not None:
+        with timed(swd, "bulk download"):
+            dcf.download(swd, entries, workers or dcf.WORKERS, dcf.current_values(snapshot, full_plan) if snapshot is not None else None)
+
+    try:
+        for step in plan.steps:
+            if step.name in applied:
+                continue
+            with timed(swd, f"step {step.name}"):
+                apply_step(swd, step, snapshot)
+            if journal is not None:
+                journal.step_done(step.name)
+
+        if transaction and swd.written:
+            with timed(swd, "verify"):
+                written = read_snapshot(swd, swd.written)
+            mismatches = [mismatch for operation in swd.written for mismatch in verification.verify_operation(written, operation)]
+            for mismatch in mismatches:
+                print(f"  {mismatch}")
+            check("Verify written parameters", 0 if mismatches else 1)
+    except CommissioningError:
+        if transaction:
+            with timed(swd, "rollback"):
+                rollback(swd, snapshot, plan)
+        raise
+
+    # Save modified parameters
+    store_parameters(swd)
+
+    if sync is not None:
+        sync()
+
+    if swd.writes == 0 and journal is None:
+        # Nothing was modified, no need to reset
+        return False
+
+    # Reset to apply parameters
+    with timed(swd, "reset"):
+        reset_node(swd, "setNMTState")
+
+    if journal is not None:
+        journal.remove()
+
+    return True
 
 
 # Init
-def create_dbus_clients(instance_id: str):
+def load_dbus_session():
     import os
-    from pathlib import Path
-
-    global nmt_client
-    global pds_client
-    global safe_motion_client
-    global velocity_mode_client
-    global srdo_client
-    global communication_client
-    global can_open_client
 
     # Load specific dbus user session if exists
     if os.path.isfile("/tmp/SYSTEMCTL_dbus.id"):
@@ -241,12 +494,12 @@ def create_dbus_clients(instance_id: str):
         env = dict(line.strip().split("=", 1) for line in lines)
         os.environ.update(env)
 
-    nmt_client = NMTDBusClient(instance_id)
-    pds_client = PDSDBusClient(instance_id)
-    safe_motion_client = SafeMotionDBusClient(instance_id)
-    velocity_mode_client = VelocityModeDBusClient(instance_id)
-    srdo_client = SRDODBusClient(instance_id)
-    communication_client = CommunicationDBusClient(instance_id)
-    can_open_client = CANOpenDBusClient(instance_id)
+
+def create_dbus_clients(instance_id: str, incremental: bool = False) -> SWDClients:
+    load_dbus_session()
+
+    swd = SWDClients(instance_id, incremental)
 
     check(f"create_dbus_clients({instance_id})", 1)
+
+    return swd
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Device configuration file (DCF) of a profile, and its bulk download.
+
+The objects of the profile with a standard CANopen layout (PDO communication and
+mapping parameters, polarity, velocity ramps and the raw "od" entries) are
+exported as a DCF (CiA 306), which other CANopen tools can also download. The
+safety objects (SRDOs, safety control word mappings, STO, SLS) and the
+manufacturer objects keep being written by their D-Bus services.
+
+The bulk download writes every entry of a DCF with the setValue* methods of the
+CANopen service. The entries of one object are written in order, following the
+CANopen sequence for the PDOs (invalidate, clear the mapping, map, validate),
+while independent objects are written `workers` at a time, the download stopping
+at the first failure. When the current values of the entries are known, e.g. for
+an incremental commissioning, the entries which already hold their value are
+skipped, and only the PDOs whose mapping differs are remapped:
+
+    python3 dcf.py export left swd_left_4.dcf
+    python3 dcf.py download left swd_left_4.dcf
+"""
+
+import argparse
+import configparser
+import datetime
+import os
+import re
+import sys
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+import commissioning
+
+import profiles
+from profiles import Plan, Step
+
+# Default number of objects written concurrently by a bulk download
+WORKERS = 4
+
+# CANopen data type of every setValue type
+DATA_TYPES = {"Int8": 0x0002, "Int16": 0x0003, "Int32": 0x0004, "UInt8": 0x0005, "UInt16": 0x0006, "UInt32": 0x0007}
+
+# Objects every CANopen device implements
+MANDATORY_OBJECTS = [0x1000, 0x1001, 0x1018]
+
+# Flags of the COB-ID of a PDO
+COB_ID_INVALID = 1 << 31
+COB_ID_NO_RTR = 1 << 30
+
+# Object of the communication parameters of the first PDO, and offset of its mapping
+PDO_COMMUNICATION = {"RPDO": 0x1400, "TPDO": 0x1800}
+PDO_MAPPING_OFFSET = 0x200
+
+POLARITY = 0x607E
+VL_VELOCITY_ACCELERATION = 0x6048
+VL_VELOCITY_DECELERATION = 0x6049
+
+
+class Entry:
+    """Entry of the object dictionary, with its value."""
+
+    def __init__(self, index: int, subindex: int, kind: str, value: int, name: str):
+        self.index = index
+        self.subindex = subindex
+        self.kind = kind
+        self.value = value
+        self.name = name
+
+    @property
+    def od_index(self) -> int:
+        """Entry as 0xIIII_SS_00, the argument of the setValue* methods, as in the "od" section of the profiles."""
+        return self.index << 16 | self.subindex << 8
+
+    def __str__(self) -> str:
+        return f"{profiles.format_arg(self.od_index)} = 0x{self.value & 0xFFFFFFFF:X}"
+
+
+def operation_entries(operation: profiles.Operation, value=None) -> Optional[List[Entry]]:
+    """Entries written by an operation, or None if the object has no standard layout.
+
+    With the `value` of the object read from the motor, the entries hold its current
+    values instead of the target ones.
+    """
+
+    if operation.setter is None:
+        return None
+
+    fields = operation.expected
+    if value is not None and operation.kind == "fields":
+        fields = {path: profiles.get_field(value, path) for path in operation.expected}
+
+    for direction, first in PDO_COMMUNICATION.items():
+        if operation.getter == f"get{direction}CommunicationParameters":
+            index = first + operation.args[0].value
+            cob_id = fields["cob_id.can_id"] | (0 if fields["cob_id.valid"] else COB_ID_INVALID) | (COB_ID_NO_RTR if fields["cob_id.flag"] else 0)
+            return [
+                Entry(index, 1, "UInt32", cob_id, f"{direction}{operation.args[0].value + 1} communication COB-ID"),
+                Entry(index, 2, "UInt8", fields["transmission_type"].value, f"{direction}{operation.args[0].value + 1} communication transmission type"),
+            ]
+
+        if operation.getter == f"get{direction}MappingParameters":
+            index = first + PDO_MAPPING_OFFSET + operation.args[0].value
+            name = f"{direction}{operation.args[0].value + 1} mapping"
+            items = operation.expected if value is None else list(value.items)[: value.nb]
+            entries = [Entry(index, 0, "UInt8", len(items), f"{name} number of entries")]
+            entries += [Entry(index, sub, "UInt32", item, f"{name} entry {sub}") for sub, item in enumerate(items, 1)]
+            return entries
+
+    if operation.getter == "getPolarityParameters":
+        polarity = operation.target() if value is None else value
+        return [Entry(POLARITY, 0, "UInt8", (0x80 if polarity.position_polarity else 0) | (0x40 if polarity.velocity_polarity else 0), "Polarity")]
+
+    if operation.getter == "getVelocityModeParameters":
+        entries = []
+        for field, index, name in [
+            ("vl_velocity_acceleration_delta_speed", VL_VELOCITY_ACCELERATION, "vl velocity acceleration delta speed"),
+            ("vl_velocity_deceleration_delta_speed", VL_VELOCITY_DECELERATION, "vl velocity deceleration delta speed"),
+        ]:
+            if field in fields:
+                entries.append(Entry(index, 1, "UInt32", fields[field], name))
+        return entries
+
+    if operation.kind == "value":
+        od_index = operation.args[0]
+        return [Entry(od_index >> 16, (od_index >> 8) & 0xFF, operation.getter[len("getValue") :], operation.expected if value is None else value, profiles.format_arg(od_index))]
+
+    return None
+
+
+def current_values(snapshot, plan: Plan) -> Dict[Tuple[int, int], int]:
+    """Current value of the entries of the standard objects of the plan read in `snapshot`, by (index, subindex)."""
+
+    values = {}
+    for operation in plan.operations:
+        if operation not in snapshot:
+            continue
+        value, error = snapshot.read(operation)
+        entries = operation_entries(operation, value) if error == 1 else None
+        for entry in entries or []:
+            values[(entry.index, entry.subindex)] = entry.value
+    return values
+
+
+def split_plan(plan: Plan) -> Tuple[List[Entry], Plan]:
+    """Entries of the standard objects of the plan, and the plan of the other objects."""
+
+    entries = []
+    covered: Set[str] = set()
+    for operation in plan.operations:
+        written = operation_entries(operation)
+        if written is not None:
+            entries += written
+            covered.add(operation.name)
+
+    steps = []
+    for step in plan.steps:
+        operations = [operation for operation in step.operations if operation.name not in covered]
+        if operations:
+            steps.append(Step(step.name, operations, step.on_write, step.state))
+
+    return entries, Plan(plan.name, plan.hash, plan.instance_id, plan.node_id, steps)
+
+
+# =======================
+#          DCF
+# =======================
+
+
+def write_dcf(path: str, entries: List[Entry], plan: Plan, bitrate: Optional[int] = None):
+    """Write the entries as a DCF, for the node of `plan`."""
+
+    dcf = configparser.ConfigParser()
+    dcf.optionxform = str
+
+    now = datetime.datetime.now()
+    dcf["FileInfo"] = {
+        "FileName": os.path.basename(path),
+        "FileVersion": "1",
+        "FileRevision": "0",
+        "Description": f"Configuration of {plan.name}",
+        "CreationDate": now.strftime("%m-%d-%Y"),
+        "CreationTime": now.strftime("%I:%M%p"),
+        "CreatedBy": "ez-Wheel commissioning",
+    }
+    dcf["DeviceInfo"] = {"VendorName": "ez-Wheel", "ProductName": "SWD"}
+    dcf["DeviceComissioning"] = {"NodeID": f"0x{plan.node_id:02X}", "NodeName": plan.name}
+    if bitrate is not None:
+        dcf["DeviceComissioning"]["Baudrate"] = str(bitrate)
+
+    objects: Dict[int, List[Entry]] = {}
+    for entry in entries:
+        objects.setdefault(entry.index, []).append(entry)
+
+    # Objects listed per category, as CiA 306 expects
+    categories: Dict[str, List[int]] = {"MandatoryObjects": [], "OptionalObjects": [], "ManufacturerObjects": []}
+    for index in sorted(objects):
+        if index in MANDATORY_OBJECTS:
+            categories["MandatoryObjects"].append(index)
+        elif 0x2000 <= index <= 0x5FFF:
+            categories["ManufacturerObjects"].append(index)
+        else:
+            categories["OptionalObjects"].append(index)
+    for category, indexes in categories.items():
+        dcf[category] = {"SupportedObjects": str(len(indexes)), **{str(i): f"0x{index:04X}" for i, index in enumerate(indexes, 1)}}
+
+    for index, object_entries in sorted(objects.items()):
+        if len(object_entries) == 1 and object_entries[0].subindex == 0:
+            dcf[f"{index:04X}"] = entry_section(object_entries[0])
+            continue
+
+        # The object is named after the words shared by its entries
+        name = " ".join(os.path.commonprefix([entry.name.split() for entry in object_entries])) or object_entries[0].name
+        dcf[f"{index:04X}"] = {"ParameterName": name, "ObjectType": "0x9", "SubNumber": str(len(object_entries))}
+        for entry in object_entries:
+            dcf[f"{index:04X}sub{entry.subindex:X}"] = entry_section(entry)
+
+    with open(path, "w") as f:
+        dcf.write(f, space_around_delimiters=False)
+
+
+def entry_section(entry: Entry) -> Dict[str, str]:
+    return {
+        "ParameterName": entry.name,
+        "ObjectType": "0x7",
+        "DataType": f"0x{DATA_TYPES[entry.kind]:04X}",
+        "AccessType": "rw",
+        "PDOMapping": "0",
+        "ParameterValue": f"0x{entry.value & 0xFFFFFFFF:X}" if entry.value >= 0 else str(entry.value),
+    }
+
+
+def read_dcf(path: str, node_id: int) -> List[Entry]:
+    """Entries of a DCF with a ParameterValue, `node_id` replacing $NODEID."""
+
+    dcf = configparser.ConfigParser()
+    dcf.optionxform = str
+    dcf.read(path)
+
+    kinds = {data_type: kind for kind, data_type in DATA_TYPES.items()}
+    entries = []
+    for name in dcf.sections():
+        match = re.fullmatch(r"([0-9A-Fa-f]{4})(?:sub([0-9A-Fa-f]+))?", name)
+        section = dcf[name]
+        if match is None or "ParameterValue" not in section:
+            continue
+
+        data_type = int(section.get("DataType", "0"), 0)
+        if data_type not in kinds:
+            raise profiles.ProfileError(f"{path}: [{name}] unsupported DataType {section.get('DataType')}")
+        value = profiles.parse_int(section["ParameterValue"].replace("$NODEID", "$NODE_ID"), node_id)
+        if kinds[data_type].startswith("Int") and value >= 1 << (int(kinds[data_type][3:]) - 1):
+            value -= 1 << int(kinds[data_type][3:])
+        entries.append(Entry(int(match.group(1), 16), int(match.group(2) or "0", 16), kinds[data_type], value, section.get("ParameterName", name)))
+
+    return entries
+
+
+# =======================
+#     BULK DOWNLOAD
+# =======================
+
+
+def download_sequence(entries: List[Entry], current: Optional[Dict[Tuple[int, int], int]] = None) -> List[List[Entry]]:
+    """Group the entries into ordered sequences of writes, independent of each other.
+
+    The COB-ID of a valid PDO can not change, and its mapping can not be written:
+    the PDO is invalidated, its mapping cleared, the objects mapped, then the
+    number of mapped objects, the other communication parameters and the COB-ID
+    written. With the `current` values of the entries, by (index, subindex), the
+    entries which already hold their value are skipped: a PDO is only invalidated
+    when its COB-ID or its mapping differs, and only remapped when its mapping
+    differs, without invalidating it or clearing its mapping again when it already is.
+    """
+
+    def changed(entry: Entry) -> bool:
+        return current is None or current.get((entry.index, entry.subindex)) != entry.value
+
+    objects: Dict[int, List[Entry]] = {}
+    for entry in entries:
+        objects.setdefault(entry.index, []).append(entry)
+
+    sequences = []
+    for index in sorted(objects):
+        if any(first + PDO_MAPPING_OFFSET <= index < first + PDO_MAPPING_OFFSET + 0x200 for first in PDO_COMMUNICATION.values()):
+            # Written with its communication parameters
+            continue
+
+        sequence = sorted(objects[index], key=lambda entry: entry.subindex)
+        if any(first <= index < first + 0x200 for first in PDO_COMMUNICATION.values()):
+            mapping = objects.get(index + PDO_MAPPING_OFFSET, [])
+            remapped = any(changed(entry) for entry in mapping)
+            cob_id = next((entry for entry in sequence if entry.subindex == 1), None)
+            count = next((entry for entry in mapping if entry.subindex == 0), None)
+            if cob_id is None and current is not None and (index, 1) in current:
+                # COB-ID out of the entries, written back as it is once invalidated
+                cob_id = Entry(index, 1, "UInt32", current[(index, 1)], "COB-ID")
+
+            prefix = []
+            invalid = current is not None and current.get((index, 1), 0) & COB_ID_INVALID
+            if cob_id is not None and (remapped or changed(cob_id)) and not invalid:
+                prefix.append(Entry(index, 1, cob_id.kind, cob_id.value | COB_ID_INVALID, cob_id.name))
+
+            items, counts = [], []
+            if remapped:
+                cleared = count is not None and (current is None or current.get((count.index, 0)) != 0)
+                if cleared:
+                    prefix.append(Entry(count.index, 0, count.kind, 0, count.name))
+                items = sorted((entry for entry in mapping if entry.subindex != 0 and changed(entry)), key=lambda entry: entry.subindex)
+                counts = [count] if count is not None and (cleared or changed(count)) else []
+
+            # The COB-ID is written last, validating the PDO again once invalidated
+            others = [entry for entry in sequence if entry is not cob_id and changed(entry)]
+            validate = [cob_id] if cob_id is not None and (changed(cob_id) or prefix) else []
+            sequence = prefix + items + counts + others + validate
+        else:
+            sequence = [entry for entry in sequence if changed(entry)]
+
+        if sequence:
+            sequences.append(sequence)
+
+    return sequences
+
+
+def download(swd, entries: List[Entry], workers: int = WORKERS, current: Optional[Dict[Tuple[int, int], int]] = None):
+    """Write the entries with the setValue* methods of the CANopen service.
+
+    The sequences of download_sequence() are written `workers` at a time. With the
+    `current` values of the entries, only the ones which differ are written. Once a
+    write failed, the sequences in progress are completed but no other one is
+    started, and the CommissioningError of the failure is raised.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    client = swd.can_open_client
+    failed = threading.Event()
+
+    def write(sequence: List[Entry]) -> int:
+        if failed.is_set():
+            return 0
+        try:
+            for entry in sequence:
+                error = getattr(client, f"setValue{entry.kind}")(entry.od_index, entry.value)
+                commissioning.check(f"setValue{entry.kind}({profiles.format_arg(entry.od_index)})", error)
+                swd.dirty.add(profiles.bloc_of(entry.index))
+        except commissioning.CommissioningError:
+            failed.set()
+            raise
+        return len(sequence)
+
+    sequences = download_sequence(entries, current)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=swd.instance_id) as executor:
+        futures = [executor.submit(write, sequence) for sequence in sequences]
+        # The writes are counted by the calling thread
+        for future in futures:
+            try:
+                swd.writes += future.result()
+            except commissioning.CommissioningError:
+                for other in futures:
+                    other.cancel()
+                raise
+
+    commissioning.check(f"download of {sum(len(sequence) for sequence in sequences)} entries", 1)
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export the DCF of a profile, or download a DCF to a motor")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export = subparsers.add_parser("export", help="write the DCF of the standard objects of a profile")
+    export.add_argument("swd_id", choices=["left", "right"], help="swd motor")
+    export.add_argument("path", help="DCF file")
+    export.add_argument("--profile", help="configuration profile of the motor (default: profile of the motor)")
+
+    load = subparsers.add_parser("download", help="write the entries of a DCF to a motor, store them and reset the motor")
+    load.add_argument("swd_id", choices=["left", "right"], help="swd motor")
+    load.add_argument("path", help="DCF file")
+    load.add_argument("--profile", help="configuration profile of the motor (default: profile of the motor)")
+    load.add_argument("--workers", type=int, default=WORKERS, help="number of objects written concurrently (default: %(default)s)")
+
+    args = parser.parse_args(argv)
+
+    plan = profiles.compile_profile(args.profile or profiles.PROFILES[args.swd_id])
+
+    if args.command == "export":
+        entries, _ = split_plan(plan)
+        bitrate = next((int(op.expected["bit_timing"].name[len("BT_") :]) for op in plan.operations if op.getter == "getNetworkParameters" and "bit_timing" in op.expected), None)
+        write_dcf(args.path, entries, plan, bitrate)
+        print(f"{len(entries)} entries written to {args.path}")
+        return
+
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    entries = read_dcf(args.path, plan.node_id)
+    swd = commissioning.create_dbus_clients(plan.instance_id)
+    download(swd, entries, args.workers)
+    commissioning.store_parameters(swd)
+    commissioning.reset_node(swd, "setNMTState")
+
+    print("\nDownload succeeded !")
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except profiles.ProfileError as e:
+        print(f"Invalid profile: {e}")
+        sys.exit(1)
+    except commissioning.CommissioningError:
+        print("\nDownload failed !")
+        sys.exit(1)
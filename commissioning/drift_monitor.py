@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Monitor of the configuration drift of the motors.
+
+The configuration of every motor is checked periodically against its profile. A
+cycle only checks the signatures of the safety parameters (see signatures.py),
+and every `--full-every` cycles, or when the signatures can not be trusted, every
+object is read and compared. The mismatches of the objects that a fast check
+does not read are kept from the last full check. The results are written as Prometheus metrics in the
+text format, e.g. for the textfile collector of node_exporter, and the changes of
+state (drift detected or cleared, failed checks) are written to a rotating log.
+
+    python3 drift_monitor.py --interval 60 --metrics /var/lib/node_exporter/swd_drift.prom
+"""
+
+import argparse
+from contextlib import redirect_stdout
+import io
+import logging
+import logging.handlers
+import os
+import signal
+import sys
+import time
+from typing import Dict, List, Optional
+
+import commissioning
+import check_commissioning
+import profiles
+from profiles import Plan
+
+import signatures
+
+from verification import Mismatch
+
+SIDES = ["left", "right"]
+
+
+class MotorState:
+    """Results of the checks of one motor."""
+
+    def __init__(self, plan: Plan):
+        self.plan = plan
+        self.checks: Dict[str, int] = {"fast": 0, "full": 0}
+        self.errors = 0
+        self.mismatches: Optional[List[str]] = None
+        # Mismatches of the last full check on the objects not read by the fast checks
+        self.unchecked: List[Mismatch] = []
+        self.mode = ""
+        self.duration = 0.0
+        self.timestamp = 0.0
+
+
+def check_motor(state: MotorState, full: bool, workers: Optional[int], log: logging.Logger):
+    """Check the motor once, update its state and log the changes."""
+
+    swd = commissioning.SWDClients(state.plan.instance_id)
+    start = time.perf_counter()
+
+    try:
+        # The messages of every call are only noise here
+        with redirect_stdout(io.StringIO()):
+            mismatches = check_commissioning.check_motor(swd, state.plan, fast=not full, workers=workers)
+    except Exception as e:
+        state.errors += 1
+        log.error("%s: check failed: %s", state.plan.instance_id, e)
+        return
+
+    state.mode = "full" if "check snapshot" in swd.timings else "fast"
+    state.checks[state.mode] += 1
+    state.duration = time.perf_counter() - start
+    state.timestamp = time.time()
+
+    if state.mode == "full":
+        checked = {operation.name for operation in signatures.fast_operations(state.plan)}
+        state.unchecked = [mismatch for mismatch in mismatches if mismatch.operation.name not in checked]
+    else:
+        # Reported in the order of the plan, as by a full check
+        order = {operation.name: i for i, operation in enumerate(state.plan.operations)}
+        mismatches = sorted(mismatches + state.unchecked, key=lambda mismatch: order[mismatch.operation.name])
+
+    current = [str(mismatch) for mismatch in mismatches]
+    if current != state.mismatches:
+        if current:
+            log.warning("%s: %d mismatch(es) (%s check)", state.plan.instance_id, len(current), state.mode)
+            for mismatch in current:
+                log.warning("%s:   %s", state.plan.instance_id, mismatch)
+        else:
+            log.info("%s: configuration matches %s (%s check)", state.plan.instance_id, state.plan.name, state.mode)
+    state.mismatches = current
+
+
+def metrics(states: List[MotorState]) -> str:
+    """Prometheus text format of the states."""
+
+    families = [
+        ("swd_config_drift", "gauge", "1 if the configuration of the motor differs from its profile", lambda state: [("", int(bool(state.mismatches)))]),
+        ("swd_config_mismatches", "gauge", "Number of fields which differ from the profile", lambda state: [("", len(state.mismatches))]),
+        ("swd_config_check_duration_seconds", "gauge", "Duration of the last check", lambda state: [(f',mode="{state.mode}"', state.duration)]),
+        ("swd_config_last_check_timestamp_seconds", "gauge", "Time of the last successful check", lambda state: [("", state.timestamp)]),
+        ("swd_config_checks_total", "counter", "Number of successful checks", lambda state: [(f',mode="{mode}"', count) for mode, count in state.checks.items()]),
+        ("swd_config_check_errors_total", "counter", "Number of failed checks", lambda state: [("", state.errors)]),
+    ]
+
+    lines = []
+    for name, kind, description, samples in families:
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for state in states:
+            # No value yet for a motor which never passed a check
+            if state.mismatches is None and kind == "gauge":
+                continue
+            for labels, value in samples(state):
+                lines.append(f'{name}{{instance="{state.plan.instance_id}"{labels}}} {value}')
+
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path: str, states: List[MotorState]):
+    # Written atomically, so that the collector never reads a partial file
+    with open(path + ".tmp", "w") as f:
+        f.write(metrics(states))
+    os.replace(path + ".tmp", path)
+
+
+def create_logger(path: str, max_bytes: int, backups: int) -> logging.Logger:
+    log = logging.getLogger("drift_monitor")
+    log.setLevel(logging.INFO)
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups) if path != "-" else logging.StreamHandler(sys.stdout)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+    log.addHandler(handler)
+    return log
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Check the configuration of the motors periodically, and export the results as metrics")
+    parser.add_argument("swd_ids", nargs="*", metavar="swd_id", help="swd motors, left or right (default: both)")
+    parser.add_argument("--interval", type=float, default=60, help="period of the checks, in seconds (default: %(default)s)")
+    parser.add_argument("--full-every", type=int, default=10, help="number of cycles between two full checks, 1 for full checks only (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=1, help="number of D-Bus services queried concurrently (default: %(default)s)")
+    parser.add_argument("--metrics", default="/tmp/swd_drift.prom", help="metrics file, in the Prometheus text format (default: %(default)s)")
+    parser.add_argument("--log", default="/tmp/swd_drift.log", help="log file, - for the standard output (default: %(default)s)")
+    parser.add_argument("--log-size", type=int, default=1 << 20, help="size of the log file before rotation, in bytes (default: %(default)s)")
+    parser.add_argument("--log-count", type=int, default=3, help="number of rotated log files kept (default: %(default)s)")
+    parser.add_argument("--cycles", type=int, default=0, help="stop after this number of cycles, 0 to run forever (default: %(default)s)")
+    args = parser.parse_args(argv)
+    if any(side not in SIDES for side in args.swd_ids):
+        parser.error(f"swd motors must be in {SIDES}")
+    if args.full_every < 1:
+        parser.error("--full-every must be at least 1")
+
+    log = create_logger(args.log, args.log_size, args.log_count)
+
+    commissioning.load_dbus_session()
+    states = [MotorState(profiles.compile_profile(profiles.PROFILES[side])) for side in dict.fromkeys(args.swd_ids or SIDES)]
+
+    # Stop cleanly when stopped by systemd or kill
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    log.info("monitoring %s every %gs", ", ".join(state.plan.instance_id for state in states), args.interval)
+
+    cycle = 0
+    deadline = time.monotonic()
+    while True:
+        for state in states:
+            # The first check is a full one, to record the signatures of a correct motor
+            check_motor(state, cycle % args.full_every == 0, args.workers, log)
+        write_metrics(args.metrics, states)
+
+        cycle += 1
+        if cycle == args.cycles:
+            break
+
+        deadline += args.interval
+        time.sleep(max(0.0, deadline - time.monotonic()))
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except profiles.ProfileError as e:
+        print(f"Invalid profile: {e}")
+        sys.exit(1)
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import subprocess
+import sys
+import time
+from typing import Dict, List
+
+# Prefix of the line carrying the result of a worker on its standard output
+RESULT_PREFIX = "FLEET_RESULT "
+
+
+def load_inventory(path: str) -> List[dict]:
+    """Load the robots of an inventory file.
+
+    The inventory is a JSON file listing the robots to commission:
+
+        {
+            "robots": [
+                {
+                    "name": "robot-01",
+                    "left": "swd_left",
+                    "right": "swd_right",
+                    "env": {"DBUS_SESSION_BUS_ADDRESS": "unix:path=/run/robot-01/bus"}
+                }
+            ]
+        }
+
+    `left` and `right` are the swd-services instances of the motors, and default to
+    `swd_left` and `swd_right`. `env` is optional and applied to the environment of the
+    worker, e.g. to reach the D-Bus of the robot or a stand-in service.
+    """
+
+    with open(path) as f:
+        inventory = json.load(f)
+
+    robots = inventory["robots"]
+    names = set()
+    for robot in robots:
+        if "name" not in robot:
+            raise ValueError(f"{path}: robot without name")
+        if robot["name"] in names:
+            raise ValueError(f"{path}: duplicated robot {robot['name']}")
+        names.add(robot["name"])
+
+        robot.setdefault("left", "swd_left")
+        robot.setdefault("right", "swd_right")
+        robot.setdefault("env", {})
+
+    return robots
+
+
+# =======================
+#        WORKER
+# =======================
+
+
+def run_worker(robot: dict, incremental: bool, check_only: bool) -> dict:
+    """Commission and check the motors of one robot, in the current process."""
+
+    import commissioning
+    import check_commissioning
+    import profiles
+    import swd_commissioning
+
+    commissioning.load_dbus_session()
+    os.environ.update(robot["env"])
+
+    instances = {"left": robot["left"], "right": robot["right"]}
+    result = {"motors": {}, "check": {}}
+
+    if not check_only:
+        for instance_id, status in swd_commissioning.commission_motors(incremental, instances).items():
+            if isinstance(status, Exception):
+                result["motors"][instance_id] = f"failed: {status}"
+            else:
+                result["motors"][instance_id] = "commissioned" if status else "already commissioned"
+
+    for side, instance_id in instances.items():
+        if result["motors"].get(instance_id, "").startswith("failed"):
+            continue
+
+        try:
+            mismatches = check_commissioning.check_motor(commissioning.SWDClients(instance_id), profiles.compile_profile(profiles.PROFILES[side]))
+        except commissioning.CommissioningError as e:
+            result["check"][instance_id] = f"failed: {e}"
+            continue
+
+        if mismatches:
+            result["check"][instance_id] = f"failed: {len(mismatches)} mismatch(es): " + "; ".join(str(mismatch) for mismatch in mismatches)
+        else:
+            result["check"][instance_id] = "ok"
+
+    result["ok"] = len(result["check"]) == len(instances) and all(status == "ok" for status in result["check"].values())
+
+    return result
+
+
+# =======================
+#     ORCHESTRATOR
+# =======================
+
+
+def run_robot(robot: dict, args) -> dict:
+    """Run the worker of one robot in a child process, so that a crash or a timeout only affects this robot."""
+
+    command = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(robot)]
+    if args.incremental:
+        command.append("--incremental")
+    if args.check_only:
+        command.append("--check-only")
+
+    summary = {"name": robot["name"], "status": "failed", "duration": 0.0}
+
+    start = time.monotonic()
+    try:
+        # The environment of the robot also applies to the imports of the worker, e.g. SWD_BACKEND
+        env = {**os.environ, **robot["env"]}
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, timeout=args.timeout, env=env)
+        output = process.stdout
+    except subprocess.TimeoutExpired as e:
+        process = None
+        output = e.stdout.decode(errors="replace") if isinstance(e.stdout, bytes) else (e.stdout or "")
+        summary["status"] = "timeout"
+    summary["duration"] = time.monotonic() - start
+
+    if args.logs is not None:
+        with open(os.path.join(args.logs, f"{robot['name']}.log"), "w") as f:
+            f.write(output)
+
+    for line in output.splitlines():
+        if line.startswith(RESULT_PREFIX):
+            summary.update(json.loads(line[len(RESULT_PREFIX) :]))
+
+    if process is not None:
+        if process.returncode == 0 and summary.get("ok"):
+            summary["status"] = "ok"
+        elif "ok" not in summary:
+            # The worker died before reporting its result
+            summary["error"] = output.strip().splitlines()[-1] if output.strip() else f"exit code {process.returncode}"
+
+    return summary
+
+
+def run_fleet(robots: List[dict], args) -> List[dict]:
+    """Run the robots on a pool of `args.workers` workers, return their summaries in inventory order."""
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(run_robot, robot, args) for robot in robots]
+
+    return [future.result() for future in futures]
+
+
+def print_summary(summaries: List[dict]):
+    width = max([len(summary["name"]) for summary in summaries] + [5])
+
+    print(f"\n{'robot':<{width}}  {'status':<8}  {'time':>8}  details")
+    for summary in summaries:
+        details = []
+        for instance_id, status in summary.get("motors", {}).items():
+            details.append(f"{instance_id}: {status}")
+        for instance_id, status in summary.get("check", {}).items():
+            details.append(f"check {instance_id}: {status}")
+        if "error" in summary:
+            details.append(summary["error"])
+
+        print(f"{summary['name']:<{width}}  {summary['status']:<8}  {summary['duration']:>7.1f}s  {', '.join(details)}")
+
+    counts: Dict[str, int] = {}
+    for summary in summaries:
+        counts[summary["status"]] = counts.get(summary["status"], 0) + 1
+
+    print(f"\n{len(summaries)} robots: " + ", ".join(f"{count} {status}" for status, count in sorted(counts.items())))
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Commission and check a fleet of robots in parallel")
+    parser.add_argument("inventory", nargs="?", help="JSON inventory of the robots")
+    parser.add_argument("--workers", type=int, default=4, help="number of robots handled at the same time (default: 4)")
+    parser.add_argument("--timeout", type=float, default=300.0, help="timeout per robot, in seconds (default: 300)")
+    parser.add_argument("--incremental", action="store_true", help="only write the parameters that differ from the target configuration")
+    parser.add_argument("--check-only", action="store_true", help="only check the commissioning of the robots")
+    parser.add_argument("--logs", help="directory where the output of every robot is written")
+    parser.add_argument("--summary", help="JSON file where the summary is written")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker is not None:
+        result = run_worker(json.loads(args.worker), args.incremental, args.check_only)
+        print(RESULT_PREFIX + json.dumps(result))
+        sys.exit(0 if result["ok"] else 1)
+
+    if args.inventory is None:
+        parser.error("the inventory is required")
+
+    robots = load_inventory(args.inventory)
+
+    if args.logs is not None:
+        os.makedirs(args.logs, exist_ok=True)
+
+    summaries = run_fleet(robots, args)
+
+    print_summary(summaries)
+
+    if args.summary is not None:
+        with open(args.summary, "w") as f:
+            json.dump(summaries, f, indent=4)
+
+    if any(summary["status"] != "ok" for summary in summaries):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1:])
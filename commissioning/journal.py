@@ -0,0 +1,71 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import json
+import os
+from typing import List, Optional
+
+import profiles
+
+# Directory of the journals of the interrupted commissionings
+JOURNALS_DIR = os.path.join(os.path.dirname(profiles.CACHE_DIR), "journals")
+
+
+class Journal:
+    """Progress of the commissioning of one instance with one profile, kept on disk.
+
+    The journal is created once the factory parameters are restored, records every
+    step applied, and is removed once the commissioning is complete. A commissioning
+    interrupted in between resumes from its journal, if the motor of the instance has
+    the same serial number: a motor swapped in between is commissioned from scratch.
+    """
+
+    def __init__(self, instance_id: str, profile_hash: str, serial_number: Optional[int], steps: Optional[List[str]] = None):
+        self.instance_id = instance_id
+        self.profile_hash = profile_hash
+        self.serial_number = serial_number
+        self.steps = steps if steps is not None else []
+
+    @property
+    def path(self) -> str:
+        return os.path.join(JOURNALS_DIR, f"{self.instance_id}-{self.profile_hash}.json")
+
+    @classmethod
+    def load(cls, instance_id: str, profile_hash: str, serial_number: Optional[int]) -> Optional["Journal"]:
+        """Journal of the motor with `serial_number`, None if there is none or the serial number is unknown."""
+
+        journal = cls(instance_id, profile_hash, serial_number)
+        try:
+            with open(journal.path) as f:
+                data = json.load(f)
+            journal.steps = data["steps"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+        if serial_number is None or data.get("serial_number") != serial_number:
+            return None
+        return journal
+
+    def save(self):
+        # The journal only saves time on the next run, never fail the commissioning
+        try:
+            os.makedirs(JOURNALS_DIR, exist_ok=True)
+            with open(self.path + ".tmp", "w") as f:
+                json.dump({"instance_id": self.instance_id, "profile_hash": self.profile_hash, "serial_number": self.serial_number, "steps": self.steps}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(self.path + ".tmp", self.path)
+        except OSError:
+            pass
+
+    def step_done(self, name: str):
+        if name not in self.steps:
+            self.steps.append(name)
+        self.save()
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
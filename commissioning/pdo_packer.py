@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Packing of the cyclic objects of a motor into as few PDO frames as possible.
+
+The objects exchanged cyclically are given as mapping entries (0xIIII_SS_LL, LL
+being the length in bits), optionally followed by @N when they are only needed
+every N SYNCs. The objects of the same rate are packed into the fewest PDOs of
+at most 64 bits, slower objects filling the spare bits of faster PDOs when it
+saves frames, the fastest PDOs getting the lowest numbers and so the highest
+priority COB-IDs, and the other PDOs are invalidated:
+
+    python3 pdo_packer.py profiles/swd_left_4.json --tpdo 0x2620_02_08 0x6041_00_10 0x6064_00_20 --output packed.json
+
+The packed profile is written with `--output`, and the operations it compiles to
+are listed. The controller must use the new COB-IDs and mappings.
+"""
+
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+import profiles
+from smcdbusclient.communication import PDOId
+
+from verification import format_value
+
+# Maximum payload of a PDO, in bits
+PDO_BITS = 64
+
+# Default COB-ID of every PDO, by direction
+COB_IDS = {
+    "TPDO": ["0x180 + $NODE_ID", "0x280 + $NODE_ID", "0x380 + $NODE_ID", "0x480 + $NODE_ID"],
+    "RPDO": ["0x200 + $NODE_ID", "0x300 + $NODE_ID", "0x400 + $NODE_ID", "0x500 + $NODE_ID"],
+}
+
+
+def parse_object(text: str) -> Tuple[str, int]:
+    """Parse a cyclic object "0xIIII_SS_LL[@N]", return the mapping entry and its rate in SYNCs."""
+
+    entry, _, rate = text.partition("@")
+    try:
+        rate = int(rate) if rate else 1
+    except ValueError:
+        raise profiles.ProfileError(f"{text}: invalid rate")
+    if not 1 <= rate <= 240:
+        raise profiles.ProfileError(f"{text}: the rate must be between 1 and 240 SYNCs")
+
+    bits = profiles.parse_int(entry, 0) & 0xFF
+    if bits == 0 or bits % 8 or bits > PDO_BITS:
+        raise profiles.ProfileError(f"{text}: invalid length of {bits} bits")
+    return entry, rate
+
+
+def entry_bits(entry: str) -> int:
+    return profiles.parse_int(entry, 0) & 0xFF
+
+
+def first_fit(entries: List[str], pdos: List[List[str]]) -> List[List[str]]:
+    """Add the entries to copies of `pdos` first fit decreasing, opening PDOs as needed."""
+
+    pdos = [list(pdo) for pdo in pdos]
+    for entry in sorted(entries, key=lambda entry: -entry_bits(entry)):
+        for pdo in pdos:
+            if sum(entry_bits(other) for other in pdo) + entry_bits(entry) <= PDO_BITS:
+                pdo.append(entry)
+                break
+        else:
+            pdos.append([entry])
+    return pdos
+
+
+def pack(objects: List[Tuple[str, int]]) -> List[Tuple[int, List[str]]]:
+    """Pack the (entry, rate) objects into PDOs, return the rate and the entries of every PDO.
+
+    The rates are packed from the fastest one. The objects of one rate are packed
+    first fit decreasing, which gives the fewest PDOs when the sizes of the objects
+    divide each other (8, 16, 32 bits). They are packed into the spare bits of the
+    faster PDOs when it opens fewer PDOs, and so sends fewer frames per SYNC, the
+    slower objects being then sent more often than needed. An object given with
+    several rates is sent at the fastest one. The fastest PDOs come first.
+    """
+
+    rates: Dict[str, int] = {}
+    for entry, rate in objects:
+        rates[entry] = min(rate, rates.get(entry, rate))
+
+    pdos: List[Tuple[int, List[str]]] = []
+    for rate in sorted(set(rates.values())):
+        entries = [entry for entry in rates if rates[entry] == rate]
+
+        alone = first_fit(entries, [])
+        shared = first_fit(entries, [pdo for _, pdo in pdos])
+        if len(shared) - len(pdos) < len(alone):
+            pdos = [(pdo_rate, pdo) for (pdo_rate, _), pdo in zip(pdos, shared)] + [(rate, pdo) for pdo in shared[len(pdos) :]]
+        else:
+            pdos += [(rate, pdo) for pdo in alone]
+
+    if len(pdos) > len(PDOId):
+        raise profiles.ProfileError(f"{len(pdos)} PDOs needed, only {len(PDOId)} available")
+
+    # Keep the order of the objects given in each PDO
+    return [(rate, [entry for entry in rates if entry in pdo]) for rate, pdo in pdos]
+
+
+def pdo_section(direction: str, pdos: List[Tuple[int, List[str]]]) -> dict:
+    """Profile section ("tpdo" or "rpdo") of the packed PDOs."""
+
+    section = {}
+    for pdo_id in PDOId:
+        cob_id = COB_IDS[direction][pdo_id.value]
+        if pdo_id.value < len(pdos):
+            rate, entries = pdos[pdo_id.value]
+            section[pdo_id.name] = {"cob_id": cob_id, "valid": True, "transmission_type": f"PDO_SYNC_{rate}", "mapping": entries}
+        else:
+            section[pdo_id.name] = {"cob_id": cob_id, "valid": False}
+    return section
+
+
+def frames_per_sync(section: dict) -> float:
+    """Average number of frames sent per SYNC by the valid PDOs of a profile section."""
+
+    frames = 0.0
+    for pdo in section.values():
+        if pdo["valid"]:
+            transmission_type = pdo.get("transmission_type", "PDO_SYNC_1")
+            # Acyclic and event driven PDOs may be sent at every SYNC
+            rate = int(transmission_type[len("PDO_SYNC_") :]) if transmission_type[len("PDO_SYNC_") :].isdigit() else 1
+            frames += 1 / rate
+    return frames
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Pack the cyclic objects of a motor into the fewest PDO frames")
+    parser.add_argument("profile", help="configuration profile of the motor")
+    parser.add_argument("--tpdo", nargs="+", default=[], metavar="OBJECT", help="objects sent by the motor, as 0xIIII_SS_LL[@N]")
+    parser.add_argument("--rpdo", nargs="+", default=[], metavar="OBJECT", help="objects received by the motor, as 0xIIII_SS_LL[@N]")
+    parser.add_argument("--output", help="file of the packed profile")
+    args = parser.parse_args(argv)
+    if not args.tpdo and not args.rpdo:
+        parser.error("--tpdo or --rpdo expected")
+
+    with open(args.profile) as f:
+        profile = json.load(f)
+
+    for direction, objects in [("TPDO", args.tpdo), ("RPDO", args.rpdo)]:
+        if not objects:
+            continue
+
+        key = direction.lower()
+        before = frames_per_sync(profile.get(key, {}))
+        profile[key] = pdo_section(direction, pack([parse_object(text) for text in objects]))
+        print(f"{direction}: {before:g} -> {frames_per_sync(profile[key]):g} frame(s) per SYNC")
+
+    # The packed profile must compile, and tells the operations to apply
+    plan = profiles.compile_profile_data(profile)
+    print("\nOperations:")
+    for step in plan.steps:
+        if step.name == "communication":
+            for operation in step.operations:
+                if operation.kind == "mapping":
+                    value = "[" + ", ".join(profiles.format_arg(item) for item in operation.expected) + "]"
+                else:
+                    value = ", ".join(f"{field}={format_value(expected, field == 'cob_id.can_id')}" for field, expected in operation.expected.items())
+                print(f"  {operation.call_name(operation.setter)}: {value}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(profile, f, indent=4)
+            f.write("\n")
+        print(f"\nPacked profile written to {args.output}")
+    else:
+        print()
+        print(json.dumps({key: profile[key] for key in ["tpdo", "rpdo"] if key in profile}, indent=4))
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except profiles.ProfileError as e:
+        print(f"Invalid profile: {e}")
+        sys.exit(1)
@@ -0,0 +1,707 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+"""Declarative motor configuration profiles.
+
+A profile is a JSON file describing the full target configuration of one motor
+(see `profiles/swd_left_4.json`). It is compiled into a `Plan`: an ordered list of
+steps, each one made of the `Operation`s reading, writing and verifying one object
+of the motor. Both the commissioning and the check scripts execute the same plan.
+
+Compiled plans are cached by profile hash, in memory and on disk, so repeated runs
+skip the parsing and validation of the profile. The cache on disk holds plain JSON,
+keyed by the hash of this module too, so a plan is compiled again when the compiler
+changes.
+"""
+
+from enum import Enum
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional, Tuple
+
+import backend
+
+backend.setup()
+
+from smcdbusclient.communication import NetworkParameters, BitTiming, PDOCommunicationParameters, PDOTransmissionType, PDOId, PDOMappingParameters
+from smcdbusclient.pds import PolarityParameters
+from smcdbusclient.safe_motion import STOId, SLSId, SafetyControlWordId, SafetyFunctionId, SafetyWordMapping
+from smcdbusclient.srdo import SRDOId, SRDOParameters
+
+# Directory of the profiles shipped with the scripts
+PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "profiles")
+
+# Default profile of each motor of the starter kit
+PROFILES = {
+    "left": os.path.join(PROFILES_DIR, "swd_left_4.json"),
+    "right": os.path.join(PROFILES_DIR, "swd_right_5.json"),
+}
+
+# Version of the compiled plans, to be increased whenever Plan or Operation change
+PLAN_FORMAT = 3
+
+# Directory of the compiled plans
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.expanduser("~/.cache")), "swd-commissioning", "plans")
+
+# Compiled plans of the current process, by profile hash
+_plans: Dict[str, "Plan"] = {}
+
+# Classes and enumerations of the smcdbusclient types found in the plans, by name, see decode_value()
+CLASSES: Dict[str, type] = {
+    cls.__name__: cls
+    for cls in [
+        NetworkParameters,
+        BitTiming,
+        PDOCommunicationParameters,
+        PDOTransmissionType,
+        PDOId,
+        PDOMappingParameters,
+        PolarityParameters,
+        STOId,
+        SLSId,
+        SafetyControlWordId,
+        SafetyFunctionId,
+        SRDOId,
+        SRDOParameters,
+    ]
+}
+
+
+# Storage block (BlocId name) of the objects of the object dictionary, by index range
+BLOCS = [
+    (0x1000, 0x1FFF, "COMMUNICATION"),
+    (0x2000, 0x5FFF, "MANUFACTURER"),
+    (0x6000, 0x9FFF, "APPLICATION"),
+]
+
+
+class ProfileError(ValueError):
+    """Raised when a profile is invalid."""
+
+
+# Helpers
+
+
+def list_to_swm(l: List[SafetyFunctionId]):
+    ret = SafetyWordMapping()
+    for i in range(0, len(l)):
+        setattr(ret, "safety_function_" + str(i), l[i])
+    return ret
+
+
+def get_field(obj, path: str):
+    for name in path.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+def set_fields(obj, fields: dict) -> bool:
+    """Set the (dotted) attributes of `obj`, return True if any value changed."""
+    changed = False
+    for path, value in fields.items():
+        *parents, name = path.split(".")
+        target = obj
+        for parent in parents:
+            target = getattr(target, parent)
+        if getattr(target, name) != value:
+            setattr(target, name, value)
+            changed = True
+    return changed
+
+
+# Plan
+
+
+class Operation:
+    """One object of the motor: how to read, write and verify it.
+
+    `kind` tells how the object is compared with `expected`:
+    - "fields": `expected` maps (dotted) attributes of the object to their value,
+    - "mapping": `expected` is the list of items of a PDO mapping,
+    - "swm": `expected` is the list of safety functions of a safety word mapping,
+    - "value": `expected` is the value itself.
+
+    `factory` builds a new object from scratch before writing it. Without factory,
+    the object is read, modified and written back. Objects without `setter` are
+    only verified. `bloc` is the storage block (BlocId name) holding the object.
+    `signature_index` is the position of the signature of the object in the result
+    of the getter, for the safety parameters signed by the motor.
+    """
+
+    def __init__(
+        self,
+        step: str,
+        client: str,
+        getter: str,
+        setter: Optional[str],
+        args: Tuple = (),
+        kind: str = "fields",
+        expected: Any = None,
+        factory: Optional[type] = None,
+        value_index: int = 0,
+        bloc: str = "ALL",
+        signature_index: Optional[int] = None,
+    ):
+        self.step = step
+        self.client = client
+        self.getter = getter
+        self.setter = setter
+        self.args = args
+        self.kind = kind
+        self.expected = expected
+        self.factory = factory
+        self.value_index = value_index
+        self.bloc = bloc
+        self.signature_index = signature_index
+
+    @property
+    def read_before_write(self) -> bool:
+        """Tell if the object is read, modified and written back, instead of built from scratch."""
+        return self.kind == "fields" and self.factory is None
+
+    @property
+    def name(self) -> str:
+        """Name of the object, e.g. "TPDOCommunicationParameters(PDO_1)"."""
+        args = ", ".join(format_arg(arg) for arg in self.args)
+        return f"{self.getter[3:]}({args})"
+
+    def call_name(self, method: str) -> str:
+        args = ", ".join(format_arg(arg) for arg in self.args)
+        return f"{method}({args})"
+
+    def call(self, swd) -> Tuple:
+        """Call the getter of the object, return its raw result."""
+        return getattr(getattr(swd, self.client), self.getter)(*self.args)
+
+    def parse(self, result: Tuple) -> Tuple[Any, int]:
+        """Extract the value and the error code from the raw result of the getter."""
+        return result[self.value_index], result[-1]
+
+    def signature(self, result: Tuple) -> Optional[int]:
+        """Extract the signature from the raw result of the getter, if the object is signed."""
+        return None if self.signature_index is None else result[self.signature_index]
+
+    def read(self, swd) -> Tuple[Any, int]:
+        """Read the object, return its value and the error code."""
+        return self.parse(self.call(swd))
+
+    def write(self, swd, value) -> int:
+        """Write the object, return the error code."""
+        return getattr(getattr(swd, self.client), self.setter)(*self.args, value)
+
+    def mismatches(self, value) -> List[Tuple[str, Any, Any]]:
+        """Compare the value read from the motor with the expected one.
+
+        Returns the (field, expected, actual) tuple of every field which differs.
+        """
+        if self.kind == "fields":
+            ret = []
+            for path, expected in self.expected.items():
+                actual = get_field(value, path)
+                if actual != expected:
+                    ret.append((path, expected, actual))
+            return ret
+        if self.kind == "mapping":
+            ret = []
+            if value.nb != len(self.expected):
+                ret.append(("nb", len(self.expected), value.nb))
+            items = list(value.items)[: value.nb]
+            if items != self.expected:
+                ret.append(("items", self.expected, items))
+            return ret
+        if self.kind == "swm":
+            ret = []
+            for i in range(0, len(self.expected)):
+                actual = getattr(value, "safety_function_" + str(i))
+                if actual != self.expected[i]:
+                    ret.append(("safety_function_" + str(i), self.expected[i], actual))
+            return ret
+        return [] if value == self.expected else [("value", self.expected, value)]
+
+    def matches(self, value) -> bool:
+        """Tell if the value read from the motor is the expected one."""
+        return not self.mismatches(value)
+
+    def target(self, value=None):
+        """Build the object to write, from the current `value` or from scratch."""
+        if self.kind == "fields":
+            if value is None:
+                value = self.factory()
+            set_fields(value, self.expected)
+            return value
+        if self.kind == "mapping":
+            mapping = PDOMappingParameters()
+            mapping.nb = len(self.expected)
+            for item in self.expected:
+                mapping.items.append(item)
+            return mapping
+        if self.kind == "swm":
+            return list_to_swm(self.expected)
+        return self.expected
+
+
+class Step:
+    """Ordered group of operations, e.g. every PDO parameter.
+
+    `on_write` is the (client, method, bloc) called once any object of the step was
+    written, `bloc` being the storage block modified by the call. `state` reads
+    whether `on_write` is in effect, e.g. the SRDO configuration validity, so that a
+    rollback calls it again when it was before.
+    """
+
+    def __init__(self, name: str, operations: List[Operation], on_write: Optional[Tuple[str, str, str]] = None, state: Optional[Operation] = None):
+        self.name = name
+        self.operations = operations
+        self.on_write = on_write
+        self.state = state
+
+
+class Plan:
+    """Compiled profile."""
+
+    def __init__(self, name: str, profile_hash: str, instance_id: str, node_id: int, steps: List[Step]):
+        self.name = name
+        self.hash = profile_hash
+        self.instance_id = instance_id
+        self.node_id = node_id
+        self.steps = steps
+
+    @property
+    def operations(self) -> List[Operation]:
+        return [operation for step in self.steps for operation in step.operations]
+
+    @property
+    def states(self) -> List[Operation]:
+        """Operations reading the `state` of the steps, checked with their objects."""
+        return [step.state for step in self.steps if step.state is not None]
+
+
+def format_arg(arg) -> str:
+    if isinstance(arg, int) and not hasattr(arg, "name"):
+        return f"0x{arg >> 16:04X}_{(arg >> 8) & 0xFF:02X}_{arg & 0xFF:02X}"
+    return arg.name
+
+
+# Compiler
+
+
+def bloc_of(index: int) -> str:
+    """Storage block of an object dictionary index."""
+
+    for first, last, bloc in BLOCS:
+        if first <= index <= last:
+            return bloc
+    return "ALL"
+
+
+def parse_int(value, node_id: int) -> int:
+    """Parse an integer, a hexadecimal string, or a sum of them and $NODE_ID (e.g. "0x180 + $NODE_ID")."""
+
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ProfileError(f"invalid integer {value!r}")
+    if isinstance(value, int):
+        return value
+
+    total = 0
+    for term in value.split("+"):
+        term = term.strip()
+        if term == "$NODE_ID":
+            total += node_id
+        else:
+            try:
+                total += int(term, 0)
+            except ValueError:
+                raise ProfileError(f"invalid integer {value!r}")
+    return total
+
+
+def parse_enum(enum, name: str):
+    try:
+        return enum[name]
+    except KeyError:
+        raise ProfileError(f"invalid {enum.__name__} {name!r}")
+
+
+def parse_fields(section: str, fields: dict, allowed: Dict[str, Any]) -> dict:
+    """Check the fields of a section, convert them to the type given in `allowed`."""
+
+    if not isinstance(fields, dict):
+        raise ProfileError(f"{section}: object expected")
+
+    ret = {}
+    for name, value in fields.items():
+        if name not in allowed:
+            raise ProfileError(f"{section}: unknown field {name!r}")
+
+        kind = allowed[name]
+        if kind is bool:
+            if not isinstance(value, bool):
+                raise ProfileError(f"{section}.{name}: boolean expected")
+        elif kind is int:
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ProfileError(f"{section}.{name}: integer expected")
+        else:
+            value = parse_enum(kind, value)
+
+        ret[name] = value
+
+    return ret
+
+
+def check_keys(section: str, values: dict, allowed: List[str], required: List[str] = ()):
+    if not isinstance(values, dict):
+        raise ProfileError(f"{section}: object expected")
+
+    for key in values:
+        if key not in allowed:
+            raise ProfileError(f"{section}: unknown key {key!r}")
+
+    for key in required:
+        if key not in values:
+            raise ProfileError(f"{section}: missing {key!r}")
+
+
+def compile_PDOs(direction: str, pdos: dict, node_id: int) -> List[Operation]:
+    check_keys(direction.lower(), pdos, [pdo.name for pdo in PDOId])
+
+    communication = []
+    mappings = []
+
+    for name, pdo in pdos.items():
+        section = f"{direction.lower()}.{name}"
+        check_keys(section, pdo, ["cob_id", "valid", "flag", "transmission_type", "mapping"], required=["cob_id", "valid"])
+
+        pdo_id = PDOId[name]
+        flags = parse_fields(section, {"valid": pdo["valid"], "flag": pdo.get("flag", True)}, {"valid": bool, "flag": bool})
+        fields = {
+            "cob_id.can_id": parse_int(pdo["cob_id"], node_id),
+            "cob_id.valid": flags["valid"],
+            "cob_id.flag": flags["flag"],
+            "transmission_type": parse_enum(PDOTransmissionType, pdo.get("transmission_type", "PDO_SYNC_1")),
+        }
+
+        communication.append(
+            Operation(
+                "communication",
+                "communication_client",
+                f"get{direction}CommunicationParameters",
+                f"set{direction}CommunicationParameters",
+                (pdo_id,),
+                expected=fields,
+                factory=PDOCommunicationParameters,
+                bloc="COMMUNICATION",
+            )
+        )
+
+        if "mapping" in pdo:
+            if not isinstance(pdo["mapping"], list):
+                raise ProfileError(f"{section}.mapping: list expected")
+            items = [parse_int(item, node_id) for item in pdo["mapping"]]
+            if sum(item & 0xFF for item in items) > 64:
+                raise ProfileError(f"{section}.mapping: more than 64 bits mapped")
+
+            mappings.append(
+                Operation(
+                    "communication",
+                    "communication_client",
+                    f"get{direction}MappingParameters",
+                    f"set{direction}MappingParameters",
+                    (pdo_id,),
+                    kind="mapping",
+                    expected=items,
+                    bloc="COMMUNICATION",
+                )
+            )
+
+    return communication + mappings
+
+
+def compile_profile_data(profile: dict, profile_hash: str = "") -> Plan:
+    """Validate a parsed profile and compile it into a plan."""
+
+    check_keys(
+        "profile",
+        profile,
+        ["name", "instance_id", "node_id", "network", "tpdo", "rpdo", "polarity", "srdo", "safety_control_word_mapping", "velocity_mode", "sto", "sls", "od", "swd"],
+        required=["name", "instance_id", "node_id"],
+    )
+
+    node_id = parse_int(profile["node_id"], 0)
+    if not 1 <= node_id <= 127:
+        raise ProfileError(f"profile: invalid node_id {node_id}")
+
+    steps = []
+
+    # Network parameters
+    fields = parse_fields("network", profile.get("network", {}), {"bit_timing": BitTiming, "rt_activated": bool})
+    fields = {"node_id": node_id, **fields}
+    steps.append(
+        Step(
+            "network",
+            [Operation("network", "communication_client", "getNetworkParameters", "setNetworkParameters", expected=fields, factory=NetworkParameters, bloc="MANUFACTURER")],
+        )
+    )
+
+    # PDO communication and mapping parameters
+    operations = compile_PDOs("TPDO", profile.get("tpdo", {}), node_id) + compile_PDOs("RPDO", profile.get("rpdo", {}), node_id)
+    # Mappings are written once every communication parameter is set
+    operations.sort(key=lambda operation: operation.kind == "mapping")
+    steps.append(Step("communication", operations))
+
+    # Polarity parameters
+    if "polarity" in profile:
+        fields = parse_fields("polarity", profile["polarity"], {"velocity_polarity": bool, "position_polarity": bool})
+        steps.append(
+            Step(
+                "polarity", [Operation("polarity", "pds_client", "getPolarityParameters", "setPolarityParameters", expected=fields, factory=PolarityParameters, bloc="APPLICATION")]
+            )
+        )
+
+    # SRDO parameters: every SRDO of the profile is configured, the other ones are invalidated
+    srdos = profile.get("srdo", {})
+    check_keys("srdo", srdos, [srdo.name for srdo in SRDOId])
+    operations = []
+    for srdo in SRDOId:
+        if srdo.name not in srdos:
+            operations.append(Operation("srdo", "srdo_client", "getSRDOParameters", "setSRDOParameters", (srdo,), expected={"valid": False}, value_index=1, bloc="COMMUNICATION"))
+    for name, params in srdos.items():
+        section = f"srdo.{name}"
+        check_keys(section, params, ["can_id1", "can_id2", "sct", "srvt"], required=["can_id1", "can_id2", "sct", "srvt"])
+        fields = {
+            "can_id1": parse_int(params["can_id1"], node_id),
+            "can_id2": parse_int(params["can_id2"], node_id),
+            "valid": True,
+            **parse_fields(section, {"sct": params["sct"], "srvt": params["srvt"]}, {"sct": int, "srvt": int}),
+        }
+        operations.append(
+            Operation(
+                "srdo",
+                "srdo_client",
+                "getSRDOParameters",
+                "setSRDOParameters",
+                (SRDOId[name],),
+                expected=fields,
+                factory=SRDOParameters,
+                value_index=1,
+                bloc="COMMUNICATION",
+                signature_index=2,
+            )
+        )
+
+    mappings = profile.get("safety_control_word_mapping", {})
+    check_keys("safety_control_word_mapping", mappings, [scw.name for scw in SafetyControlWordId])
+    for name, functions in mappings.items():
+        if not isinstance(functions, list) or len(functions) > 8:
+            raise ProfileError(f"safety_control_word_mapping.{name}: list of at most 8 safety functions expected")
+        functions = [parse_enum(SafetyFunctionId, function) for function in functions]
+        operations.append(
+            Operation(
+                "srdo",
+                "safe_motion_client",
+                "getSafetyControlWordMapping",
+                "setSafetyControlWordMapping",
+                (SafetyControlWordId[name],),
+                kind="swm",
+                expected=functions,
+                bloc="MANUFACTURER",
+            )
+        )
+
+    steps.append(
+        Step(
+            "srdo",
+            operations,
+            on_write=("srdo_client", "setSRDOConfigurationValidity", "COMMUNICATION"),
+            state=Operation("srdo", "srdo_client", "getSRDOConfigurationValidity", None, kind="value", expected=True, bloc="COMMUNICATION"),
+        )
+    )
+
+    # Ramps
+    if "velocity_mode" in profile:
+        fields = parse_fields("velocity_mode", profile["velocity_mode"], {"vl_velocity_acceleration_delta_speed": int, "vl_velocity_deceleration_delta_speed": int})
+        steps.append(Step("ramps", [Operation("ramps", "velocity_mode_client", "getVelocityModeParameters", "setVelocityModeParameters", expected=fields, bloc="APPLICATION")]))
+
+    # STO parameters
+    sto = profile.get("sto", {})
+    check_keys("sto", sto, [sto_id.name for sto_id in STOId])
+    operations = []
+    for name, params in sto.items():
+        fields = parse_fields(f"sto.{name}", params, {"restart_acknowledge_behavior": bool})
+        operations.append(Operation("sto", "safe_motion_client", "getSTOParameters", "setSTOParameters", (STOId[name],), expected=fields, bloc="MANUFACTURER", signature_index=1))
+    if operations:
+        steps.append(Step("sto", operations))
+
+    # SLS parameters
+    sls = profile.get("sls", {})
+    check_keys("sls", sls, [sls_id.name for sls_id in SLSId])
+    operations = []
+    for name, params in sls.items():
+        fields = parse_fields(f"sls.{name}", params, {"velocity_limit_u32": int, "time_to_velocity_monitoring": int, "time_for_velocity_in_limits": int})
+        operations.append(Operation("sls", "safe_motion_client", "getSLSParameters", "setSLSParameters", (SLSId[name],), expected=fields, bloc="MANUFACTURER", signature_index=1))
+    if operations:
+        steps.append(Step("sls", operations))
+
+    # Raw object dictionary values, e.g. the error behavior
+    objects = profile.get("od", {})
+    if not isinstance(objects, dict):
+        raise ProfileError("od: object expected")
+    operations = []
+    for index, entry in objects.items():
+        section = f"od.{index}"
+        check_keys(section, entry, ["name", "type", "value"], required=["type", "value"])
+        if entry.get("type") not in ["UInt8", "UInt16", "UInt32", "Int8", "Int16", "Int32"]:
+            raise ProfileError(f"{section}: invalid type {entry.get('type')!r}")
+        value = parse_int(entry["value"], node_id)
+        od_index = parse_int(index, node_id)
+        operations.append(
+            Operation("od", "can_open_client", f"getValue{entry['type']}", f"setValue{entry['type']}", (od_index,), kind="value", expected=value, bloc=bloc_of(od_index >> 16))
+        )
+    if operations:
+        steps.append(Step("od", operations))
+
+    # Manufacturer parameters, only verified
+    if "swd" in profile:
+        fields = parse_fields("swd", profile["swd"], {"motctrl_speed_pid_p": int, "motctrl_speed_pid_i": int, "motctrl_speed_pid_d": int})
+        steps.append(Step("swd", [Operation("swd", "manufacturer_client", "getSWDParameters", None, expected=fields, bloc="MANUFACTURER")]))
+
+    return Plan(profile["name"], profile_hash, profile["instance_id"], node_id, steps)
+
+
+# Cache
+
+
+def encode_value(value) -> Any:
+    """JSON value of an argument or an expected value of an operation."""
+
+    if isinstance(value, Enum):
+        return {"enum": type(value).__name__, "name": value.name}
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return {"fields": {name: encode_value(item) for name, item in value.items()}}
+    return value
+
+
+def decode_value(value) -> Any:
+    """Value encoded by encode_value(), only building the enumerations of CLASSES."""
+
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    if isinstance(value, dict):
+        if "enum" in value:
+            return CLASSES[value["enum"]][value["name"]]
+        return {name: decode_value(item) for name, item in value["fields"].items()}
+    return value
+
+
+def encode_operation(operation: Operation) -> dict:
+    return {
+        **vars(operation),
+        "args": encode_value(operation.args),
+        "expected": encode_value(operation.expected),
+        "factory": operation.factory.__name__ if operation.factory is not None else None,
+    }
+
+
+def decode_operation(data: dict) -> Operation:
+    data = dict(data)
+    data["args"] = tuple(decode_value(data["args"]))
+    data["expected"] = decode_value(data["expected"])
+    data["factory"] = CLASSES[data["factory"]] if data["factory"] is not None else None
+    return Operation(**data)
+
+
+def encode_plan(plan: Plan) -> dict:
+    return {
+        "name": plan.name,
+        "hash": plan.hash,
+        "instance_id": plan.instance_id,
+        "node_id": plan.node_id,
+        "steps": [
+            {
+                "name": step.name,
+                "on_write": step.on_write,
+                "state": encode_operation(step.state) if step.state is not None else None,
+                "operations": [encode_operation(operation) for operation in step.operations],
+            }
+            for step in plan.steps
+        ],
+    }
+
+
+def decode_plan(data: dict) -> Plan:
+    steps = []
+    for step in data["steps"]:
+        steps.append(
+            Step(
+                step["name"],
+                [decode_operation(operation) for operation in step["operations"]],
+                tuple(step["on_write"]) if step["on_write"] is not None else None,
+                decode_operation(step["state"]) if step["state"] is not None else None,
+            )
+        )
+    return Plan(data["name"], data["hash"], data["instance_id"], data["node_id"], steps)
+
+
+_source_hash: Optional[str] = None
+
+
+def source_hash() -> str:
+    """Hash of this module, part of the key of the cached plans."""
+
+    global _source_hash
+    if _source_hash is None:
+        with open(os.path.abspath(__file__), "rb") as f:
+            _source_hash = hashlib.sha256(f.read()).hexdigest()
+    return _source_hash
+
+
+def compile_profile(path: str) -> Plan:
+    """Compile the profile at `path`, or get its plan from the cache."""
+
+    with open(path, "rb") as f:
+        data = f.read()
+
+    return compile_profile_bytes(data, path)
+
+
+def compile_profile_bytes(data: bytes, source: str) -> Plan:
+    """Compile the content of a profile, or get its plan from the cache.
+
+    `source` names the profile in the errors, e.g. its path.
+    """
+
+    profile_hash = hashlib.sha256(f"{PLAN_FORMAT}:".encode() + data).hexdigest()
+
+    if profile_hash in _plans:
+        return _plans[profile_hash]
+
+    cache = os.path.join(CACHE_DIR, f"{hashlib.sha256((source_hash() + profile_hash).encode()).hexdigest()}.json")
+    try:
+        with open(cache) as f:
+            plan = decode_plan(json.load(f))
+        if plan.hash != profile_hash:
+            raise ValueError(f"{cache}: plan of another profile")
+    except (OSError, ValueError, KeyError, TypeError, AttributeError):
+        try:
+            profile = json.loads(data)
+        except ValueError as e:
+            raise ProfileError(f"{source}: {e}")
+
+        plan = compile_profile_data(profile, profile_hash)
+
+        # Best effort, the plan is compiled again if the cache can't be written
+        try:
+            os.makedirs(CACHE_DIR, mode=0o700, exist_ok=True)
+            os.chmod(CACHE_DIR, 0o700)
+            with open(f"{cache}.{os.getpid()}", "w") as f:
+                json.dump(encode_plan(plan), f)
+            os.replace(f"{cache}.{os.getpid()}", cache)
+        except OSError:
+            pass
+
+    _plans[profile_hash] = plan
+    return plan
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Recording of the D-Bus calls, and their replay without motor.
+
+When the SWD_RECORD environment variable is set, the D-Bus clients of `SWDClients`
+are wrapped so that every call is recorded with its arguments, its result and its
+timing. The session is written at exit to the SWD_RECORD file, as gzipped JSON
+lines: a header, then one line per call.
+
+    SWD_RECORD=left.rec.gz python3 check_commissioning.py left
+
+The enumerations are recorded by member name, and their definitions in the
+header: the "replay" backend installs them in place of the ones of the simulator
+of smcdbusclient, whose types it uses to answer the calls of the scripts with a
+recorded session, instead of swd-services:
+
+    SWD_BACKEND=replay SWD_REPLAY=left.rec.gz python3 check_commissioning.py left
+
+The calls of one method with the same arguments are answered in the order of the
+recording, the last answer being repeated once they are exhausted (e.g. when a
+getter is polled more often). A setter called with other values gets the answer
+of the same setter on the same object. Any other call which was not recorded
+raises a ReplayError. Each call takes its recorded duration divided by
+SWD_REPLAY_SPEED (default: 1, the recorded speed), 0 answering as fast as
+possible. The files of the cache (journals, signatures) also select the calls of
+a flow: replay with the same cache as the recording.
+
+    python3 recording.py left.rec.gz     # summary of a recording
+"""
+
+import atexit
+from collections import deque
+import datetime
+from enum import Enum
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+import types
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+# Format of the recordings, in their header
+FORMAT = "swd-recording"
+VERSION = 2
+
+
+class ReplayError(Exception):
+    """Raised by the replay backend for a call which is not in the recording."""
+
+
+class RecordedError(Exception):
+    """Exception raised by a recorded call, raised again by the replay backend."""
+
+
+def encode(value, enums: Optional[Dict[str, dict]] = None) -> Any:
+    """JSON value of an argument or a result of a D-Bus call.
+
+    The definitions of the enumerations encoded are added to `enums`, by name.
+    """
+
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, Enum):
+        cls = type(value)
+        if enums is not None and cls.__name__ not in enums:
+            enums[cls.__name__] = {"module": cls.__module__, "members": {name: member.value for name, member in cls.__members__.items()}}
+        return {"e": cls.__name__, "n": value.name}
+    if isinstance(value, list):
+        return [encode(item, enums) for item in value]
+    if isinstance(value, tuple):
+        return {"t": [encode(item, enums) for item in value]}
+
+    attributes = getattr(value, "__dict__", None) or {slot: getattr(value, slot) for slot in getattr(value, "__slots__", ()) if hasattr(value, slot)}
+    return {"o": type(value).__name__, "f": {name: encode(attribute, enums) for name, attribute in attributes.items() if not name.startswith("_")}}
+
+
+def decode(value, classes: Dict[str, type]) -> Any:
+    """Value encoded by encode(), with the classes of the current smcdbusclient."""
+
+    if isinstance(value, list):
+        return [decode(item, classes) for item in value]
+    if not isinstance(value, dict):
+        return value
+    if "t" in value:
+        return tuple(decode(item, classes) for item in value["t"])
+    if "e" in value:
+        if value["e"] not in classes or value["n"] not in classes[value["e"]].__members__:
+            raise ReplayError(f"unknown enumeration {value['e']}.{value['n']}")
+        return classes[value["e"]][value["n"]]
+
+    # Objects of an unknown class keep their attributes
+    cls = classes.get(value["o"])
+    obj = cls() if cls is not None else types.SimpleNamespace()
+    for name, attribute in value["f"].items():
+        setattr(obj, name, decode(attribute, classes))
+    return obj
+
+
+def call_key(instance_id: str, service: str, method: str, args) -> Tuple[str, str, str, str]:
+    return instance_id, service, method, json.dumps(args, sort_keys=True, separators=(",", ":"))
+
+
+# =======================
+#       RECORDING
+# =======================
+
+
+class Recorder:
+    """Calls of every recorded client, in recording order.
+
+    Every call is [start, duration, instance, service, method, args, result,
+    error], the times being in seconds from the creation of the recorder, and the
+    error being the [type, message] of the exception raised by the call. `enums`
+    holds the definitions of the enumerations of the calls, see encode().
+    """
+
+    def __init__(self):
+        self.calls: List[list] = []
+        self.enums: Dict[str, dict] = {}
+        self.created = datetime.datetime.now().isoformat(timespec="seconds")
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, call: list):
+        with self._lock:
+            self.calls.append(call)
+
+    def wrap(self, client, service: str, instance_id: str) -> "RecordedClient":
+        return RecordedClient(self, client, service, instance_id)
+
+    def export(self, path: str):
+        header = {"format": FORMAT, "version": VERSION, "created": self.created, "argv": sys.argv, "enums": self.enums}
+        with gzip.open(path, "wt") as f:
+            f.write(json.dumps(header) + "\n")
+            for call in self.calls:
+                f.write(json.dumps(call, separators=(",", ":")) + "\n")
+
+
+class RecordedClient:
+    """Proxy of a D-Bus client recording every method call."""
+
+    def __init__(self, recorder: Recorder, client, service: str, instance_id: str):
+        self._recorder = recorder
+        self._client = client
+        self._service = service
+        self._instance_id = instance_id
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args):
+            start = time.perf_counter()
+            result = error = None
+            try:
+                result = attribute(*args)
+                return result
+            except Exception as e:
+                error = [type(e).__name__, str(e)]
+                raise
+            finally:
+                duration = time.perf_counter() - start
+                enums = self._recorder.enums
+                self._recorder.record(
+                    [round(start - self._recorder.origin, 6), round(duration, 6), self._instance_id, self._service, name, encode(list(args), enums), encode(result, enums), error]
+                )
+
+        return call
+
+
+_recorder: Optional[Recorder] = None
+_recorder_lock = threading.Lock()
+
+
+def default_recorder() -> Optional[Recorder]:
+    """Recorder of the process if SWD_RECORD is set, written to SWD_RECORD at exit."""
+
+    global _recorder
+
+    path = os.environ.get("SWD_RECORD")
+    if not path:
+        return None
+
+    with _recorder_lock:
+        if _recorder is None:
+            _recorder = Recorder()
+            atexit.register(_recorder.export, path)
+        return _recorder
+
+
+# =======================
+#         REPLAY
+# =======================
+
+
+def load_header(f, path: str) -> dict:
+    header = json.loads(f.readline())
+    if header.get("format") != FORMAT or header.get("version") != VERSION:
+        raise ReplayError(f"{path}: not a recording of version {VERSION}")
+    return header
+
+
+def load_recording(path: str) -> Tuple[dict, List[list]]:
+    """Header and calls of a recording."""
+
+    with gzip.open(path, "rt") as f:
+        header = load_header(f, path)
+        return header, [json.loads(line) for line in f]
+
+
+_enums_installed = False
+
+
+def install_enums():
+    """Install the enumerations of the SWD_REPLAY recording in the simulator of smcdbusclient.
+
+    The values of the members recorded with another smcdbusclient may differ from
+    the ones of the simulator: every module of the simulator holding an enumeration
+    of the recording gets the recorded one instead. Called by backend.setup(), before
+    the scripts import the types, only the first call installs them.
+    """
+
+    global _enums_installed
+
+    path = os.environ.get("SWD_REPLAY")
+    if _enums_installed or not path:
+        return
+
+    import importlib
+    import pkgutil
+
+    import smcdbusclient
+
+    with gzip.open(path, "rt") as f:
+        header = load_header(f, path)
+
+    modules = [importlib.import_module(f"smcdbusclient.{module.name}") for module in pkgutil.iter_modules(smcdbusclient.__path__)]
+    for name, definition in header["enums"].items():
+        cls = Enum(name, list(definition["members"].items()), module=definition["module"])
+        for module in modules:
+            current = vars(module).get(name)
+            if isinstance(current, type) and issubclass(current, Enum):
+                setattr(module, name, cls)
+
+    _enums_installed = True
+
+
+def smcdbusclient_classes() -> Dict[str, type]:
+    """Classes and enumerations of the smcdbusclient modules, by name."""
+
+    import importlib
+
+    from commissioning import CLIENTS
+
+    classes = {}
+    for module, _ in CLIENTS.values():
+        for name, value in vars(importlib.import_module(module)).items():
+            if isinstance(value, type):
+                classes.setdefault(name, value)
+    return classes
+
+
+class Replay:
+    """Recorded session answering the calls of the replay clients.
+
+    Each call takes its recorded duration divided by `speed`, 0 answering as fast
+    as possible.
+    """
+
+    def __init__(self, path: str, speed: float = 1.0):
+        self.path = path
+        self.speed = speed
+        self.header, calls = load_recording(path)
+        self.classes = smcdbusclient_classes()
+
+        # Recorded answers of every call, and the last one given
+        self.answers: Dict[tuple, Deque[list]] = {}
+        self.last: Dict[tuple, list] = {}
+        # Answers of the setters, by object (first argument)
+        self.setters: Dict[tuple, list] = {}
+
+        for call in calls:
+            _, _, instance_id, service, method, args = call[:6]
+            self.answers.setdefault(call_key(instance_id, service, method, args), deque()).append(call)
+            if not method.startswith("get"):
+                self.setters.setdefault(call_key(instance_id, service, method, args[:1]), call)
+
+        # Number of calls answered
+        self.replayed = 0
+        self._lock = threading.Lock()
+
+    def client(self, instance_id: str, service: str) -> "ReplayClient":
+        return ReplayClient(self, instance_id, service)
+
+    def answer(self, instance_id: str, service: str, method: str, args: tuple) -> list:
+        """Recorded call answering a call."""
+
+        key = call_key(instance_id, service, method, encode(list(args)))
+        with self._lock:
+            self.replayed += 1
+            answers = self.answers.get(key)
+            if answers:
+                self.last[key] = answers.popleft()
+                return self.last[key]
+            if key in self.last:
+                return self.last[key]
+
+            if not method.startswith("get"):
+                call = self.setters.get(call_key(instance_id, service, method, encode(list(args[:1]))))
+                if call is not None:
+                    return call
+
+        raise ReplayError(f"{instance_id} {service}.{method}({key[3][1:-1]}) is not in {self.path}")
+
+    def call(self, instance_id: str, service: str, method: str, args: tuple):
+        _, duration, _, _, _, _, result, error = self.answer(instance_id, service, method, args)
+        if self.speed:
+            time.sleep(duration / self.speed)
+
+        if error is not None:
+            raise RecordedError(f"{error[0]}: {error[1]}")
+        return decode(result, self.classes)
+
+
+class ReplayClient:
+    """D-Bus client of an instance, answered by a recorded session."""
+
+    def __init__(self, replay: Replay, instance_id: str, service: str):
+        self._replay = replay
+        self._instance_id = instance_id
+        self._service = service
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args):
+            return self._replay.call(self._instance_id, self._service, name, args)
+
+        return call
+
+
+_replay: Optional[Replay] = None
+_replay_lock = threading.Lock()
+
+
+def default_replay() -> Replay:
+    """Session of the SWD_REPLAY file, replayed at the SWD_REPLAY_SPEED speed."""
+
+    global _replay
+
+    with _replay_lock:
+        if _replay is None:
+            path = os.environ.get("SWD_REPLAY")
+            if not path:
+                raise ReplayError("SWD_REPLAY must be set with the replay backend")
+            _replay = Replay(path, float(os.environ.get("SWD_REPLAY_SPEED", "1")))
+        return _replay
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    import argparse
+
+    import tracing
+
+    parser = argparse.ArgumentParser(description="Print the summary of a recording of D-Bus calls")
+    parser.add_argument("recording", help="recording written with SWD_RECORD")
+    parser.add_argument("--count", type=int, default=20, help="number of calls printed (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    header, calls = load_recording(args.recording)
+    print(f"Recorded on {header['created']}: {' '.join(header['argv'])}")
+    duration = max((call[0] + call[1] for call in calls), default=0.0)
+    print(f"{len(calls)} calls of {len({call[2] for call in calls})} instance(s) in {duration:.3f}s\n")
+
+    spans = []
+    for start, duration, instance_id, service, method, call_args, result, error in calls:
+        result = result["t"][-1] if isinstance(result, dict) and "t" in result else result
+        spans.append(
+            {
+                "instance_id": instance_id,
+                "name": f"{method}({json.dumps(call_args)[1:-1]})",
+                "method": method,
+                "error": error[0] if error is not None else tracing.error_code(result),
+                "duration": duration * 1000,
+            }
+        )
+    tracing.print_summary(spans, args.count)
+
+
+if __name__ == "__main__":
+    try:
+        main(sys.argv[1:])
+    except ReplayError as e:
+        print(e)
+        sys.exit(1)
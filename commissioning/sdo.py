@@ -0,0 +1,411 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+"""Read-only SDO client on a SocketCAN interface, a fast path for the checks.
+
+The objects with a standard CANopen layout (PDO communication and mapping
+parameters, polarity, velocity ramps and the raw "od" entries) are read with SDO
+uploads on the CAN bus, instead of a D-Bus call to swd-services per object. The
+results are built as the D-Bus getters return them, so that the snapshot and the
+checks are the same. The network, manufacturer and safety objects, SRDOs included
+as their getter returns the signature computed by the motor, keep being read over
+D-Bus.
+
+The uploads use the block protocol, the server switching to an expedited upload
+for the small objects, and fall back to the expedited and segmented protocols
+when the server does not implement the block transfers. A receiver thread
+dispatches the responses by node, so that the transfers of several nodes are in
+flight at the same time: the transfers of one node run one after the other, as
+its SDO server expects.
+"""
+
+import binascii
+import queue
+import select
+import socket
+import struct
+import threading
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# COB-IDs of the default SDO channel: request to node N is 0x600 + N, response 0x580 + N
+SDO_REQUEST = 0x600
+SDO_RESPONSE = 0x580
+
+# struct can_frame of SocketCAN
+CAN_FRAME = struct.Struct("=IB3x8s")
+# CAN_EFF_FLAG, CAN_RTR_FLAG and CAN_ERR_FLAG, set in the mask of the filters to only receive standard data frames
+CAN_FLAGS = 0xE0000000
+
+# Command specifiers, in the first byte of the SDO frames
+CCS_UPLOAD_INITIATE = 0x40
+CCS_UPLOAD_SEGMENT = 0x60
+CCS_BLOCK_UPLOAD = 0xA0
+CCS_ABORT = 0x80
+SCS_UPLOAD_SEGMENT = 0x00
+SCS_UPLOAD_INITIATE = 0x40
+SCS_BLOCK_UPLOAD = 0xC0
+
+# Client subcommands of the block upload
+BLOCK_UPLOAD_END = 0x01
+BLOCK_UPLOAD_ACK = 0x02
+BLOCK_UPLOAD_START = 0x03
+BLOCK_UPLOAD_CRC = 0x04
+
+# Largest object the server uploads without block transfer
+PROTOCOL_SWITCH_THRESHOLD = 4
+
+# Abort codes
+ABORT_TOGGLE = 0x05030000
+ABORT_TIMEOUT = 0x05040000
+ABORT_COMMAND = 0x05040001
+ABORT_CRC = 0x05040004
+
+# Error code of a successful D-Bus call, see commissioning.check()
+ERROR_NONE = 1
+
+# Size in bytes of the object types
+SIZES = {"UInt8": 1, "UInt16": 2, "UInt32": 4, "Int8": 1, "Int16": 2, "Int32": 4}
+
+# CAN ID in the COB-ID of a PDO
+COB_ID_CAN_ID = 0x7FF
+
+
+class SDOError(Exception):
+    """Raised when an SDO transfer fails."""
+
+
+class SDOAbort(SDOError):
+    """Raised when an SDO transfer is aborted, `code` being the abort code."""
+
+    def __init__(self, code: int, index: int, subindex: int):
+        super().__init__(f"0x{index:04X}_{subindex:02X} aborted with 0x{code:08X}")
+        self.code = code
+
+
+class CANBus:
+    """Raw CAN socket on a SocketCAN interface, e.g. can0 or vcan0.
+
+    `filters` are the (CAN ID, mask) of the standard data frames received, all the
+    frames being received without filter.
+    """
+
+    def __init__(self, channel: str, filters: Sequence[Tuple[int, int]] = ()):
+        self.channel = channel
+        self.socket = socket.socket(socket.AF_CAN, socket.SOCK_RAW, socket.CAN_RAW)
+        if filters:
+            data = b"".join(struct.pack("=II", can_id, mask | CAN_FLAGS) for can_id, mask in filters)
+            self.socket.setsockopt(socket.SOL_CAN_RAW, socket.CAN_RAW_FILTER, data)
+        self.socket.bind((channel,))
+
+    def send(self, can_id: int, data: bytes):
+        self.socket.send(CAN_FRAME.pack(can_id, len(data), data.ljust(8, b"\0")))
+
+    def recv(self, timeout: float) -> Optional[Tuple[int, bytes]]:
+        """Next frame as (CAN ID, data), None after `timeout` seconds without frame."""
+
+        ready, _, _ = select.select([self.socket], [], [], timeout)
+        if not ready:
+            return None
+        can_id, size, data = CAN_FRAME.unpack(self.socket.recv(CAN_FRAME.size))
+        return can_id, data[:size]
+
+    def close(self):
+        self.socket.close()
+
+
+class _Node:
+    """Transfers of one node: one at a time, and the responses received for it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.responses: "queue.Queue[bytes]" = queue.Queue()
+        self.block = True
+
+
+class SDOClient:
+    """SDO client of the nodes of a CAN bus.
+
+    `bus` sends and receives the frames, see CANBus. Every response must arrive
+    within `timeout` seconds. `block_size` is the number of segments of a block
+    upload acknowledged at once.
+    """
+
+    def __init__(self, bus, timeout: float = 0.5, block_size: int = 127, block: bool = True):
+        self.bus = bus
+        self.timeout = timeout
+        self.block_size = block_size
+        self.block = block
+
+        self._nodes: Dict[int, _Node] = {}
+        self._nodes_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._closed = threading.Event()
+
+        self._receiver = threading.Thread(target=self._receive, name="sdo-receiver", daemon=True)
+        self._receiver.start()
+
+    def close(self):
+        self._closed.set()
+        self._receiver.join()
+        self.bus.close()
+
+    def _node(self, node_id: int) -> _Node:
+        with self._nodes_lock:
+            if node_id not in self._nodes:
+                self._nodes[node_id] = _Node()
+                self._nodes[node_id].block = self.block
+            return self._nodes[node_id]
+
+    def _receive(self):
+        while not self._closed.is_set():
+            frame = self.bus.recv(0.1)
+            if frame is None:
+                continue
+
+            can_id, data = frame
+            with self._nodes_lock:
+                node = self._nodes.get(can_id - SDO_RESPONSE)
+            if node is not None and len(data) == 8:
+                node.responses.put(data)
+
+    # Frames
+
+    def _send(self, node_id: int, data: bytes):
+        with self._send_lock:
+            self.bus.send(SDO_REQUEST + node_id, data.ljust(8, b"\0"))
+
+    def _abort(self, node_id: int, index: int, subindex: int, code: int):
+        self._send(node_id, bytes([CCS_ABORT]) + struct.pack("<HBI", index, subindex, code))
+
+    def _response(self, node_id: int, node: _Node, index: int, subindex: int, wait: bool = False) -> Optional[bytes]:
+        """Next response of the node, None on timeout when `wait` is set."""
+
+        try:
+            data = node.responses.get(timeout=self.timeout)
+        except queue.Empty:
+            if wait:
+                return None
+            self._abort(node_id, index, subindex, ABORT_TIMEOUT)
+            raise SDOError(f"0x{index:04X}_{subindex:02X} of node {node_id} timed out")
+
+        if data[0] == CCS_ABORT:
+            raise SDOAbort(struct.unpack_from("<I", data, 4)[0], index, subindex)
+        return data
+
+    def _unexpected(self, node_id: int, index: int, subindex: int, data: bytes, code: int = ABORT_COMMAND):
+        self._abort(node_id, index, subindex, code)
+        raise SDOError(f"0x{index:04X}_{subindex:02X} of node {node_id}: unexpected response {data.hex()}")
+
+    # Uploads
+
+    def upload(self, node_id: int, index: int, subindex: int) -> bytes:
+        """Read an entry of the object dictionary of a node, return its raw data."""
+
+        node = self._node(node_id)
+        with node.lock:
+            # Drop the late responses of a previous transfer
+            while not node.responses.empty():
+                node.responses.get_nowait()
+
+            if node.block:
+                try:
+                    return self._block_upload(node_id, node, index, subindex)
+                except SDOAbort as e:
+                    if e.code != ABORT_COMMAND:
+                        raise
+                    # The server does not implement the block transfers
+                    node.block = False
+
+            request = struct.pack("<BHB4x", CCS_UPLOAD_INITIATE, index, subindex)
+            self._send(node_id, request)
+            return self._upload(node_id, node, index, subindex, self._response(node_id, node, index, subindex))
+
+    def _upload(self, node_id: int, node: _Node, index: int, subindex: int, response: bytes) -> bytes:
+        """End of an expedited or segmented upload, from the response of the server to its initiation."""
+
+        if response[0] & 0xE0 != SCS_UPLOAD_INITIATE or struct.unpack_from("<HB", response, 1) != (index, subindex):
+            self._unexpected(node_id, index, subindex, response)
+
+        if response[0] & 0x02:
+            # Expedited: the data is in the response, its size indicated or not
+            size = 4 - (response[0] >> 2 & 0x03) if response[0] & 0x01 else 4
+            return bytes(response[4 : 4 + size])
+
+        data = bytearray()
+        toggle = 0
+        while True:
+            self._send(node_id, bytes([CCS_UPLOAD_SEGMENT | toggle << 4]))
+            segment = self._response(node_id, node, index, subindex)
+            if segment[0] & 0xE0 != SCS_UPLOAD_SEGMENT:
+                self._unexpected(node_id, index, subindex, segment)
+            if segment[0] >> 4 & 0x01 != toggle:
+                self._unexpected(node_id, index, subindex, segment, ABORT_TOGGLE)
+
+            data += segment[1 : 8 - (segment[0] >> 1 & 0x07)]
+            if segment[0] & 0x01:
+                return bytes(data)
+            toggle ^= 1
+
+    def _block_upload(self, node_id: int, node: _Node, index: int, subindex: int) -> bytes:
+        request = struct.pack("<BHBBB2x", CCS_BLOCK_UPLOAD | BLOCK_UPLOAD_CRC, index, subindex, self.block_size, PROTOCOL_SWITCH_THRESHOLD)
+        self._send(node_id, request)
+        response = self._response(node_id, node, index, subindex)
+
+        if response[0] & 0xE0 == SCS_UPLOAD_INITIATE:
+            # The server switched to the expedited or segmented upload
+            return self._upload(node_id, node, index, subindex, response)
+        if response[0] & 0xE1 != SCS_BLOCK_UPLOAD or struct.unpack_from("<HB", response, 1) != (index, subindex):
+            self._unexpected(node_id, index, subindex, response)
+
+        crc = bool(response[0] & 0x04)
+        size = struct.unpack_from("<I", response, 4)[0] if response[0] & 0x02 else None
+
+        self._send(node_id, bytes([CCS_BLOCK_UPLOAD | BLOCK_UPLOAD_START]))
+
+        data = bytearray()
+        last = False
+        lost = False
+        while not last:
+            # Segments of one block, only the ones received in sequence are kept:
+            # the server sends again the segments after the acknowledged one
+            ackseq = 0
+            while True:
+                segment = self._response(node_id, node, index, subindex, wait=not lost)
+                if segment is None:
+                    # The end of the block was lost, acknowledge the segments received once
+                    lost = True
+                    break
+                seqno = segment[0] & 0x7F
+                if seqno == ackseq + 1:
+                    ackseq = seqno
+                    data += segment[1:8]
+                    last = bool(segment[0] & 0x80)
+                    lost = False
+                if segment[0] & 0x80 or seqno >= self.block_size:
+                    break
+            self._send(node_id, bytes([CCS_BLOCK_UPLOAD | BLOCK_UPLOAD_ACK, ackseq, self.block_size]))
+
+        end = self._response(node_id, node, index, subindex)
+        if end[0] & 0xE3 != SCS_BLOCK_UPLOAD | 0x01:
+            self._unexpected(node_id, index, subindex, end)
+
+        # Bytes of the last segment without data
+        del data[len(data) - (end[0] >> 2 & 0x07) :]
+        if crc and binascii.crc_hqx(bytes(data), 0) != struct.unpack_from("<H", end, 1)[0]:
+            self._abort(node_id, index, subindex, ABORT_CRC)
+            raise SDOError(f"0x{index:04X}_{subindex:02X} of node {node_id}: CRC error")
+        if size is not None and len(data) != size:
+            self._unexpected(node_id, index, subindex, end)
+
+        self._send(node_id, bytes([CCS_BLOCK_UPLOAD | BLOCK_UPLOAD_END]))
+        return bytes(data)
+
+
+# SDO clients of the process, by interface
+_clients: Dict[str, SDOClient] = {}
+_clients_lock = threading.Lock()
+
+
+def client(channel: str) -> SDOClient:
+    """SDO client of a SocketCAN interface, shared by every node checked by the process."""
+
+    with _clients_lock:
+        if channel not in _clients:
+            _clients[channel] = SDOClient(CANBus(channel, [(SDO_RESPONSE, 0x780)]))
+        return _clients[channel]
+
+
+# =======================
+#        OBJECTS
+# =======================
+
+
+class SDONode:
+    """Objects of a node read with SDO uploads, as the D-Bus getters return them."""
+
+    GETTERS = [
+        "getTPDOCommunicationParameters",
+        "getRPDOCommunicationParameters",
+        "getTPDOMappingParameters",
+        "getRPDOMappingParameters",
+        "getPolarityParameters",
+        "getVelocityModeParameters",
+    ] + [f"getValue{kind}" for kind in SIZES]
+
+    def __init__(self, sdo_client: SDOClient, node_id: int):
+        self.client = sdo_client
+        self.node_id = node_id
+
+    def upload(self, index: int, subindex: int, kind: str) -> int:
+        data = self.client.upload(self.node_id, index, subindex)
+        return int.from_bytes(data[: SIZES[kind]], "little", signed=kind.startswith("Int"))
+
+    def supports(self, operation) -> bool:
+        return operation.getter in self.GETTERS
+
+    def read_object(self, operation) -> Tuple:
+        """Read an object, return the raw result of its getter."""
+
+        from dcf import COB_ID_INVALID, COB_ID_NO_RTR, PDO_COMMUNICATION, PDO_MAPPING_OFFSET, POLARITY, VL_VELOCITY_ACCELERATION, VL_VELOCITY_DECELERATION
+        from smcdbusclient.communication import PDOCommunicationParameters, PDOMappingParameters, PDOTransmissionType
+        from smcdbusclient.pds import PolarityParameters
+        from smcdbusclient.velocity_mode import VelocityModeParameters
+
+        getter = operation.getter
+
+        for direction, first in PDO_COMMUNICATION.items():
+            if getter == f"get{direction}CommunicationParameters":
+                index = first + operation.args[0].value
+                cob_id = self.upload(index, 1, "UInt32")
+
+                params = PDOCommunicationParameters()
+                params.cob_id.can_id = cob_id & COB_ID_CAN_ID
+                params.cob_id.valid = not cob_id & COB_ID_INVALID
+                params.cob_id.flag = bool(cob_id & COB_ID_NO_RTR)
+                params.transmission_type = PDOTransmissionType(self.upload(index, 2, "UInt8"))
+                return params, ERROR_NONE
+
+            if getter == f"get{direction}MappingParameters":
+                index = first + PDO_MAPPING_OFFSET + operation.args[0].value
+
+                params = PDOMappingParameters()
+                params.nb = self.upload(index, 0, "UInt8")
+                params.items = [self.upload(index, sub, "UInt32") for sub in range(1, params.nb + 1)]
+                return params, ERROR_NONE
+
+        if getter == "getPolarityParameters":
+            polarity = self.upload(POLARITY, 0, "UInt8")
+
+            params = PolarityParameters()
+            params.velocity_polarity = bool(polarity & 0x40)
+            params.position_polarity = bool(polarity & 0x80)
+            return params, ERROR_NONE
+
+        if getter == "getVelocityModeParameters":
+            params = VelocityModeParameters()
+            params.vl_velocity_acceleration_delta_speed = self.upload(VL_VELOCITY_ACCELERATION, 1, "UInt32")
+            params.vl_velocity_acceleration_delta_time = self.upload(VL_VELOCITY_ACCELERATION, 2, "UInt16")
+            params.vl_velocity_deceleration_delta_speed = self.upload(VL_VELOCITY_DECELERATION, 1, "UInt32")
+            params.vl_velocity_deceleration_delta_time = self.upload(VL_VELOCITY_DECELERATION, 2, "UInt16")
+            return params, ERROR_NONE
+
+        od_index = operation.args[0]
+        return self.upload(od_index >> 16, (od_index >> 8) & 0xFF, getter[len("getValue") :]), ERROR_NONE
+
+    def read(self, swd, operations: List) -> Dict[str, Tuple]:
+        """Raw results of the getters of the operations, by operation name.
+
+        An object whose upload fails is read by its D-Bus service instead.
+        """
+
+        from commissioning import check
+
+        results = {}
+        for operation in operations:
+            try:
+                results[operation.name] = self.read_object(operation)
+            except SDOError as e:
+                check(f"read {operation.name} with SDOs ({e})", 0, fatal=False)
+                results[operation.name] = operation.call(swd)
+        return results
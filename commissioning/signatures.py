@@ -0,0 +1,133 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+"""Fast verification of the safety parameters with their signatures.
+
+The motor signs its STO, SLS and SRDO parameters, and returns the signature with
+the parameters. Once a motor passed a full check, the signatures of its safety
+parameters are recorded for the profile. A fast check then only reads the signed
+objects, the safety control word mappings and the SRDO configuration validity,
+and compares the signatures: only the objects whose signature differs are
+compared field by field, and their signature is recorded again when their fields
+match. The safety control word mappings are not signed, they are always compared
+field by field.
+
+The SRDOs which are not configured by the profile are not read: they are only
+covered by the SRDO configuration validity, which the motor clears whenever an
+SRDO or a safety control word mapping is modified. The other objects of the
+profile (network, PDOs, ramps, ...) are not checked at all.
+"""
+
+import json
+import os
+from typing import Dict, List, Optional
+
+from commissioning import SWDClients, check
+
+import profiles
+from profiles import Plan
+
+from snapshot import Snapshot, read_snapshot
+
+import verification
+from verification import Mismatch
+
+# Directory of the recorded signatures
+SIGNATURES_DIR = os.path.join(os.path.dirname(profiles.CACHE_DIR), "signatures")
+
+
+def signature_path(instance_id: str, plan: Plan) -> str:
+    return os.path.join(SIGNATURES_DIR, f"{instance_id}-{plan.hash}.json")
+
+
+def signed_operations(plan: Plan) -> List[profiles.Operation]:
+    return [operation for operation in plan.operations if operation.signature_index is not None]
+
+
+def fast_operations(plan: Plan) -> List[profiles.Operation]:
+    """Objects read by a fast check: the signed ones, and the safety control word mappings."""
+    return [operation for operation in plan.operations if operation.signature_index is not None or operation.kind == "swm"]
+
+
+def save_signatures(snapshot: Snapshot, plan: Plan):
+    """Record the signatures of the snapshot of a motor which matches the plan."""
+
+    signatures = {}
+    for operation in signed_operations(plan):
+        result = snapshot.results[operation.name]
+        if result[-1] != 1:
+            return
+        signatures[operation.name] = operation.signature(result)
+
+    write_signatures(snapshot.instance_id, plan, signatures)
+
+
+def write_signatures(instance_id: str, plan: Plan, signatures: Dict[str, int]):
+    path = signature_path(instance_id, plan)
+    try:
+        os.makedirs(SIGNATURES_DIR, exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump(signatures, f, indent=4)
+        os.replace(path + ".tmp", path)
+    except OSError:
+        # The signatures only speed up the next checks
+        pass
+
+
+def load_signatures(instance_id: str, plan: Plan) -> Optional[Dict[str, int]]:
+    try:
+        with open(signature_path(instance_id, plan)) as f:
+            signatures = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if any(operation.name not in signatures for operation in signed_operations(plan)):
+        return None
+    return signatures
+
+
+def fast_verify(swd: SWDClients, plan: Plan, workers: Optional[int] = None) -> Optional[List[Mismatch]]:
+    """Verify the safety parameters of the motor with their signatures.
+
+    Returns the mismatches of the safety parameters and of the safety control word
+    mappings, or None when a full check is needed: no recorded signatures, or an
+    invalid SRDO configuration. `workers` is the number of D-Bus services queried
+    concurrently, see read_snapshot().
+    """
+
+    signatures = load_signatures(swd.instance_id, plan)
+    if signatures is None:
+        return None
+
+    valid, error = swd.srdo_client.getSRDOConfigurationValidity()
+    check("getSRDOConfigurationValidity()", error)
+    if not valid:
+        return None
+
+    operations = fast_operations(plan)
+    snapshot = read_snapshot(swd, operations, workers)
+
+    mismatches = []
+    refreshed = False
+    for operation in operations:
+        result = snapshot.results[operation.name]
+        signed = operation.signature_index is not None
+        if signed and result[-1] == 1 and operation.signature(result) == signatures[operation.name]:
+            check(f"check {operation.name} signature", 1)
+            continue
+
+        # Signature differs, or object not signed: compare the fields
+        operation_mismatches = verification.verify_operation(snapshot, operation)
+        check(f"check {operation.name} parameters", 0 if operation_mismatches else 1, fatal=False)
+        mismatches += operation_mismatches
+
+        if signed and result[-1] == 1 and not operation_mismatches:
+            # The fields match again, the next checks compare the new signature
+            signatures[operation.name] = operation.signature(result)
+            refreshed = True
+
+    if refreshed:
+        write_signatures(swd.instance_id, plan, signatures)
+
+    return mismatches
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""SDO servers of simulated motors on a SocketCAN interface.
+
+Stand-in for the SDO servers of the motors, to test the SDO reads of the checks
+(see sdo.py) without motor. Every node serves the stored values of a simulated
+device, as read after a reset, the devices being configured with SWD_SIM_CONFIG
+like the simulated D-Bus clients (see smcdbusclient/simulator.py). Only uploads
+are served, the downloads are aborted:
+
+    sudo modprobe vcan
+    sudo ip link add dev vcan0 type vcan
+    sudo ip link set up vcan0
+    SWD_SIM_CONFIG='{"state_dir": "/tmp/swd-sim"}' python3 commissioning/sim/sdo_server.py vcan0 swd_left:4 swd_right:5
+
+The behaviour of the servers is scripted with the options: latency of the
+responses, block transfers not implemented, or used even for the small objects,
+segmented instead of expedited uploads, aborted or unanswered entries.
+"""
+
+import argparse
+import binascii
+import heapq
+import os
+import struct
+import sys
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from smcdbusclient import simulator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import sdo
+
+# Abort codes
+ABORT_READ_ONLY = 0x06010002
+ABORT_NO_OBJECT = 0x06020000
+ABORT_NO_SUBINDEX = 0x06090011
+
+
+class SDOServer:
+    """SDO servers of simulated devices, by node ID.
+
+    `aborts` maps (index, subindex) entries to the abort code answered to their
+    upload, and the uploads of the `dropped` entries are never answered.
+    """
+
+    def __init__(
+        self,
+        nodes: Dict[int, str],
+        block: bool = True,
+        switch: bool = True,
+        expedited: bool = True,
+        latency: float = 0.0,
+        aborts: Optional[Dict[Tuple[int, int], int]] = None,
+        dropped: Optional[Set[Tuple[int, int]]] = None,
+    ):
+        self.nodes = nodes
+        self.block = block
+        self.switch = switch
+        self.expedited = expedited
+        self.latency = latency
+        self.aborts = aborts or {}
+        self.dropped = dropped or set()
+
+        # Transfer in progress, by node ID
+        self.transfers: Dict[int, dict] = {}
+
+        # Number of requests, by node ID
+        self.requests: Dict[int, int] = {node_id: 0 for node_id in nodes}
+
+    def value(self, node_id: int, index: int, subindex: int) -> bytes:
+        key = (index, subindex)
+        if key not in simulator.LAYOUT:
+            code = ABORT_NO_SUBINDEX if any(other[0] == index for other in simulator.LAYOUT) else ABORT_NO_OBJECT
+            raise sdo.SDOAbort(code, index, subindex)
+        if key in self.aborts:
+            raise sdo.SDOAbort(self.aborts[key], index, subindex)
+
+        # A new device reads the stored values, which other processes may have changed
+        kind = simulator.LAYOUT[key][0]
+        value = simulator.Device(self.nodes[node_id]).stored[key]
+        return int(value).to_bytes(simulator.TYPES[kind] // 8, "little", signed=not kind.startswith("U"))
+
+    def handle(self, node_id: int, request: bytes) -> List[bytes]:
+        """Responses of a node to an SDO request."""
+
+        self.requests[node_id] += 1
+        command = request[0]
+        index, subindex = struct.unpack_from("<HB", request, 1)
+
+        try:
+            if command == sdo.CCS_ABORT:
+                self.transfers.pop(node_id, None)
+                return []
+
+            if command == sdo.CCS_UPLOAD_INITIATE or command & 0xE3 == sdo.CCS_BLOCK_UPLOAD:
+                if (index, subindex) in self.dropped:
+                    return []
+                if command & 0xE0 == sdo.CCS_BLOCK_UPLOAD:
+                    if not self.block:
+                        raise sdo.SDOAbort(sdo.ABORT_COMMAND, index, subindex)
+                    return self.initiate_block(node_id, index, subindex, request)
+                return self.initiate(node_id, index, subindex, self.value(node_id, index, subindex))
+
+            transfer = self.transfers.get(node_id)
+            if transfer is None:
+                # Download, or segment of a transfer which was not initiated
+                code = ABORT_READ_ONLY if command & 0xE0 == 0x20 else sdo.ABORT_COMMAND
+                raise sdo.SDOAbort(code, index, subindex)
+
+            index, subindex = transfer["index"], transfer["subindex"]
+            if transfer["protocol"] == "segmented" and command & 0xE0 == sdo.CCS_UPLOAD_SEGMENT:
+                return self.segment(node_id, transfer, command >> 4 & 0x01)
+            if transfer["protocol"] == "block" and command & 0xE0 == sdo.CCS_BLOCK_UPLOAD:
+                return self.block_command(node_id, transfer, request)
+            raise sdo.SDOAbort(sdo.ABORT_COMMAND, index, subindex)
+
+        except sdo.SDOAbort as e:
+            self.transfers.pop(node_id, None)
+            return [bytes([sdo.CCS_ABORT]) + struct.pack("<HBI", index, subindex, e.code)]
+
+    def initiate(self, node_id: int, index: int, subindex: int, data: bytes) -> List[bytes]:
+        if self.expedited and len(data) <= 4:
+            return [struct.pack("<BHB", sdo.SCS_UPLOAD_INITIATE | (4 - len(data)) << 2 | 0x03, index, subindex) + data.ljust(4, b"\0")]
+
+        self.transfers[node_id] = {"protocol": "segmented", "index": index, "subindex": subindex, "data": data, "position": 0, "toggle": 0}
+        return [struct.pack("<BHBI", sdo.SCS_UPLOAD_INITIATE | 0x01, index, subindex, len(data))]
+
+    def segment(self, node_id: int, transfer: dict, toggle: int) -> List[bytes]:
+        if toggle != transfer["toggle"]:
+            raise sdo.SDOAbort(sdo.ABORT_TOGGLE, transfer["index"], transfer["subindex"])
+
+        data = transfer["data"][transfer["position"] : transfer["position"] + 7]
+        transfer["position"] += len(data)
+        transfer["toggle"] ^= 1
+        last = transfer["position"] >= len(transfer["data"])
+        if last:
+            del self.transfers[node_id]
+        return [bytes([sdo.SCS_UPLOAD_SEGMENT | toggle << 4 | (7 - len(data)) << 1 | last]) + data]
+
+    def initiate_block(self, node_id: int, index: int, subindex: int, request: bytes) -> List[bytes]:
+        block_size, threshold = request[4], request[5]
+        if not 1 <= block_size <= 127:
+            raise sdo.SDOAbort(0x05040002, index, subindex)
+
+        data = self.value(node_id, index, subindex)
+        if self.switch and len(data) <= threshold:
+            return self.initiate(node_id, index, subindex, data)
+
+        crc = bool(request[0] & sdo.BLOCK_UPLOAD_CRC)
+        self.transfers[node_id] = {"protocol": "block", "index": index, "subindex": subindex, "data": data, "position": 0, "block_size": block_size, "crc": crc}
+        return [struct.pack("<BHBI", sdo.SCS_BLOCK_UPLOAD | (0x04 if crc else 0) | 0x02, index, subindex, len(data))]
+
+    def block_command(self, node_id: int, transfer: dict, request: bytes) -> List[bytes]:
+        subcommand = request[0] & 0x03
+        data = transfer["data"]
+
+        if subcommand == sdo.BLOCK_UPLOAD_ACK:
+            # The segments after the acknowledged one are sent again
+            transfer["position"] += request[1] * 7
+            transfer["block_size"] = request[2]
+            if transfer["position"] >= len(data):
+                unused = (7 - len(data) % 7) % 7
+                crc = binascii.crc_hqx(data, 0) if transfer["crc"] else 0
+                return [struct.pack("<BH", sdo.SCS_BLOCK_UPLOAD | unused << 2 | 0x01, crc)]
+        elif subcommand == sdo.BLOCK_UPLOAD_END:
+            del self.transfers[node_id]
+            return []
+        elif subcommand != sdo.BLOCK_UPLOAD_START:
+            raise sdo.SDOAbort(sdo.ABORT_COMMAND, transfer["index"], transfer["subindex"])
+
+        segments = []
+        for seqno in range(1, transfer["block_size"] + 1):
+            segment = data[transfer["position"] + 7 * (seqno - 1) : transfer["position"] + 7 * seqno]
+            last = transfer["position"] + 7 * seqno >= len(data)
+            segments.append(bytes([seqno | (0x80 if last else 0)]) + segment)
+            if last:
+                break
+        return segments
+
+    def serve(self, bus, duration: Optional[float] = None):
+        """Answer the requests received on `bus`, for `duration` seconds or forever.
+
+        The responses are sent `latency` seconds after their request, the nodes
+        answering independently of each other.
+        """
+
+        end = None if duration is None else time.monotonic() + duration
+        pending: List[Tuple[float, int, int, bytes]] = []
+        sequence = 0
+
+        while end is None or time.monotonic() < end:
+            timeout = 0.1 if not pending else max(0.0, pending[0][0] - time.monotonic())
+            frame = bus.recv(timeout)
+
+            if frame is not None:
+                can_id, data = frame
+                node_id = can_id - sdo.SDO_REQUEST
+                if node_id in self.nodes and len(data) == 8:
+                    for response in self.handle(node_id, data):
+                        # The sequence keeps the responses of a node in order
+                        heapq.heappush(pending, (time.monotonic() + self.latency, sequence, node_id, response))
+                        sequence += 1
+
+            while pending and pending[0][0] <= time.monotonic():
+                _, _, node_id, response = heapq.heappop(pending)
+                bus.send(sdo.SDO_RESPONSE + node_id, response.ljust(8, b"\0"))
+
+
+def parse_entry(text: str) -> Tuple[int, int]:
+    """Entry given as 0xIIII_SS."""
+
+    index, _, subindex = text.partition("_")
+    return int(index, 16), int(subindex or "0", 16)
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Serve the objects of simulated motors with SDOs on a SocketCAN interface")
+    parser.add_argument("interface", help="SocketCAN interface, e.g. vcan0")
+    parser.add_argument("nodes", nargs="+", metavar="INSTANCE:NODE_ID", help="simulated device served by every node, e.g. swd_left:4")
+    parser.add_argument("--latency", type=float, default=0.0, help="delay of every response, in seconds (default: %(default)s)")
+    parser.add_argument("--no-block", action="store_true", help="abort the block uploads, as a server without block transfers")
+    parser.add_argument("--no-switch", action="store_true", help="use the block transfers even for the objects of 4 bytes or less")
+    parser.add_argument("--segmented", action="store_true", help="use segmented uploads instead of expedited ones")
+    parser.add_argument("--abort", action="append", default=[], metavar="0xIIII_SS[=CODE]", help="abort the uploads of an entry, with CODE (default: object does not exist)")
+    parser.add_argument("--drop", action="append", default=[], metavar="0xIIII_SS", help="never answer the uploads of an entry")
+    args = parser.parse_args(argv)
+
+    nodes = {}
+    for node in args.nodes:
+        instance_id, _, node_id = node.rpartition(":")
+        if not instance_id or not node_id.isdigit() or not 1 <= int(node_id) <= 127:
+            parser.error(f"{node}: INSTANCE:NODE_ID expected")
+        nodes[int(node_id)] = instance_id
+
+    aborts = {}
+    for abort in args.abort:
+        entry, _, code = abort.partition("=")
+        aborts[parse_entry(entry)] = int(code, 0) if code else ABORT_NO_OBJECT
+
+    server = SDOServer(nodes, not args.no_block, not args.no_switch, not args.segmented, args.latency, aborts, {parse_entry(entry) for entry in args.drop})
+    bus = sdo.CANBus(args.interface, [(sdo.SDO_REQUEST, 0x780)])
+    print(f"Serving {', '.join(f'{instance_id} as node {node_id}' for node_id, instance_id in nodes.items())} on {args.interface}")
+
+    try:
+        server.serve(bus)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bus.close()
+        print(f"{sum(server.requests.values())} request(s) served")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
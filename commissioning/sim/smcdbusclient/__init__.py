@@ -0,0 +1,10 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+"""In-process simulator of the smcdbusclient library.
+
+The modules mirror the ones of smcdbusclient, with clients backed by the
+simulated devices of `simulator` instead of the D-Bus services of swd-services.
+It is selected by setting SWD_BACKEND=sim, see backend.py.
+"""
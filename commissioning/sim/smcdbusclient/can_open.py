@@ -0,0 +1,79 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from typing import Optional, Tuple
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+
+def entry(od_index: int, kind: str) -> Optional[Tuple[int, int]]:
+    """(index, subindex) of an object given as 0xIIII_SS_LL, if it exists with this type."""
+
+    key = (od_index >> 16, (od_index >> 8) & 0xFF)
+    if key not in simulator.LAYOUT or simulator.LAYOUT[key][0] != kind:
+        return None
+    return key
+
+
+class CANOpenDBusClient(SimulatedClient):
+    def _get(self, od_index: int, kind: str):
+        key = entry(od_index, kind)
+        if key is None:
+            return 0, simulator.ERROR_FAILED
+        return self._device.read(*key), simulator.ERROR_NONE
+
+    def _set(self, od_index: int, kind: str, value: int):
+        key = entry(od_index, kind)
+        if key is None:
+            return simulator.ERROR_FAILED
+        return self._device.write({key: value})
+
+    @simulated
+    def getValueUInt8(self, od_index: int):
+        return self._get(od_index, "UInt8")
+
+    @simulated
+    def setValueUInt8(self, od_index: int, value: int):
+        return self._set(od_index, "UInt8", value)
+
+    @simulated
+    def getValueUInt16(self, od_index: int):
+        return self._get(od_index, "UInt16")
+
+    @simulated
+    def setValueUInt16(self, od_index: int, value: int):
+        return self._set(od_index, "UInt16", value)
+
+    @simulated
+    def getValueUInt32(self, od_index: int):
+        return self._get(od_index, "UInt32")
+
+    @simulated
+    def setValueUInt32(self, od_index: int, value: int):
+        return self._set(od_index, "UInt32", value)
+
+    @simulated
+    def getValueInt8(self, od_index: int):
+        return self._get(od_index, "Int8")
+
+    @simulated
+    def setValueInt8(self, od_index: int, value: int):
+        return self._set(od_index, "Int8", value)
+
+    @simulated
+    def getValueInt16(self, od_index: int):
+        return self._get(od_index, "Int16")
+
+    @simulated
+    def setValueInt16(self, od_index: int, value: int):
+        return self._set(od_index, "Int16", value)
+
+    @simulated
+    def getValueInt32(self, od_index: int):
+        return self._get(od_index, "Int32")
+
+    @simulated
+    def setValueInt32(self, od_index: int, value: int):
+        return self._set(od_index, "Int32", value)
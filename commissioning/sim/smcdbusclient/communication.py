@@ -0,0 +1,177 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from enum import Enum
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+
+class BitTiming(Enum):
+    BT_1000 = 0
+    BT_800 = 1
+    BT_500 = 2
+    BT_250 = 3
+    BT_125 = 4
+    BT_50 = 6
+    BT_20 = 7
+    BT_10 = 8
+
+
+PDOTransmissionType = Enum(
+    "PDOTransmissionType",
+    [("PDO_SYNC_ACYCLIC", 0)] + [(f"PDO_SYNC_{n}", n) for n in range(1, 241)] + [("PDO_EVENT_MANUFACTURER", 254), ("PDO_EVENT_PROFILE", 255)],
+    module=__name__,
+)
+
+
+class PDOId(Enum):
+    PDO_1 = 0
+    PDO_2 = 1
+    PDO_3 = 2
+    PDO_4 = 3
+
+
+class BlocId(Enum):
+    ALL = 0
+    COMMUNICATION = 1
+    APPLICATION = 2
+    MANUFACTURER = 3
+
+
+class NetworkParameters:
+    def __init__(self):
+        self.node_id = 0
+        self.bit_timing = BitTiming.BT_500
+        self.rt_activated = False
+
+
+class COBId:
+    def __init__(self):
+        self.can_id = 0
+        self.valid = False
+        self.flag = False
+
+
+class PDOCommunicationParameters:
+    def __init__(self):
+        self.cob_id = COBId()
+        self.transmission_type = PDOTransmissionType.PDO_SYNC_1
+
+
+class PDOMappingParameters:
+    def __init__(self):
+        self.nb = 0
+        self.items = []
+
+
+class CommunicationDBusClient(SimulatedClient):
+    @simulated
+    def getNetworkParameters(self):
+        node_id, bit_timing, rt_activated = self._device.read_all([(simulator.NETWORK, sub) for sub in (1, 2, 3)])
+
+        params = NetworkParameters()
+        params.node_id = node_id
+        params.bit_timing = BitTiming(bit_timing)
+        params.rt_activated = bool(rt_activated)
+        return params, simulator.ERROR_NONE
+
+    @simulated
+    def setNetworkParameters(self, params: NetworkParameters):
+        if not 1 <= params.node_id <= 127:
+            return simulator.ERROR_FAILED
+        return self._device.write({(simulator.NETWORK, 1): params.node_id, (simulator.NETWORK, 2): params.bit_timing.value, (simulator.NETWORK, 3): params.rt_activated})
+
+    # PDO communication parameters
+
+    def _get_communication(self, index: int):
+        cob_id, transmission_type = self._device.read_all([(index, 1), (index, 2)])
+
+        params = PDOCommunicationParameters()
+        params.cob_id.can_id = cob_id & simulator.COB_ID_CAN_ID
+        params.cob_id.valid = not cob_id & simulator.COB_ID_INVALID
+        params.cob_id.flag = bool(cob_id & simulator.COB_ID_NO_RTR)
+        params.transmission_type = PDOTransmissionType(transmission_type)
+        return params, simulator.ERROR_NONE
+
+    def _set_communication(self, index: int, params: PDOCommunicationParameters):
+        if not 0 < params.cob_id.can_id <= simulator.COB_ID_CAN_ID:
+            return simulator.ERROR_FAILED
+
+        cob_id = params.cob_id.can_id
+        if not params.cob_id.valid:
+            cob_id |= simulator.COB_ID_INVALID
+        if params.cob_id.flag:
+            cob_id |= simulator.COB_ID_NO_RTR
+        return self._device.write({(index, 1): cob_id, (index, 2): params.transmission_type.value})
+
+    @simulated
+    def getTPDOCommunicationParameters(self, pdo: PDOId):
+        return self._get_communication(simulator.TPDO_COMMUNICATION + pdo.value)
+
+    @simulated
+    def setTPDOCommunicationParameters(self, pdo: PDOId, params: PDOCommunicationParameters):
+        return self._set_communication(simulator.TPDO_COMMUNICATION + pdo.value, params)
+
+    @simulated
+    def getRPDOCommunicationParameters(self, pdo: PDOId):
+        return self._get_communication(simulator.RPDO_COMMUNICATION + pdo.value)
+
+    @simulated
+    def setRPDOCommunicationParameters(self, pdo: PDOId, params: PDOCommunicationParameters):
+        return self._set_communication(simulator.RPDO_COMMUNICATION + pdo.value, params)
+
+    # PDO mapping parameters
+
+    def _get_mapping(self, index: int):
+        values = self._device.read_all([(index, sub) for sub in range(0, 9)])
+
+        params = PDOMappingParameters()
+        params.nb = values[0]
+        params.items = values[1 : 1 + params.nb]
+        return params, simulator.ERROR_NONE
+
+    def _set_mapping(self, index: int, params: PDOMappingParameters):
+        items = list(params.items)[: params.nb]
+        if len(items) != params.nb or params.nb > 8:
+            return simulator.ERROR_FAILED
+
+        # Every mapped object must exist with the mapped size, in at most 64 bits
+        for item in items:
+            mapped = simulator.LAYOUT.get((item >> 16, (item >> 8) & 0xFF))
+            if mapped is None or simulator.TYPES[mapped[0]] != item & 0xFF:
+                return simulator.ERROR_FAILED
+        if sum(item & 0xFF for item in items) > 64:
+            return simulator.ERROR_FAILED
+
+        values = {(index, 0): params.nb}
+        for sub in range(1, 9):
+            values[(index, sub)] = items[sub - 1] if sub <= len(items) else 0
+        return self._device.write(values)
+
+    @simulated
+    def getTPDOMappingParameters(self, pdo: PDOId):
+        return self._get_mapping(simulator.TPDO_MAPPING + pdo.value)
+
+    @simulated
+    def setTPDOMappingParameters(self, pdo: PDOId, params: PDOMappingParameters):
+        return self._set_mapping(simulator.TPDO_MAPPING + pdo.value, params)
+
+    @simulated
+    def getRPDOMappingParameters(self, pdo: PDOId):
+        return self._get_mapping(simulator.RPDO_MAPPING + pdo.value)
+
+    @simulated
+    def setRPDOMappingParameters(self, pdo: PDOId, params: PDOMappingParameters):
+        return self._set_mapping(simulator.RPDO_MAPPING + pdo.value, params)
+
+    # Non-volatile memory
+
+    @simulated
+    def storeParameters(self, bloc: BlocId):
+        return self._device.store(bloc.name)
+
+    @simulated
+    def restoreDefaultParameters(self, bloc: BlocId):
+        return self._device.restore_defaults(bloc.name)
@@ -0,0 +1,31 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+
+class SWDParameters:
+    def __init__(self):
+        self.motctrl_speed_pid_p = 0
+        self.motctrl_speed_pid_i = 0
+        self.motctrl_speed_pid_d = 0
+
+
+class ManufacturerDBusClient(SimulatedClient):
+    @simulated
+    def getSWDParameters(self):
+        params = SWDParameters()
+        params.motctrl_speed_pid_p, params.motctrl_speed_pid_i, params.motctrl_speed_pid_d = self._device.read_all([(simulator.SWD, sub) for sub in (1, 2, 3)])
+        return params, simulator.ERROR_NONE
+
+    @simulated
+    def setSWDParameters(self, params: SWDParameters):
+        return self._device.write(
+            {
+                (simulator.SWD, 1): params.motctrl_speed_pid_p,
+                (simulator.SWD, 2): params.motctrl_speed_pid_i,
+                (simulator.SWD, 3): params.motctrl_speed_pid_d,
+            }
+        )
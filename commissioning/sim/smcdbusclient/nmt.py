@@ -0,0 +1,45 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from enum import Enum
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+
+class NMTCommand(Enum):
+    START = 1
+    STOP = 2
+    ENTER_PRE_OPERATIONAL = 128
+    RESET_NODE = 129
+    RESET_COMMUNICATION = 130
+
+
+class NMTState(Enum):
+    BOOT_UP = 0
+    STOPPED = 4
+    OPERATIONAL = 5
+    PRE_OPERATIONAL = 127
+
+
+class NMTDBusClient(SimulatedClient):
+    available_during_boot = True
+
+    @simulated
+    def getNMTState(self):
+        return NMTState[self._device.nmt_state()], simulator.ERROR_NONE
+
+    @simulated
+    def setNMTState(self, command: NMTCommand):
+        if command in (NMTCommand.RESET_NODE, NMTCommand.RESET_COMMUNICATION):
+            self._device.reset(communication_only=command == NMTCommand.RESET_COMMUNICATION)
+            return simulator.ERROR_NONE
+
+        if self._device.booting():
+            return simulator.ERROR_FAILED
+
+        states = {NMTCommand.START: "OPERATIONAL", NMTCommand.STOP: "STOPPED", NMTCommand.ENTER_PRE_OPERATIONAL: "PRE_OPERATIONAL"}
+        with self._device.lock:
+            self._device.state = states[command]
+        return simulator.ERROR_NONE
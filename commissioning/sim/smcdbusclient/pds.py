@@ -0,0 +1,32 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+# Bits of the polarity object (0x607E)
+POSITION_POLARITY = 1 << 7
+VELOCITY_POLARITY = 1 << 6
+
+
+class PolarityParameters:
+    def __init__(self):
+        self.velocity_polarity = False
+        self.position_polarity = False
+
+
+class PDSDBusClient(SimulatedClient):
+    @simulated
+    def getPolarityParameters(self):
+        polarity = self._device.read(simulator.POLARITY, 0)
+
+        params = PolarityParameters()
+        params.velocity_polarity = bool(polarity & VELOCITY_POLARITY)
+        params.position_polarity = bool(polarity & POSITION_POLARITY)
+        return params, simulator.ERROR_NONE
+
+    @simulated
+    def setPolarityParameters(self, params: PolarityParameters):
+        polarity = (VELOCITY_POLARITY if params.velocity_polarity else 0) | (POSITION_POLARITY if params.position_polarity else 0)
+        return self._device.write({(simulator.POLARITY, 0): polarity})
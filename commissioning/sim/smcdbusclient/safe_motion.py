@@ -0,0 +1,89 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from enum import Enum
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+
+class STOId(Enum):
+    STO_1 = 0
+
+
+class SLSId(Enum):
+    SLS_1 = 0
+
+
+class SafetyControlWordId(Enum):
+    CAN_1 = 0
+    CAN_2 = 1
+    SAFEIN_1 = 2
+
+
+class SafetyFunctionId(Enum):
+    NONE = 0
+    STO = 1
+    SDIP_1 = 2
+    SDIN_1 = 3
+    SLS_1 = 4
+
+
+class SafetyWordMapping:
+    def __init__(self):
+        for i in range(0, 8):
+            setattr(self, f"safety_function_{i}", SafetyFunctionId.NONE)
+
+
+class STOParameters:
+    def __init__(self):
+        self.restart_acknowledge_behavior = False
+
+
+class SLSParameters:
+    def __init__(self):
+        self.velocity_limit_u32 = 0
+        self.time_to_velocity_monitoring = 0
+        self.time_for_velocity_in_limits = 0
+
+
+class SafeMotionDBusClient(SimulatedClient):
+    @simulated
+    def getSafetyControlWordMapping(self, scw: SafetyControlWordId):
+        functions = self._device.read_all([(simulator.SAFETY_CONTROLWORD_MAPPING + scw.value, sub) for sub in range(1, 9)])
+
+        mapping = SafetyWordMapping()
+        for i, function in enumerate(functions):
+            setattr(mapping, f"safety_function_{i}", SafetyFunctionId(function))
+        return mapping, simulator.ERROR_NONE
+
+    @simulated
+    def setSafetyControlWordMapping(self, scw: SafetyControlWordId, mapping: SafetyWordMapping):
+        index = simulator.SAFETY_CONTROLWORD_MAPPING + scw.value
+        return self._device.write({(index, i + 1): getattr(mapping, f"safety_function_{i}").value for i in range(0, 8)})
+
+    @simulated
+    def getSTOParameters(self, sto: STOId):
+        index = simulator.STO + sto.value
+
+        params = STOParameters()
+        params.restart_acknowledge_behavior = bool(self._device.read(index, 1))
+        return params, self._device.signature(index), simulator.ERROR_NONE
+
+    @simulated
+    def setSTOParameters(self, sto: STOId, params: STOParameters):
+        return self._device.write({(simulator.STO + sto.value, 1): params.restart_acknowledge_behavior})
+
+    @simulated
+    def getSLSParameters(self, sls: SLSId):
+        index = simulator.SLS + sls.value
+
+        params = SLSParameters()
+        params.velocity_limit_u32, params.time_to_velocity_monitoring, params.time_for_velocity_in_limits = self._device.read_all([(index, sub) for sub in (1, 2, 3)])
+        return params, self._device.signature(index), simulator.ERROR_NONE
+
+    @simulated
+    def setSLSParameters(self, sls: SLSId, params: SLSParameters):
+        index = simulator.SLS + sls.value
+        return self._device.write({(index, 1): params.velocity_limit_u32, (index, 2): params.time_to_velocity_monitoring, (index, 3): params.time_for_velocity_in_limits})
@@ -0,0 +1,425 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+"""Simulated SWD devices, shared by the simulated D-Bus clients.
+
+Every instance ID is a device with an object dictionary of (index, subindex)
+entries holding integers:
+
+    od          volatile values, read and written by the clients
+    stored      non-volatile values, copied to `od` on a reset
+    defaults    factory values, copied to `stored` by restoreDefaultParameters()
+
+The standard CANopen objects use their CiA 301/304/402 indices. The SWD specific
+objects (network, safety and motor control parameters) use indices which only
+exist in the simulator, see LAYOUT.
+
+The simulator is configured with `configure()`, or with the SWD_SIM_CONFIG
+environment variable holding the same options in JSON (or the path of a JSON file):
+
+    latency     delay of every call, in seconds (default: 0)
+    latencies   delay per method name, e.g. {"storeParameters": 0.2}
+    errors      probability of an error per method name, e.g. {"setSRDOParameters": 0.1}
+    boot_time   duration of a reset, during which the node is in BOOT_UP (default: 0.05)
+    store_time  duration of storeParameters(BlocId.ALL), smaller blocks are stored in
+                proportion of their number of objects (default: 0)
+    seed        seed of the error injection
+    state_dir   directory where the stored values of every device are saved, so they
+                survive the process like the flash memory of a motor
+"""
+
+import binascii
+import functools
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+ERROR_NONE = 1
+ERROR_FAILED = 0
+
+# Size in bits of the object types
+TYPES = {"UInt8": 8, "UInt16": 16, "UInt32": 32, "Int8": 8, "Int16": 16, "Int32": 32}
+
+# Storage blocks of the objects: (first index, last index)
+BLOCKS = {
+    "COMMUNICATION": (0x1000, 0x1FFF),
+    "MANUFACTURER": (0x2000, 0x5FFF),
+    "APPLICATION": (0x6000, 0x9FFF),
+}
+
+FACTORY_NODE_ID = 0x7F
+
+# Objects of the SWD specific parameters
+NETWORK = 0x2000
+SWD = 0x2100
+SAFETY_CONTROLWORD = 0x2620
+SAFETY_CONTROLWORD_MAPPING = 0x2630
+STO = 0x2640
+SLS = 0x2650
+
+# CANopen objects
+IDENTITY = 0x1018
+IDENTITY_SERIAL_NUMBER = 4
+ERROR_BEHAVIOR = 0x1029
+RPDO_COMMUNICATION = 0x1400
+RPDO_MAPPING = 0x1600
+TPDO_COMMUNICATION = 0x1800
+TPDO_MAPPING = 0x1A00
+SRDO_COMMUNICATION = 0x1301
+SRDO_CONFIGURATION_VALID = 0x13FE
+SRDO_CONFIGURATION_VALID_VALUE = 0xA5
+STATUSWORD = 0x6041
+POSITION_ACTUAL_VALUE = 0x6064
+POLARITY = 0x607E
+VL_VELOCITY_ACCELERATION = 0x6048
+VL_VELOCITY_DECELERATION = 0x6049
+
+PDO_COUNT = 4
+SRDO_COUNT = 16
+SAFETY_CONTROLWORD_COUNT = 3
+STO_COUNT = 1
+SLS_COUNT = 1
+
+# COB-ID bits of the PDO communication parameters
+COB_ID_INVALID = 1 << 31
+COB_ID_NO_RTR = 1 << 30
+COB_ID_CAN_ID = 0x7FF
+
+
+def _layout() -> Dict[Tuple[int, int], Tuple[str, int]]:
+    """(index, subindex) -> (type, factory value) of every object of the device."""
+
+    layout = {
+        (NETWORK, 1): ("UInt8", FACTORY_NODE_ID),  # node ID
+        (NETWORK, 2): ("UInt8", 2),  # bit timing, BT_500
+        (NETWORK, 3): ("UInt8", 0),  # real time activated
+        (SWD, 1): ("Int32", 200),  # speed PID, P
+        (SWD, 2): ("Int32", 10),  # speed PID, I
+        (SWD, 3): ("Int32", 0),  # speed PID, D
+        (SAFETY_CONTROLWORD, 1): ("UInt8", 0),
+        (SAFETY_CONTROLWORD, 2): ("UInt8", 0),
+        (IDENTITY, 1): ("UInt32", 0),  # vendor ID
+        (IDENTITY, 2): ("UInt32", 0),  # product code
+        (IDENTITY, 3): ("UInt32", 0),  # revision number
+        (IDENTITY, IDENTITY_SERIAL_NUMBER): ("UInt32", 0),  # serial number, see Device
+        (ERROR_BEHAVIOR, 1): ("UInt8", 0),
+        (ERROR_BEHAVIOR, 2): ("UInt8", 0),
+        (SRDO_CONFIGURATION_VALID, 0): ("UInt8", 0),
+        (STATUSWORD, 0): ("UInt16", 0),
+        (POSITION_ACTUAL_VALUE, 0): ("Int32", 0),
+        (POLARITY, 0): ("UInt8", 0),
+    }
+
+    # Predefined connection set
+    for pdo in range(PDO_COUNT):
+        for communication, mapping, base in [(TPDO_COMMUNICATION, TPDO_MAPPING, 0x180), (RPDO_COMMUNICATION, RPDO_MAPPING, 0x200)]:
+            layout[(communication + pdo, 1)] = ("UInt32", COB_ID_NO_RTR | (base + 0x100 * pdo + FACTORY_NODE_ID))
+            layout[(communication + pdo, 2)] = ("UInt8", 255)
+            layout[(mapping + pdo, 0)] = ("UInt8", 0)
+            for sub in range(1, 9):
+                layout[(mapping + pdo, sub)] = ("UInt32", 0)
+
+    # SRDOs, subindex 1 is 0 when the SRDO is not valid
+    for srdo in range(SRDO_COUNT):
+        index = SRDO_COMMUNICATION + srdo
+        layout[(index, 1)] = ("UInt8", 0)
+        layout[(index, 2)] = ("UInt16", 25)  # SCT
+        layout[(index, 3)] = ("UInt8", 20)  # SRVT
+        layout[(index, 5)] = ("UInt32", 0x101 + 2 * srdo)
+        layout[(index, 6)] = ("UInt32", 0x102 + 2 * srdo)
+
+    for scw in range(SAFETY_CONTROLWORD_COUNT):
+        for sub in range(1, 9):
+            layout[(SAFETY_CONTROLWORD_MAPPING + scw, sub)] = ("UInt8", 0)
+
+    for sto in range(STO_COUNT):
+        layout[(STO + sto, 1)] = ("UInt8", 1)  # restart acknowledge behavior
+
+    for sls in range(SLS_COUNT):
+        layout[(SLS + sls, 1)] = ("UInt32", 0)  # velocity limit
+        layout[(SLS + sls, 2)] = ("UInt16", 0)  # time to velocity monitoring
+        layout[(SLS + sls, 3)] = ("UInt16", 0)  # time for velocity in limits
+
+    for index in [VL_VELOCITY_ACCELERATION, VL_VELOCITY_DECELERATION]:
+        layout[(index, 1)] = ("UInt32", 1000)  # delta speed
+        layout[(index, 2)] = ("UInt16", 1)  # delta time
+
+    return layout
+
+
+LAYOUT = _layout()
+
+
+def in_range(kind: str, value: int) -> bool:
+    bits = TYPES[kind]
+    if kind.startswith("U"):
+        return 0 <= value < 1 << bits
+    return -(1 << (bits - 1)) <= value < 1 << (bits - 1)
+
+
+def block_of(index: int) -> str:
+    for block, (first, last) in BLOCKS.items():
+        if first <= index <= last:
+            return block
+    raise KeyError(f"0x{index:04X}")
+
+
+# =======================
+#     CONFIGURATION
+# =======================
+
+CONFIG = {"latency": 0.0, "latencies": {}, "errors": {}, "boot_time": 0.05, "store_time": 0.0, "seed": None, "state_dir": None}
+
+_lock = threading.Lock()
+_devices: Dict[str, "Device"] = {}
+_random = random.Random()
+
+
+def configure(**options):
+    """Update the configuration of the simulator, see the module documentation."""
+
+    for name, value in options.items():
+        if name not in CONFIG:
+            raise ValueError(f"unknown simulator option {name!r}")
+        CONFIG[name] = value
+
+    if "seed" in options:
+        _random.seed(options["seed"])
+
+
+def _load_environment():
+    config = os.environ.get("SWD_SIM_CONFIG")
+    if not config:
+        return
+
+    if not config.lstrip().startswith("{"):
+        with open(config) as f:
+            config = f.read()
+    configure(**json.loads(config))
+
+
+_load_environment()
+
+
+def device(instance_id: str) -> "Device":
+    """Simulated device of an instance, created on first use."""
+
+    with _lock:
+        if instance_id not in _devices:
+            _devices[instance_id] = Device(instance_id)
+        return _devices[instance_id]
+
+
+def devices() -> List["Device"]:
+    with _lock:
+        return list(_devices.values())
+
+
+def forget_devices():
+    """Drop every device, the next clients start from the stored values again."""
+
+    with _lock:
+        _devices.clear()
+
+
+def call_counts() -> Dict[str, int]:
+    """Number of calls per method name, over every device."""
+
+    counts: Dict[str, int] = {}
+    for dev in devices():
+        for name, count in dev.calls.items():
+            counts[name] = counts.get(name, 0) + count
+    return counts
+
+
+# =======================
+#        DEVICE
+# =======================
+
+
+class Device:
+    """Object dictionary and NMT state of one simulated motor."""
+
+    def __init__(self, instance_id: str):
+        self.instance_id = instance_id
+        self.lock = threading.RLock()
+
+        self.defaults = {key: value for key, (kind, value) in LAYOUT.items()}
+        self.defaults[(IDENTITY, IDENTITY_SERIAL_NUMBER)] = binascii.crc32(instance_id.encode())
+        self.stored = dict(self.defaults)
+        self._load()
+        self.od = dict(self.stored)
+
+        self.state = "PRE_OPERATIONAL"
+        self.boot_end = 0.0
+
+        # Number of calls per method name
+        self.calls: Dict[str, int] = {}
+
+    # Persistence of the stored values
+
+    def _path(self) -> Optional[str]:
+        if not CONFIG["state_dir"]:
+            return None
+        return os.path.join(CONFIG["state_dir"], f"{self.instance_id}.json")
+
+    def _load(self):
+        path = self._path()
+        if path is None or not os.path.isfile(path):
+            return
+
+        with open(path) as f:
+            for key, value in json.load(f).items():
+                index, sub = key.split("_")
+                if (int(index, 16), int(sub, 16)) in self.stored:
+                    self.stored[(int(index, 16), int(sub, 16))] = value
+
+    def _save(self):
+        path = self._path()
+        if path is None:
+            return
+
+        os.makedirs(CONFIG["state_dir"], exist_ok=True)
+        with open(path + ".tmp", "w") as f:
+            json.dump({f"{index:04X}_{sub:02X}": value for (index, sub), value in sorted(self.stored.items())}, f, indent=1)
+        os.replace(path + ".tmp", path)
+
+    # Object dictionary
+
+    def read(self, index: int, sub: int) -> int:
+        with self.lock:
+            return self.od[(index, sub)]
+
+    def read_all(self, keys: Iterable[Tuple[int, int]]) -> List[int]:
+        with self.lock:
+            return [self.od[key] for key in keys]
+
+    def write(self, values: Dict[Tuple[int, int], int]) -> int:
+        """Write several entries at once, none of them if one is invalid."""
+
+        for key, value in values.items():
+            if key not in LAYOUT or not in_range(LAYOUT[key][0], int(value)):
+                return ERROR_FAILED
+
+        with self.lock:
+            for key, value in values.items():
+                self.od[key] = int(value)
+                # Changing an SRDO or a safety mapping invalidates the SRDO configuration
+                index = key[0]
+                if SRDO_COMMUNICATION <= index < SRDO_COMMUNICATION + SRDO_COUNT or (SAFETY_CONTROLWORD_MAPPING <= index < SAFETY_CONTROLWORD_MAPPING + SAFETY_CONTROLWORD_COUNT):
+                    self.od[(SRDO_CONFIGURATION_VALID, 0)] = 0
+
+        return ERROR_NONE
+
+    def signature(self, index: int) -> int:
+        """CRC of the entries of an object, as a motor signs its safety parameters."""
+
+        with self.lock:
+            data = b"".join(self.od[key].to_bytes(TYPES[LAYOUT[key][0]] // 8, "little", signed=not LAYOUT[key][0].startswith("U")) for key in sorted(LAYOUT) if key[0] == index)
+        return binascii.crc_hqx(data, 0)
+
+    def _keys(self, block: str) -> List[Tuple[int, int]]:
+        if block == "ALL":
+            return list(LAYOUT)
+        return [key for key in LAYOUT if block_of(key[0]) == block]
+
+    def store(self, block: str) -> int:
+        keys = self._keys(block)
+        if CONFIG["store_time"]:
+            time.sleep(CONFIG["store_time"] * len(keys) / len(LAYOUT))
+
+        with self.lock:
+            for key in keys:
+                self.stored[key] = self.od[key]
+            self._save()
+        return ERROR_NONE
+
+    def restore_defaults(self, block: str) -> int:
+        # As CANopen 0x1011, the factory values are active after the next reset, the identity is kept
+        with self.lock:
+            for key in self._keys(block):
+                if key[0] != IDENTITY:
+                    self.stored[key] = self.defaults[key]
+            self._save()
+        return ERROR_NONE
+
+    def replace(self, serial_number: int):
+        """Replace the motor by a factory one with another serial number, e.g. after a repair."""
+
+        with self.lock:
+            self.stored = dict(self.defaults)
+            self.stored[(IDENTITY, IDENTITY_SERIAL_NUMBER)] = serial_number
+            self._save()
+            self.od = dict(self.stored)
+            self.state = "PRE_OPERATIONAL"
+
+    # NMT
+
+    def reset(self, communication_only: bool = False):
+        with self.lock:
+            for key in self._keys("COMMUNICATION" if communication_only else "ALL"):
+                self.od[key] = self.stored[key]
+            self.state = "BOOT_UP"
+            self.boot_end = time.monotonic() + CONFIG["boot_time"]
+
+    def nmt_state(self) -> str:
+        with self.lock:
+            if self.state == "BOOT_UP" and time.monotonic() >= self.boot_end:
+                self.state = "PRE_OPERATIONAL"
+            return self.state
+
+    def booting(self) -> bool:
+        return self.nmt_state() == "BOOT_UP"
+
+
+# =======================
+#        CLIENTS
+# =======================
+
+
+class SimulatedClient:
+    """Base class of the simulated D-Bus clients."""
+
+    # Whether the service answers while the node is rebooting
+    available_during_boot = False
+
+    def __init__(self, instance_id: str):
+        self.instance_id = instance_id
+        self._device = device(instance_id)
+
+
+def simulated(method):
+    """Add the latency, the call count and the error injection of the simulator to a client method.
+
+    An injected error skips the write of a setter, and replaces the error code of
+    the result of a getter.
+    """
+
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(client: SimulatedClient, *args):
+        dev = client._device
+        with dev.lock:
+            dev.calls[name] = dev.calls.get(name, 0) + 1
+
+        latency = CONFIG["latencies"].get(name, CONFIG["latency"])
+        if latency:
+            time.sleep(latency)
+
+        failed = (not client.available_during_boot and dev.booting()) or _random.random() < CONFIG["errors"].get(name, 0.0)
+
+        if failed and not name.startswith("get"):
+            return ERROR_FAILED
+
+        result = method(client, *args)
+
+        if failed:
+            return result[:-1] + (ERROR_FAILED,)
+        return result
+
+    return wrapper
@@ -0,0 +1,50 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from enum import Enum
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+SRDOId = Enum("SRDOId", [(f"SRDO_{n}", n) for n in range(1, simulator.SRDO_COUNT + 1)], module=__name__)
+
+
+class SRDOParameters:
+    def __init__(self):
+        self.can_id1 = 0
+        self.can_id2 = 0
+        self.valid = False
+        self.sct = 0
+        self.srvt = 0
+
+
+class SRDODBusClient(SimulatedClient):
+    @simulated
+    def getSRDOParameters(self, srdo: SRDOId):
+        """Return the SRDO ID, the parameters, their signature and the error code."""
+
+        index = simulator.SRDO_COMMUNICATION + srdo.value - 1
+        valid, sct, srvt, can_id1, can_id2 = self._device.read_all([(index, sub) for sub in (1, 2, 3, 5, 6)])
+
+        params = SRDOParameters()
+        params.valid = bool(valid)
+        params.sct = sct
+        params.srvt = srvt
+        params.can_id1 = can_id1
+        params.can_id2 = can_id2
+        return srdo, params, self._device.signature(index), simulator.ERROR_NONE
+
+    @simulated
+    def setSRDOParameters(self, srdo: SRDOId, params: SRDOParameters):
+        index = simulator.SRDO_COMMUNICATION + srdo.value - 1
+        return self._device.write({(index, 1): params.valid, (index, 2): params.sct, (index, 3): params.srvt, (index, 5): params.can_id1, (index, 6): params.can_id2})
+
+    @simulated
+    def getSRDOConfigurationValidity(self):
+        valid = self._device.read(simulator.SRDO_CONFIGURATION_VALID, 0) == simulator.SRDO_CONFIGURATION_VALID_VALUE
+        return valid, simulator.ERROR_NONE
+
+    @simulated
+    def setSRDOConfigurationValidity(self):
+        return self._device.write({(simulator.SRDO_CONFIGURATION_VALID, 0): simulator.SRDO_CONFIGURATION_VALID_VALUE})
@@ -0,0 +1,44 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from . import simulator
+from .simulator import SimulatedClient, simulated
+
+
+class VelocityModeParameters:
+    def __init__(self):
+        self.vl_velocity_acceleration_delta_speed = 0
+        self.vl_velocity_acceleration_delta_time = 1
+        self.vl_velocity_deceleration_delta_speed = 0
+        self.vl_velocity_deceleration_delta_time = 1
+
+
+class VelocityModeDBusClient(SimulatedClient):
+    @simulated
+    def getVelocityModeParameters(self):
+        acceleration = simulator.VL_VELOCITY_ACCELERATION
+        deceleration = simulator.VL_VELOCITY_DECELERATION
+        values = self._device.read_all([(acceleration, 1), (acceleration, 2), (deceleration, 1), (deceleration, 2)])
+
+        params = VelocityModeParameters()
+        (
+            params.vl_velocity_acceleration_delta_speed,
+            params.vl_velocity_acceleration_delta_time,
+            params.vl_velocity_deceleration_delta_speed,
+            params.vl_velocity_deceleration_delta_time,
+        ) = values
+        return params, simulator.ERROR_NONE
+
+    @simulated
+    def setVelocityModeParameters(self, params: VelocityModeParameters):
+        acceleration = simulator.VL_VELOCITY_ACCELERATION
+        deceleration = simulator.VL_VELOCITY_DECELERATION
+        return self._device.write(
+            {
+                (acceleration, 1): params.vl_velocity_acceleration_delta_speed,
+                (acceleration, 2): params.vl_velocity_acceleration_delta_time,
+                (deceleration, 1): params.vl_velocity_deceleration_delta_speed,
+                (deceleration, 2): params.vl_velocity_deceleration_delta_time,
+            }
+        )
@@ -0,0 +1,60 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from profiles import Operation
+
+
+class Snapshot:
+    """Objects of a motor read in one pass, by operation name.
+
+    Every entry is the raw result of the getter, so that the checks evaluate the
+    snapshot locally instead of calling the D-Bus services again.
+    """
+
+    def __init__(self, instance_id: str, results: Optional[Dict[str, Tuple]] = None):
+        self.instance_id = instance_id
+        self.results = results if results is not None else {}
+
+    def __contains__(self, operation: Operation) -> bool:
+        return operation.name in self.results
+
+    def read(self, operation: Operation) -> Tuple[Any, int]:
+        """Value and error code of an object, as `Operation.read()` would return them."""
+        return operation.parse(self.results[operation.name])
+
+
+def read_snapshot(swd, operations: List[Operation], workers: Optional[int] = None, sdo=None) -> Snapshot:
+    """Read every object of `operations`, e.g. all the operations of a plan.
+
+    The objects are grouped per D-Bus service: the calls to one service are issued
+    one after the other, while the services are queried concurrently, `workers` at
+    a time (default: all of them). When `sdo` is given, the objects it supports are
+    read with SDOs on the CAN bus, as one more service, see sdo.SDONode. Such a
+    snapshot is only meant for the checks: the objects to write are read over D-Bus.
+    """
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    services: Dict[str, List[Operation]] = {}
+    for operation in operations:
+        service = "sdo" if sdo is not None and sdo.supports(operation) else operation.client
+        services.setdefault(service, [])
+        if all(other.name != operation.name for other in services[service]):
+            services[service].append(operation)
+
+    def read_service(service: str, operations: List[Operation]) -> Dict[str, Tuple]:
+        if service == "sdo":
+            return sdo.read(swd, operations)
+        return {operation.name: operation.call(swd) for operation in operations}
+
+    snapshot = Snapshot(swd.instance_id)
+
+    # Messages of the reads are prefixed with the instance, see commissioning.check()
+    with ThreadPoolExecutor(max_workers=workers or len(services) or 1, thread_name_prefix=swd.instance_id) as executor:
+        for results in executor.map(read_service, services.keys(), services.values()):
+            snapshot.results.update(results)
+
+    return snapshot
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Compact binary snapshot files, for audit and regression.
+
+A snapshot file stores every field of every object read in a `Snapshot`, flattened
+into named scalar values. The layout is columnar, so two files can be compared by
+comparing raw memory blocks of the memory-mapped files, and only the fields which
+differ are unpacked:
+
+    header      magic, version, field count, time, node ID, instance, profile hash
+    keys        field count x uint64, 64-bit hash of the field names, sorted
+    values      field count x int64
+    types       field count x uint8 (int, bool, enum, float)
+    offsets     (field count + 1) x uint32, offsets of the names in the name table
+    names       UTF-8 field names, e.g. "SRDOParameters(SRDO_9).can_id1"
+"""
+
+import argparse
+from enum import Enum
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+
+MAGIC = b"SWDSNAP\0"
+VERSION = 1
+
+# magic, version, field count, time (ns), node ID, instance ID, profile hash
+HEADER = struct.Struct("<8sHIQB32s32s")
+
+TYPE_INT = 0
+TYPE_BOOL = 1
+TYPE_ENUM = 2
+TYPE_FLOAT = 3
+
+# Number of values compared at once when looking for differences
+BLOCK = 64
+
+
+def field_key(name: str) -> int:
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), "little")
+
+
+def flatten(value, name: str, fields: List[Tuple[str, int, int]]):
+    """Append the scalar fields of `value` to `fields`, as (name, type, int64 value)."""
+
+    if isinstance(value, Enum):
+        if isinstance(value.value, int):
+            fields.append((name, TYPE_ENUM, value.value))
+    elif isinstance(value, bool):
+        fields.append((name, TYPE_BOOL, int(value)))
+    elif isinstance(value, int):
+        # Values are stored as int64, larger unsigned values wrap around
+        fields.append((name, TYPE_INT, (value + 2**63) % 2**64 - 2**63))
+    elif isinstance(value, float):
+        fields.append((name, TYPE_FLOAT, struct.unpack("<q", struct.pack("<d", value))[0]))
+    elif isinstance(value, (list, tuple)):
+        for i, item in enumerate(value):
+            flatten(item, f"{name}[{i}]", fields)
+    else:
+        attributes = getattr(value, "__dict__", None) or {slot: getattr(value, slot) for slot in getattr(value, "__slots__", ()) if hasattr(value, slot)}
+        for attribute in sorted(attributes):
+            if not attribute.startswith("_"):
+                flatten(attributes[attribute], f"{name}.{attribute}", fields)
+
+
+def snapshot_fields(snapshot, plan) -> List[Tuple[str, int, int]]:
+    """Flatten every object of the snapshot read for the operations of `plan`."""
+
+    fields = []
+    for operation in plan.operations:
+        if operation not in snapshot:
+            continue
+
+        result = snapshot.results[operation.name]
+        value, error = operation.parse(result)
+
+        flatten(value, operation.name, fields)
+        flatten(error, f"{operation.name}.error", fields)
+        # Other elements of the result, e.g. the signature of the safety parameters
+        for i, item in enumerate(result[:-1]):
+            if i != operation.value_index:
+                flatten(item, f"{operation.name}.result[{i}]", fields)
+
+    return fields
+
+
+def write_snapshot_file(path: str, fields: List[Tuple[str, int, int]], instance_id: str = "", node_id: int = 0, profile_hash: str = ""):
+    with open(path, "wb") as f:
+        f.write(snapshot_bytes(fields, instance_id, node_id, profile_hash))
+
+
+def snapshot_bytes(fields: List[Tuple[str, int, int]], instance_id: str = "", node_id: int = 0, profile_hash: str = "") -> bytes:
+    """Content of the snapshot file of `fields`."""
+
+    fields = sorted(fields, key=lambda field: field_key(field[0]))
+    names = [field[0].encode() for field in fields]
+
+    offsets = [0]
+    for name in names:
+        offsets.append(offsets[-1] + len(name))
+
+    count = len(fields)
+    return b"".join(
+        [
+            HEADER.pack(MAGIC, VERSION, count, time.time_ns(), node_id, instance_id.encode()[:32], bytes.fromhex(profile_hash or "00" * 32)),
+            struct.pack(f"<{count}Q", *(field_key(field[0]) for field in fields)),
+            struct.pack(f"<{count}q", *(field[2] for field in fields)),
+            struct.pack(f"<{count}B", *(field[1] for field in fields)),
+            struct.pack(f"<{count + 1}I", *offsets),
+        ]
+        + names
+    )
+
+
+def save_snapshot(path: str, snapshot, plan):
+    with open(path, "wb") as f:
+        f.write(snapshot_content(snapshot, plan))
+
+
+def snapshot_content(snapshot, plan) -> bytes:
+    """Content of the snapshot file of the snapshot read for `plan`."""
+
+    return snapshot_bytes(snapshot_fields(snapshot, plan), snapshot.instance_id, plan.node_id, plan.hash)
+
+
+class SnapshotFile:
+    """Memory-mapped snapshot file, or snapshot file content when `data` is given."""
+
+    def __init__(self, path: str, data: Optional[bytes] = None):
+        self._mmap = None
+        if data is None:
+            with open(path, "rb") as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._mmap
+
+        data = memoryview(data)
+        if len(data) < HEADER.size:
+            raise ValueError(f"{path}: not a snapshot file")
+
+        magic, version, count, timestamp, node_id, instance_id, profile_hash = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a snapshot file")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported snapshot version {version}")
+
+        self.path = path
+        self.count = count
+        self.time = timestamp / 1e9
+        self.node_id = node_id
+        self.instance_id = instance_id.rstrip(b"\0").decode()
+        self.profile_hash = profile_hash.hex()
+
+        # Every array must fit in the file, and the names must fit in the name table
+        offset = HEADER.size + 17 * count
+        if len(data) < offset + 4 * (count + 1):
+            raise ValueError(f"{path}: truncated snapshot file")
+        self._offsets = struct.unpack_from(f"<{count + 1}I", data, offset)
+        if self._offsets[0] != 0 or any(self._offsets[i] > self._offsets[i + 1] for i in range(0, count)):
+            raise ValueError(f"{path}: invalid snapshot file")
+        if len(data) < offset + 4 * (count + 1) + self._offsets[-1]:
+            raise ValueError(f"{path}: truncated snapshot file")
+
+        offset = HEADER.size
+        self.keys = data[offset : offset + 8 * count]
+        offset += 8 * count
+        self.values = data[offset : offset + 8 * count]
+        offset += 8 * count
+        self.types = data[offset : offset + count]
+        offset += count
+        offset += 4 * (count + 1)
+        self._names = data[offset : offset + self._offsets[-1]]
+
+    def name(self, i: int) -> str:
+        return bytes(self._names[self._offsets[i] : self._offsets[i + 1]]).decode()
+
+    def key(self, i: int) -> int:
+        return int.from_bytes(self.keys[8 * i : 8 * i + 8], "little")
+
+    def value(self, i: int):
+        value = int.from_bytes(self.values[8 * i : 8 * i + 8], "little", signed=True)
+        kind = self.types[i]
+        if kind == TYPE_BOOL:
+            return bool(value)
+        if kind == TYPE_FLOAT:
+            return struct.unpack("<d", struct.pack("<q", value))[0]
+        return value
+
+    def fields(self) -> Iterator[Tuple[str, object]]:
+        for i in range(0, self.count):
+            yield self.name(i), self.value(i)
+
+    def close(self):
+        self.keys = self.values = self.types = self._names = None
+        if self._mmap is not None:
+            self._mmap.close()
+
+
+def diff_snapshot_files(a: SnapshotFile, b: SnapshotFile) -> List[Tuple[str, Optional[object], Optional[object]]]:
+    """Compare two snapshot files field by field.
+
+    Returns the (name, value in a, value in b) of every field which differs, with
+    None for a field missing in one of the files.
+    """
+
+    diff = []
+
+    if a.keys == b.keys:
+        # Same fields: compare the values block by block, and only unpack differing blocks
+        if a.values == b.values and a.types == b.types:
+            return diff
+
+        for start in range(0, a.count, BLOCK):
+            end = min(start + BLOCK, a.count)
+            if a.values[8 * start : 8 * end] == b.values[8 * start : 8 * end] and a.types[start:end] == b.types[start:end]:
+                continue
+
+            for i in range(start, end):
+                if a.values[8 * i : 8 * i + 8] != b.values[8 * i : 8 * i + 8] or a.types[i] != b.types[i]:
+                    diff.append((a.name(i), a.value(i), b.value(i)))
+
+        return diff
+
+    # Different fields: walk both sorted key arrays
+    i = j = 0
+    while i < a.count or j < b.count:
+        key_a = a.key(i) if i < a.count else None
+        key_b = b.key(j) if j < b.count else None
+
+        if key_b is None or (key_a is not None and key_a < key_b):
+            diff.append((a.name(i), a.value(i), None))
+            i += 1
+        elif key_a is None or key_b < key_a:
+            diff.append((b.name(j), None, b.value(j)))
+            j += 1
+        else:
+            if a.values[8 * i : 8 * i + 8] != b.values[8 * j : 8 * j + 8] or a.types[i] != b.types[j]:
+                diff.append((a.name(i), a.value(i), b.value(j)))
+            i += 1
+            j += 1
+
+    return diff
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Save, show and compare motor snapshot files")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    save = subparsers.add_parser("save", help="read a motor and save its snapshot")
+    save.add_argument("swd_id", choices=["left", "right"], help="swd motor")
+    save.add_argument("path", help="snapshot file")
+    save.add_argument("--profile", help="configuration profile of the motor (default: profile of the motor)")
+
+    show = subparsers.add_parser("show", help="print the fields of a snapshot file")
+    show.add_argument("path", help="snapshot file")
+
+    diff = subparsers.add_parser("diff", help="compare two snapshot files")
+    diff.add_argument("a", help="snapshot file")
+    diff.add_argument("b", help="snapshot file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "save":
+        import commissioning
+        import profiles
+        from snapshot import read_snapshot
+
+        plan = profiles.compile_profile(args.profile or profiles.PROFILES[args.swd_id])
+
+        commissioning.load_dbus_session()
+        swd = commissioning.SWDClients(plan.instance_id)
+
+        start = time.monotonic()
+        save_snapshot(args.path, read_snapshot(swd, plan.operations), plan)
+        print(f"{args.path} : {os.path.getsize(args.path)} bytes, read in {time.monotonic() - start:.3f}s")
+
+    elif args.command == "show":
+        snapshot = SnapshotFile(args.path)
+        print(f"instance {snapshot.instance_id}, node {snapshot.node_id}, {time.ctime(snapshot.time)}, profile {snapshot.profile_hash[:12]}")
+        for name, value in sorted(snapshot.fields()):
+            print(f"{name} = {value}")
+
+    else:
+        a = SnapshotFile(args.a)
+        b = SnapshotFile(args.b)
+        diff = diff_snapshot_files(a, b)
+        for name, value_a, value_b in sorted(diff, key=lambda field: field[0]):
+            print(f"{name} : {'-' if value_a is None else value_a} -> {'-' if value_b is None else value_b}")
+        if diff:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1:])
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import sys
+import threading
+from typing import Dict, Optional, Union
+
+import commissioning
+import profiles
+
+# Both motors of the SRDO pair
+SIDES = ["left", "right"]
+
+
+def commission_motors(incremental: bool = False, instances: Optional[Dict[str, str]] = None) -> Dict[str, Union[bool, Exception]]:
+    """Commission the left and right motors concurrently.
+
+    Each motor gets its own set of D-Bus clients and runs in its own thread. The final
+    resets are synchronized, so the SRDO pair comes back with both new configurations.
+    `instances` maps "left" and "right" to the swd-services instance of each motor,
+    and defaults to the instances of their profiles.
+    Returns the result of `commission()` for each instance, or the exception it raised.
+    """
+
+    plans = {side: profiles.compile_profile(profiles.PROFILES[side]) for side in SIDES}
+
+    if instances is None:
+        instances = {side: plan.instance_id for side, plan in plans.items()}
+
+    barrier = threading.Barrier(len(SIDES))
+
+    def sync():
+        try:
+            barrier.wait()
+        except threading.BrokenBarrierError:
+            commissioning.check("wait for the other motor of the SRDO pair", 0)
+
+    def run(plan, instance_id):
+        threading.current_thread().name = instance_id
+
+        try:
+            swd = commissioning.SWDClients(instance_id, incremental)
+            return commissioning.commission(swd, plan, sync)
+        except Exception:
+            # Release the other motor if it is waiting for this one
+            barrier.abort()
+            raise
+
+    with ThreadPoolExecutor(max_workers=len(SIDES)) as executor:
+        futures = {instances[side]: executor.submit(run, plans[side], instances[side]) for side in SIDES}
+
+    results = {}
+    for instance_id, future in futures.items():
+        error = future.exception()
+        results[instance_id] = future.result() if error is None else error
+
+    return results
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+
+    parser = argparse.ArgumentParser(description="Commission the left and right motors concurrently")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="only write the parameters that differ from the target configuration, without restoring the factory parameters",
+    )
+    args = parser.parse_args(argv)
+
+    commissioning.load_dbus_session()
+
+    results = commission_motors(args.incremental)
+
+    print()
+    failed = False
+    for instance_id, result in results.items():
+        if isinstance(result, Exception):
+            print(f"{instance_id} : commissioning failed ({result})")
+            failed = True
+        elif result:
+            print(f"{instance_id} : commissioning succeeded")
+        else:
+            print(f"{instance_id} : already commissioned")
+
+    if failed:
+        print("\nCommissioning failed !")
+        sys.exit(1)
+
+    # Exit with success
+    print("\nCommissioning succeeded !")
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1:])
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Resident commissioning service, and its command line client.
+
+The service keeps the compiled profiles and the D-Bus clients of every instance
+warm, and runs the jobs received on a local UNIX socket:
+
+    python3 swd_daemon.py serve &
+    python3 swd_daemon.py check left
+    python3 swd_daemon.py commission right --incremental
+    python3 swd_daemon.py snapshot left left.snap
+    python3 swd_daemon.py diff left.snap right.snap
+
+A job is one JSON line sent on a new connection, e.g. {"job": "check", "side": "left"},
+answered with one JSON line holding "ok", the "output" of the job and its "result".
+Jobs of the same instance run one at a time, jobs of different instances concurrently.
+
+The service never opens a path received in a job: the client sends the content of
+the profiles and of the snapshot files to compare, and writes the snapshot files,
+whose content is sent back base64-encoded.
+"""
+
+import argparse
+import base64
+import json
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+
+def default_socket() -> str:
+    """Socket in $XDG_RUNTIME_DIR, or in a directory of the user in the temporary directory."""
+
+    directory = os.environ.get("XDG_RUNTIME_DIR") or os.path.join(tempfile.gettempdir(), f"swd-commissioning-{os.getuid()}")
+    return os.path.join(directory, "swd-commissioning.sock")
+
+
+# Socket of the service
+SOCKET = os.environ.get("SWD_DAEMON_SOCKET") or default_socket()
+
+SIDES = ["left", "right"]
+
+
+# =======================
+#        SERVICE
+# =======================
+
+
+class ThreadOutput:
+    """Standard output sending the prints of every job thread to the buffer of its job."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+
+    def write(self, text: str) -> int:
+        buffer = self.buffers.get(threading.get_ident())
+        if buffer is None:
+            return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_job(request: dict, locks: dict, locks_lock: threading.Lock) -> dict:
+    import commissioning
+    import check_commissioning
+    import profiles
+    import snapshot_file
+    from snapshot import read_snapshot
+
+    job = request.get("job")
+
+    if job == "diff":
+        a = snapshot_file.SnapshotFile("a", base64.b64decode(request["a"], validate=True))
+        b = snapshot_file.SnapshotFile("b", base64.b64decode(request["b"], validate=True))
+        diff = snapshot_file.diff_snapshot_files(a, b)
+        a.close()
+        b.close()
+        return {"ok": not diff, "result": [[name, value_a, value_b] for name, value_a, value_b in sorted(diff, key=lambda field: field[0])]}
+
+    if job not in ["commission", "check", "snapshot"]:
+        raise ValueError(f"unknown job {job!r}")
+    if request.get("side") not in SIDES and "profile" not in request:
+        raise ValueError("side or profile expected")
+    workers = request.get("workers")
+    if workers is not None and (not isinstance(workers, int) or isinstance(workers, bool) or workers < 1):
+        raise ValueError("workers must be a positive integer")
+
+    if request.get("profile") is not None:
+        plan = profiles.compile_profile_bytes(request["profile"].encode(), "profile")
+    else:
+        plan = profiles.compile_profile(profiles.PROFILES[request["side"]])
+
+    with locks_lock:
+        lock = locks.setdefault(plan.instance_id, threading.Lock())
+
+    # Prefix the messages of the job with the instance, see commissioning.check()
+    threading.current_thread().name = plan.instance_id
+
+    with lock:
+        if job == "commission":
+            transaction = request.get("transaction", False)
+            swd = commissioning.SWDClients(plan.instance_id, request.get("incremental", False) or transaction)
+            commissioned = commissioning.commission(swd, plan, transaction=transaction)
+            return {"ok": True, "result": "commissioned" if commissioned else "already commissioned"}
+
+        if job == "check":
+            swd = commissioning.SWDClients(plan.instance_id)
+            if request.get("sdo"):
+                import sdo
+
+                # One SDO client per interface, the checks of different motors share it
+                swd.sdo = sdo.SDONode(sdo.client(request["sdo"]), plan.node_id)
+            mismatches = check_commissioning.check_motor(swd, plan, request.get("fix", False), request.get("fast", False), workers)
+            if not mismatches and "check snapshot" not in swd.timings:
+                print(f"\n{check_commissioning.FAST_CHECK_SCOPE}")
+            return {"ok": not mismatches, "result": [str(mismatch) for mismatch in mismatches]}
+
+        swd = commissioning.SWDClients(plan.instance_id)
+        content = snapshot_file.snapshot_content(read_snapshot(swd, plan.operations), plan)
+        return {"ok": True, "result": base64.b64encode(content).decode()}
+
+
+def listen(path: str, handler):
+    """Server of the UNIX socket `path`, only reachable by the user of the service.
+
+    The directory of the socket is created private, and an existing one must belong
+    to the user and not be writable by the others, who could replace the socket.
+    The socket is created without the permissions of the others.
+    """
+
+    import socketserver
+
+    class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        daemon_threads = True
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    info = os.stat(directory)
+    if info.st_uid != os.getuid() or info.st_mode & 0o022:
+        raise PermissionError(f"{directory} must belong to the user of the service and not be writable by the others")
+
+    if os.path.exists(path):
+        os.unlink(path)
+
+    umask = os.umask(0o177)
+    try:
+        return Server(path, handler)
+    finally:
+        os.umask(umask)
+
+
+def serve(path: str):
+    import socketserver
+
+    import commissioning
+    import profiles
+
+    commissioning.load_dbus_session()
+
+    output = ThreadOutput(sys.stdout)
+    sys.stdout = output
+
+    locks = {}
+    locks_lock = threading.Lock()
+
+    class Handler(socketserver.StreamRequestHandler):
+        def handle(self):
+            start = time.monotonic()
+            buffer = output.buffers[threading.get_ident()] = []
+
+            try:
+                request = json.loads(self.rfile.readline())
+                response = run_job(request, locks, locks_lock)
+            except profiles.ProfileError as e:
+                response = {"ok": False, "error": f"Invalid profile: {e}"}
+            except commissioning.CommissioningError as e:
+                response = {"ok": False, "error": f"{e} failed"}
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            finally:
+                del output.buffers[threading.get_ident()]
+
+            response["output"] = "".join(buffer)
+            response["duration"] = time.monotonic() - start
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+    # Remove the socket when stopped by systemd or kill
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    with listen(path, Handler) as server:
+        print(f"Listening on {path}")
+        try:
+            server.serve_forever()
+        finally:
+            os.unlink(path)
+
+
+# =======================
+#        CLIENT
+# =======================
+
+
+def submit(request: dict, path: str = SOCKET) -> dict:
+    """Send a job to the service and wait for its response."""
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as f:
+            return json.loads(f.readline())
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Commissioning service with warm D-Bus clients, and its client")
+    parser.add_argument("--socket", default=SOCKET, help="socket of the service (default: %(default)s)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("serve", help="run the service")
+
+    commission = subparsers.add_parser("commission", help="commission a motor")
+    commission.add_argument("swd_id", choices=SIDES, help="swd motor")
+    commission.add_argument("--incremental", action="store_true", help="only write the parameters that differ from the target configuration")
+    commission.add_argument("--transaction", action="store_true", help="verify the written parameters, and restore their previous value on failure")
+    commission.add_argument("--profile", help="configuration profile of the motor (default: profile of the motor)")
+
+    check = subparsers.add_parser("check", help="check the commissioning of a motor")
+    check.add_argument("swd_id", choices=SIDES, help="swd motor")
+    check.add_argument("--fix", action="store_true", help="write the parameters which differ from the target configuration")
+    check.add_argument("--fast", action="store_true", help="only check the signatures of the safety parameters, once a full check passed")
+    check.add_argument("--workers", type=int, help="number of D-Bus services queried concurrently (default: all of them)")
+    check.add_argument("--sdo", metavar="INTERFACE", help="SocketCAN interface on which the standard objects are read with SDOs, e.g. can0")
+    check.add_argument("--profile", help="configuration profile of the motor (default: profile of the motor)")
+
+    save = subparsers.add_parser("snapshot", help="read a motor and save its snapshot")
+    save.add_argument("swd_id", choices=SIDES, help="swd motor")
+    save.add_argument("path", help="snapshot file")
+    save.add_argument("--profile", help="configuration profile of the motor (default: profile of the motor)")
+
+    diff = subparsers.add_parser("diff", help="compare two snapshot files")
+    diff.add_argument("a", help="snapshot file")
+    diff.add_argument("b", help="snapshot file")
+
+    args = parser.parse_args(argv)
+    if getattr(args, "workers", None) is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+
+    if args.command == "serve":
+        try:
+            serve(args.socket)
+        except PermissionError as e:
+            parser.error(str(e))
+        return
+
+    def read(path: str, mode: str = "r"):
+        try:
+            with open(path, mode) as f:
+                return f.read()
+        except OSError as e:
+            parser.error(str(e))
+
+    if args.command == "diff":
+        request = {"job": "diff", "a": base64.b64encode(read(args.a, "rb")).decode(), "b": base64.b64encode(read(args.b, "rb")).decode()}
+    else:
+        request = {"job": args.command, "side": args.swd_id}
+        if args.profile:
+            request["profile"] = read(args.profile)
+        if args.command == "commission":
+            request["incremental"] = args.incremental
+            request["transaction"] = args.transaction
+        elif args.command == "check":
+            request["fix"] = args.fix
+            request["fast"] = args.fast
+            request["workers"] = args.workers
+            request["sdo"] = args.sdo
+
+    response = submit(request, args.socket)
+
+    if args.command == "snapshot" and response["ok"]:
+        with open(args.path, "wb") as f:
+            f.write(base64.b64decode(response["result"]))
+
+    print(response["output"], end="")
+    if args.command == "diff":
+        for name, value_a, value_b in response["result"]:
+            print(f"{name} : {'-' if value_a is None else value_a} -> {'-' if value_b is None else value_b}")
+    elif args.command == "check" and response.get("result"):
+        print()
+        for mismatch in response["result"]:
+            print(f"  {mismatch}")
+
+    if "error" in response:
+        print(response["error"])
+    print(f"\n{args.command} {'succeeded' if response['ok'] else 'failed'} in {response['duration']:.3f}s")
+
+    if not response["ok"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1:])
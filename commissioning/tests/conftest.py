@@ -0,0 +1,65 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+"""Tests of the commissioning flows against the simulator of smcdbusclient.
+
+python3 -m pytest commissioning/tests
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend and the cache directories are selected when the scripts are imported
+os.environ["SWD_BACKEND"] = "sim"
+os.environ["XDG_CACHE_HOME"] = tempfile.mkdtemp(prefix="swd-tests-")
+for variable in ["SWD_SIM_CONFIG", "SWD_TRACE", "SWD_RECORD", "SWD_REPLAY"]:
+    os.environ.pop(variable, None)
+
+COMMISSIONING_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, COMMISSIONING_DIR)
+
+
+@pytest.fixture
+def simulator(tmp_path, monkeypatch):
+    """Simulator of factory motors, whose stored values and cache files live in `tmp_path`."""
+
+    import commissioning
+    import journal
+    import signatures
+    from smcdbusclient import simulator
+
+    config = dict(simulator.CONFIG)
+    simulator.configure(latency=0.0, latencies={}, errors={}, boot_time=0.002, store_time=0.0, state_dir=str(tmp_path / "motors"))
+    monkeypatch.setattr(journal, "JOURNALS_DIR", str(tmp_path / "journals"))
+    monkeypatch.setattr(signatures, "SIGNATURES_DIR", str(tmp_path / "signatures"))
+
+    # The clients hold their device, drop both
+    simulator.forget_devices()
+    commissioning._clients.clear()
+
+    yield simulator
+
+    simulator.forget_devices()
+    commissioning._clients.clear()
+    simulator.CONFIG.update(config)
+
+
+@pytest.fixture
+def plan():
+    import profiles
+
+    return profiles.compile_profile(profiles.PROFILES["left"])
+
+
+@pytest.fixture
+def commissioned(simulator, plan):
+    """Left motor commissioned with its profile."""
+
+    import commissioning
+
+    commissioning.commission(commissioning.SWDClients(plan.instance_id), plan)
+    return simulator.device(plan.instance_id)
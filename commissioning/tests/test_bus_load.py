@@ -0,0 +1,22 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import pytest
+
+import bus_load
+
+
+def test_bus_load_of_the_motors(capsys):
+    bus_load.main(["--sync-period", "10"])
+
+    assert "SYNC every 10ms" in capsys.readouterr().out
+
+
+@pytest.mark.parametrize("argv", [["--sync-period", "0"], ["--sync-period", "-10"], ["--sync-period", "10", "--bitrate", "0"]])
+def test_bus_load_rejects_invalid_arguments(argv, capsys):
+    with pytest.raises(SystemExit) as exit:
+        bus_load.main(argv)
+
+    assert exit.value.code == 2
+    assert "must be positive" in capsys.readouterr().err
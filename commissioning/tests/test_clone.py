@@ -0,0 +1,50 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import json
+
+import pytest
+
+import check_commissioning
+import clone
+import commissioning
+import profiles
+from commissioning import SWDClients
+
+# Target of the documentation, the right motor of the SRDO pair
+RIGHT_TARGET = {
+    "name": "swd_right_5",
+    "instance_id": "swd_right",
+    "node_id": 5,
+    "mirror": True,
+    "overrides": {
+        "safety_control_word_mapping": {
+            "CAN_2": ["STO", "STO", "SDIP_1", "SDIP_1", "SLS_1", "SLS_1", "NONE", "NONE"],
+            "SAFEIN_1": ["STO", "STO", "NONE", "NONE", "NONE", "NONE"],
+        }
+    },
+}
+
+
+@pytest.fixture
+def reference(commissioned, plan):
+    with open(profiles.PROFILES["left"]) as f:
+        od = json.load(f)["od"]
+    return clone.read_reference(SWDClients(plan.instance_id), od)
+
+
+def test_mirror_of_left_is_right(simulator, reference):
+    target = profiles.compile_profile_data(clone.target_profile(reference, RIGHT_TARGET))
+    commissioning.commission(SWDClients(target.instance_id), target)
+
+    right = profiles.compile_profile(profiles.PROFILES["right"])
+    assert target.instance_id == right.instance_id
+    assert check_commissioning.check_motor(SWDClients(right.instance_id), right) == []
+
+
+def test_mirror_requires_safety_control_word_mapping(reference):
+    target = dict(RIGHT_TARGET, overrides={"polarity": {"velocity_polarity": False}})
+
+    with pytest.raises(profiles.ProfileError, match="safety_control_word_mapping"):
+        clone.target_profile(reference, target)
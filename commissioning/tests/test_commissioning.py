@@ -0,0 +1,174 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import json
+
+import pytest
+
+import check_commissioning
+import commissioning
+import profiles
+from commissioning import CommissioningError, SWDClients
+from journal import Journal
+
+
+def test_commission_then_check(simulator, plan):
+    swd = SWDClients(plan.instance_id)
+    assert commissioning.commission(swd, plan)
+
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_commissioned_parameters_survive_a_reset(commissioned, simulator, plan):
+    simulator.forget_devices()
+    commissioning._clients.clear()
+
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_check_reports_drift(commissioned, simulator, plan):
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000})
+
+    mismatches = check_commissioning.check_motor(SWDClients(plan.instance_id), plan)
+
+    assert [(mismatch.operation.step, mismatch.field, mismatch.expected, mismatch.actual) for mismatch in mismatches] == [
+        ("ramps", "vl_velocity_acceleration_delta_speed", 1500, 1000)
+    ]
+
+
+def test_check_reports_invalid_srdo_configuration(commissioned, simulator, plan):
+    commissioned.write({(simulator.SRDO_CONFIGURATION_VALID, 0): 0})
+
+    mismatches = check_commissioning.check_motor(SWDClients(plan.instance_id), plan)
+
+    assert [(mismatch.operation.step, mismatch.operation.getter, mismatch.fixable) for mismatch in mismatches] == [("srdo", "getSRDOConfigurationValidity", True)]
+
+
+def test_incremental_commission_of_commissioned_motor(commissioned, simulator, plan):
+    swd = SWDClients(plan.instance_id, incremental=True)
+
+    assert not commissioning.commission(swd, plan)
+    assert swd.writes == 0
+
+
+def test_incremental_commission_writes_drifted_objects(commissioned, simulator, plan):
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000})
+
+    swd = SWDClients(plan.instance_id, incremental=True)
+    assert commissioning.commission(swd, plan)
+
+    assert [operation.name for operation in swd.written] == ["VelocityModeParameters()"]
+    assert swd.dirty == set()
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_incremental_commission_validates_srdo_configuration(commissioned, simulator, plan):
+    commissioned.write({(simulator.SRDO_CONFIGURATION_VALID, 0): 0})
+
+    swd = SWDClients(plan.instance_id, incremental=True)
+    assert commissioning.commission(swd, plan)
+
+    # No object differs, but the SRDO configuration is validated again
+    assert swd.written == [] and swd.writes == 1
+    assert commissioned.read(simulator.SRDO_CONFIGURATION_VALID, 0) == simulator.SRDO_CONFIGURATION_VALID_VALUE
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan, fix=True) == []
+
+
+def test_check_fix(commissioned, simulator, plan):
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000, (simulator.SLS, 1): 500})
+
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan, fix=True) == []
+
+
+def test_resume_interrupted_commissioning(simulator, plan):
+    simulator.configure(errors={"setSTOParameters": 1.0})
+    with pytest.raises(CommissioningError):
+        commissioning.commission(SWDClients(plan.instance_id), plan)
+
+    serial_number = simulator.device(plan.instance_id).read(simulator.IDENTITY, simulator.IDENTITY_SERIAL_NUMBER)
+    journal = Journal.load(plan.instance_id, plan.hash, serial_number)
+    assert journal is not None
+    assert "sto" not in journal.steps and "srdo" in journal.steps
+
+    simulator.configure(errors={})
+    restores = simulator.call_counts().get("restoreDefaultParameters", 0)
+    swd = SWDClients(plan.instance_id)
+    assert commissioning.commission(swd, plan)
+
+    # The factory parameters are not restored again, and the applied steps are not written again
+    assert simulator.call_counts().get("restoreDefaultParameters", 0) == restores
+    assert {operation.step for operation in swd.written} == {step.name for step in plan.steps if step.name not in journal.steps and step.name != "swd"}
+    assert Journal.load(plan.instance_id, plan.hash, serial_number) is None
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_resume_on_swapped_motor(simulator, plan):
+    simulator.configure(errors={"setSTOParameters": 1.0})
+    with pytest.raises(CommissioningError):
+        commissioning.commission(SWDClients(plan.instance_id), plan)
+
+    # The motor is replaced by a factory one before the next commissioning
+    device = simulator.device(plan.instance_id)
+    device.replace(device.read(simulator.IDENTITY, simulator.IDENTITY_SERIAL_NUMBER) + 1)
+
+    simulator.configure(errors={})
+    restores = simulator.call_counts().get("restoreDefaultParameters", 0)
+    swd = SWDClients(plan.instance_id)
+    assert commissioning.commission(swd, plan)
+
+    # Nothing is resumed, the new motor is commissioned from its factory parameters
+    assert simulator.call_counts().get("restoreDefaultParameters", 0) == restores + 1
+    assert {operation.step for operation in swd.written} == {step.name for step in plan.steps if step.name != "swd"}
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_transaction_rollback(commissioned, simulator, plan):
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000, (simulator.SLS, 1): 500})
+    simulator.configure(errors={"setSLSParameters": 1.0})
+
+    swd = SWDClients(plan.instance_id, incremental=True)
+    with pytest.raises(CommissioningError):
+        commissioning.commission(swd, plan, transaction=True)
+
+    # The ramps written before the failure are back to their previous value
+    assert commissioned.read(simulator.VL_VELOCITY_ACCELERATION, 1) == 1000
+    assert commissioned.read(simulator.SLS, 1) == 500
+    assert swd.written == []
+
+
+def test_transaction_requires_incremental_mode(simulator, plan):
+    with pytest.raises(ValueError):
+        commissioning.commission(SWDClients(plan.instance_id), plan, transaction=True)
+
+
+def changed_plan():
+    """Left profile with another SRDO_9 and SLS_1."""
+
+    with open(profiles.PROFILES["left"]) as f:
+        profile = json.load(f)
+    profile["srdo"]["SRDO_9"]["sct"] = 60
+    profile["sls"]["SLS_1"]["velocity_limit_u32"] = 500
+    return profiles.compile_profile_data(profile, "changed")
+
+
+def test_transaction_rollback_of_srdo(commissioned, simulator, plan):
+    simulator.configure(errors={"setSLSParameters": 1.0})
+
+    with pytest.raises(CommissioningError):
+        commissioning.commission(SWDClients(plan.instance_id, incremental=True), changed_plan(), transaction=True)
+
+    # The SRDO is restored, and its configuration validated again as before the transaction
+    assert commissioned.read(simulator.SRDO_CONFIGURATION_VALID, 0) == simulator.SRDO_CONFIGURATION_VALID_VALUE
+    simulator.configure(errors={})
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_transaction_rollback_keeps_invalid_srdo_configuration(commissioned, simulator, plan):
+    commissioned.write({(simulator.SRDO_CONFIGURATION_VALID, 0): 0})
+    simulator.configure(errors={"setSLSParameters": 1.0})
+
+    with pytest.raises(CommissioningError):
+        commissioning.commission(SWDClients(plan.instance_id, incremental=True), changed_plan(), transaction=True)
+
+    assert commissioned.read(simulator.SRDO_CONFIGURATION_VALID, 0) == 0
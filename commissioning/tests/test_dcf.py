@@ -0,0 +1,109 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import pytest
+
+import check_commissioning
+import commissioning
+from commissioning import CommissioningError, SWDClients
+import dcf
+from dcf import Entry
+
+
+def test_bulk_commission(simulator, plan):
+    assert commissioning.commission(SWDClients(plan.instance_id), plan, bulk=True)
+
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_incremental_bulk_commission_of_commissioned_motor(commissioned, simulator, plan):
+    swd = SWDClients(plan.instance_id, incremental=True)
+
+    assert not commissioning.commission(swd, plan, bulk=True)
+    assert swd.writes == 0
+
+
+def test_incremental_bulk_commission_writes_differing_entries(commissioned, simulator, plan):
+    commissioned.write({(simulator.TPDO_COMMUNICATION, 2): 254, (simulator.TPDO_MAPPING + 2, 2): 0, (simulator.VL_VELOCITY_ACCELERATION, 1): 1000})
+    calls = simulator.call_counts()
+
+    swd = SWDClients(plan.instance_id, incremental=True)
+    assert commissioning.commission(swd, plan, bulk=True, workers=2)
+
+    # TPDO_1 transmission type, ramps, and TPDO_3 remapped: invalidated, cleared, second object, count, validated
+    assert swd.writes == 7
+    written = {name: count - calls.get(name, 0) for name, count in simulator.call_counts().items() if name.startswith("setValue")}
+    assert written == {"setValueUInt8": 3, "setValueUInt32": 4}
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan) == []
+
+
+def test_download_sequence_of_unchanged_mapping():
+    cob_id = Entry(0x1802, 1, "UInt32", 0x384, "COB-ID")
+    transmission_type = Entry(0x1802, 2, "UInt8", 1, "transmission type")
+    mapping = [Entry(0x1A02, 0, "UInt8", 1, "count"), Entry(0x1A02, 1, "UInt32", 0x60410010, "entry 1")]
+    entries = [cob_id, transmission_type] + mapping
+
+    current = {(0x1802, 1): 0x384, (0x1802, 2): 255, (0x1A02, 0): 1, (0x1A02, 1): 0x60410010}
+    assert dcf.download_sequence(entries, current) == [[transmission_type]]
+
+    # Already invalid PDO, and empty mapping
+    current = {(0x1802, 1): 0x384 | dcf.COB_ID_INVALID, (0x1802, 2): 1, (0x1A02, 0): 0}
+    assert dcf.download_sequence(entries, current) == [[mapping[1], mapping[0], cob_id]]
+
+    assert [len(sequence) for sequence in dcf.download_sequence(entries)] == [6]
+
+
+def apply_sequences(values, sequences):
+    """Write the sequences to `values` as a CANopen device, failing on the writes CiA 301 forbids."""
+
+    for sequence in sequences:
+        for entry in sequence:
+            communication = entry.index - dcf.PDO_MAPPING_OFFSET if entry.index & dcf.PDO_MAPPING_OFFSET else entry.index
+            if communication in range(0x1400, 0x1600) or communication in range(0x1800, 0x1A00):
+                valid = not values[(communication, 1)] & dcf.COB_ID_INVALID
+                if entry.index == communication and entry.subindex == 1:
+                    assert not (valid and not entry.value & dcf.COB_ID_INVALID and entry.value != values[(communication, 1)]), f"{entry} on a valid PDO"
+                elif entry.index != communication:
+                    assert not valid, f"{entry} on a valid PDO"
+                    assert entry.subindex == 0 or values[(entry.index, 0)] == 0, f"{entry} with mapped objects"
+            values[(entry.index, entry.subindex)] = entry.value
+
+
+@pytest.mark.parametrize("known", [False, True], ids=["unknown", "factory values"])
+def test_download_sequence_from_factory_state(simulator, plan, known):
+    values = dict(simulator.device(plan.instance_id).od)
+    entries, _ = dcf.split_plan(plan)
+
+    apply_sequences(values, dcf.download_sequence(entries, dict(values) if known else None))
+
+    assert {(entry.index, entry.subindex): values[(entry.index, entry.subindex)] for entry in entries} == {(entry.index, entry.subindex): entry.value for entry in entries}
+
+
+def test_download_sequence_of_changed_cob_id():
+    cob_id = Entry(0x1400, 1, "UInt32", 0x40000204, "COB-ID")
+    current = {(0x1400, 1): 0x204, (0x1400, 2): 255}
+
+    invalidate = Entry(0x1400, 1, "UInt32", 0xC0000204, "COB-ID")
+    assert [[str(entry) for entry in sequence] for sequence in dcf.download_sequence([cob_id], current)] == [[str(invalidate), str(cob_id)]]
+
+
+def test_entry_od_index_of_the_plan(plan):
+    entries, _ = dcf.split_plan(plan)
+
+    assert Entry(0x1029, 2, "UInt8", 1, "").od_index == 0x10290200
+    assert {operation.args[0] for operation in plan.operations if operation.step == "od"} <= {entry.od_index for entry in entries}
+
+
+def test_bulk_download_stops_at_first_failure(simulator, plan):
+    simulator.configure(errors={"setValueUInt8": 1.0})
+
+    with pytest.raises(CommissioningError):
+        commissioning.commission(SWDClients(plan.instance_id), plan, bulk=True, workers=1)
+
+    assert sum(count for name, count in simulator.call_counts().items() if name.startswith("setValue")) == 1
+
+
+def test_bulk_transaction(simulator, plan):
+    with pytest.raises(ValueError):
+        commissioning.commission(SWDClients(plan.instance_id, incremental=True), plan, transaction=True, bulk=True)
@@ -0,0 +1,48 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import logging
+
+import drift_monitor
+
+
+def metric(states, name):
+    (line,) = [line for line in drift_monitor.metrics(states).splitlines() if line.startswith(name + "{")]
+    return line.rsplit(" ", 1)[1]
+
+
+def test_drift_is_kept_by_fast_checks(commissioned, simulator, plan):
+    state = drift_monitor.MotorState(plan)
+    log = logging.getLogger("test_drift_monitor")
+
+    drift_monitor.check_motor(state, True, None, log)
+    assert state.mismatches == []
+
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000})
+    drift_monitor.check_motor(state, True, None, log)
+    assert (state.mode, len(state.mismatches)) == ("full", 1)
+
+    # A fast check does not read the ramps: their drift is kept, with the safety mismatches
+    drift_monitor.check_motor(state, False, None, log)
+    assert (state.mode, len(state.mismatches)) == ("fast", 1)
+    assert metric([state], "swd_config_drift") == "1"
+
+    commissioned.write({(simulator.SLS, 1): 500})
+    drift_monitor.check_motor(state, False, None, log)
+    assert state.mode == "fast"
+    assert [mismatch.split(":")[0] for mismatch in state.mismatches] == [
+        "VelocityModeParameters().vl_velocity_acceleration_delta_speed",
+        "SLSParameters(SLS_1).velocity_limit_u32",
+    ]
+
+    # Fixed safety parameters clear their mismatches on the next fast check
+    commissioned.write({(simulator.SLS, 1): 680})
+    drift_monitor.check_motor(state, False, None, log)
+    assert len(state.mismatches) == 1
+
+    # Fixed ramps are only seen by the next full check
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1500})
+    drift_monitor.check_motor(state, True, None, log)
+    assert state.mismatches == []
+    assert metric([state], "swd_config_drift") == "0"
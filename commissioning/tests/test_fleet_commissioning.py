@@ -0,0 +1,48 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import json
+import time
+from typing import Optional
+
+import pytest
+
+import fleet_commissioning
+
+# Delay of one call of every motor, so that the robots last long enough to overlap
+LATENCIES = {"getNetworkParameters": 0.5}
+
+
+def robot(tmp_path, name: str, errors: Optional[dict] = None) -> dict:
+    """Robot whose motors are simulated in their own state directory and cache."""
+
+    config = {"latencies": LATENCIES, "errors": errors or {}, "boot_time": 0.002, "state_dir": str(tmp_path / name / "motors")}
+    return {"name": name, "env": {"SWD_BACKEND": "sim", "SWD_SIM_CONFIG": json.dumps(config), "XDG_CACHE_HOME": str(tmp_path / name / "cache")}}
+
+
+def test_fleet_isolates_the_failing_robot(tmp_path):
+    robots = [robot(tmp_path, "robot-01"), robot(tmp_path, "robot-02", {"setVelocityModeParameters": 1.0}), robot(tmp_path, "robot-03")]
+    inventory = tmp_path / "robots.json"
+    inventory.write_text(json.dumps({"robots": robots}))
+    summary = tmp_path / "summary.json"
+
+    start = time.monotonic()
+    with pytest.raises(SystemExit) as exit:
+        fleet_commissioning.main([str(inventory), "--workers", "3", "--timeout", "60", "--logs", str(tmp_path / "logs"), "--summary", str(summary)])
+    duration = time.monotonic() - start
+
+    assert exit.value.code == 1
+    summaries = json.loads(summary.read_text())
+    assert [(summary["name"], summary["status"]) for summary in summaries] == [("robot-01", "ok"), ("robot-02", "failed"), ("robot-03", "ok")]
+
+    # The failure of robot-02 does not affect the other robots
+    for summary in [summaries[0], summaries[2]]:
+        assert summary["motors"] == {"swd_left": "commissioned", "swd_right": "commissioned"}
+        assert summary["check"] == {"swd_left": "ok", "swd_right": "ok"}
+    assert all(status.startswith("failed") for status in summaries[1]["motors"].values())
+    assert summaries[1]["check"] == {}
+    assert (tmp_path / "logs" / "robot-02.log").exists()
+
+    # The robots ran in parallel
+    assert duration < sum(summary["duration"] for summary in summaries)
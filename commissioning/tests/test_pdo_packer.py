@@ -0,0 +1,55 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import pytest
+
+import pdo_packer
+import profiles
+
+
+def pack(*texts):
+    return pdo_packer.pack([pdo_packer.parse_object(text) for text in texts])
+
+
+def frames(pdos):
+    return pdo_packer.frames_per_sync(pdo_packer.pdo_section("TPDO", pdos))
+
+
+def test_same_rate():
+    pdos = pack("0x6041_00_10", "0x6064_00_20", "0x2620_02_08", "0x6044_00_10")
+    assert pdos == [(1, ["0x6041_00_10", "0x6064_00_20", "0x6044_00_10"]), (1, ["0x2620_02_08"])]
+
+
+def test_slower_objects_fill_faster_pdos():
+    pdos = pack("0x6041_00_10", "0x6064_00_20", "0x2620_02_08@2")
+    assert pdos == [(1, ["0x6041_00_10", "0x6064_00_20", "0x2620_02_08"])]
+    assert frames(pdos) == 1.0
+
+
+def test_slower_objects_without_spare_bits():
+    pdos = pack("0x6064_00_20", "0x606C_00_20", "0x2620_02_08@4", "0x6041_00_10@4")
+    assert pdos == [(1, ["0x6064_00_20", "0x606C_00_20"]), (4, ["0x2620_02_08", "0x6041_00_10"])]
+    assert frames(pdos) == 1.25
+
+
+def test_slower_objects_fill_only_when_it_saves_frames():
+    # 24 spare bits: the 32-bit object needs a PDO anyway, the 8-bit one goes with it
+    pdos = pack("0x6064_00_20", "0x6041_00_10", "0x606C_00_20@2", "0x2620_02_08@2")
+    assert pdos == [(1, ["0x6064_00_20", "0x6041_00_10"]), (2, ["0x606C_00_20", "0x2620_02_08"])]
+    assert frames(pdos) == 1.5
+
+
+def test_object_with_several_rates():
+    assert pack("0x6041_00_10@2", "0x6041_00_10") == [(1, ["0x6041_00_10"])]
+
+
+def test_too_many_pdos():
+    with pytest.raises(profiles.ProfileError):
+        pack(*[f"0x60{i:02X}_00_40" for i in range(0, 5)])
+
+
+@pytest.mark.parametrize("text", ["0x6041_00_00", "0x6041_00_0C", "0x6041_00_10@0", "0x6041_00_10@x"])
+def test_invalid_object(text):
+    with pytest.raises(profiles.ProfileError):
+        pdo_packer.parse_object(text)
@@ -0,0 +1,57 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import json
+import os
+import stat
+
+import pytest
+
+import profiles
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(profiles, "CACHE_DIR", str(tmp_path / "plans"))
+    monkeypatch.setattr(profiles, "_plans", {})
+    return tmp_path / "plans"
+
+
+def describe(plan):
+    return [(step.name, step.on_write, [vars(operation) for operation in step.operations]) for step in plan.steps]
+
+
+@pytest.mark.parametrize("side", ["left", "right"])
+def test_cached_plan(cache_dir, side):
+    plan = profiles.compile_profile(profiles.PROFILES[side])
+    assert stat.S_IMODE(os.stat(cache_dir).st_mode) == 0o700
+    (cache,) = cache_dir.iterdir()
+    assert cache.suffix == ".json"
+
+    profiles._plans.clear()
+    cached = profiles.compile_profile(profiles.PROFILES[side])
+
+    assert cached is not plan
+    assert (cached.name, cached.hash, cached.instance_id, cached.node_id) == (plan.name, plan.hash, plan.instance_id, plan.node_id)
+    assert describe(cached) == describe(plan)
+
+
+def test_invalid_cache_is_compiled_again(cache_dir):
+    plan = profiles.compile_profile(profiles.PROFILES["left"])
+    (cache,) = cache_dir.iterdir()
+
+    for content in ["not json", json.dumps({"steps": [{"operations": [{"factory": "os.system"}]}]})]:
+        cache.write_text(content)
+        profiles._plans.clear()
+        assert describe(profiles.compile_profile(profiles.PROFILES["left"])) == describe(plan)
+
+
+def test_cache_key_includes_the_compiler(cache_dir, monkeypatch):
+    profiles.compile_profile(profiles.PROFILES["left"])
+
+    profiles._plans.clear()
+    monkeypatch.setattr(profiles, "_source_hash", "0" * 64)
+    profiles.compile_profile(profiles.PROFILES["left"])
+
+    assert len(list(cache_dir.iterdir())) == 2
@@ -0,0 +1,72 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import gzip
+import json
+import os
+import subprocess
+import sys
+
+import check_commissioning
+import commissioning
+import recording
+from recording import Recorder
+
+from conftest import COMMISSIONING_DIR
+
+
+def test_record_then_replay(commissioned, simulator, plan, tmp_path):
+    recorder = Recorder()
+    assert check_commissioning.check_motor(commissioning.SWDClients(plan.instance_id, recorder=recorder), plan) == []
+    recorder.export(str(tmp_path / "left.rec.gz"))
+
+    header, calls = recording.load_recording(str(tmp_path / "left.rec.gz"))
+    assert header["version"] == recording.VERSION
+    assert {call[4] for call in calls} >= {"getNetworkParameters", "getSRDOParameters", "getSLSParameters"}
+
+    # Replayed without simulator, with the same cache as the recording
+    env = {**os.environ, "SWD_BACKEND": "replay", "SWD_REPLAY": str(tmp_path / "left.rec.gz"), "SWD_REPLAY_SPEED": "0", "XDG_CACHE_HOME": str(tmp_path / "cache")}
+    result = subprocess.run([sys.executable, "check_commissioning.py", "left"], cwd=COMMISSIONING_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    assert result.returncode == 0, result.stdout
+    assert "Check commissioning succeeded !" in result.stdout
+
+
+def replay_env(tmp_path, path):
+    return {**os.environ, "SWD_BACKEND": "replay", "SWD_REPLAY": str(path), "SWD_REPLAY_SPEED": "0", "XDG_CACHE_HOME": str(tmp_path / "cache")}
+
+
+def test_replay_with_recorded_enums(commissioned, simulator, plan, tmp_path):
+    recorder = Recorder()
+    assert check_commissioning.check_motor(commissioning.SWDClients(plan.instance_id, recorder=recorder), plan) == []
+    recorder.export(str(tmp_path / "left.rec.gz"))
+
+    # Recorded with an smcdbusclient whose PDOId values differ from the simulator
+    with gzip.open(tmp_path / "left.rec.gz", "rt") as f:
+        header, calls = json.loads(f.readline()), f.read()
+    assert header["enums"]["PDOId"] == {"module": "smcdbusclient.communication", "members": {"PDO_1": 0, "PDO_2": 1, "PDO_3": 2, "PDO_4": 3}}
+    assert '{"e":"PDOId","n":"PDO_1"}' in calls
+    header["enums"]["PDOId"]["members"] = {name: value + 10 for name, value in header["enums"]["PDOId"]["members"].items()}
+    with gzip.open(tmp_path / "other.rec.gz", "wt") as f:
+        f.write(json.dumps(header) + "\n" + calls)
+
+    env = replay_env(tmp_path, tmp_path / "other.rec.gz")
+    result = subprocess.run([sys.executable, "check_commissioning.py", "left"], cwd=COMMISSIONING_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    assert result.returncode == 0, result.stdout
+
+    # The recorded enumerations are installed once, before the scripts import them
+    code = "import profiles, recording; recording.install_enums(); from smcdbusclient.communication import PDOId; print(PDOId.PDO_2.value, profiles.PDOId is PDOId)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=COMMISSIONING_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    assert result.stdout.split() == ["11", "True"], result.stdout
+
+
+def test_replay_of_unrecorded_call(tmp_path):
+    recorder = Recorder()
+    recorder.export(str(tmp_path / "empty.rec.gz"))
+
+    env = {**os.environ, "SWD_BACKEND": "replay", "SWD_REPLAY": str(tmp_path / "empty.rec.gz"), "SWD_REPLAY_SPEED": "0", "XDG_CACHE_HOME": str(tmp_path / "cache")}
+    result = subprocess.run([sys.executable, "check_commissioning.py", "left"], cwd=COMMISSIONING_DIR, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+    assert result.returncode != 0
+    assert "is not in" in result.stdout
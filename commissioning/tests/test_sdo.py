@@ -0,0 +1,129 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import queue
+import socket
+import threading
+
+import pytest
+
+import check_commissioning
+import sdo
+import sdo_server
+import snapshot_file
+from commissioning import SWDClients
+from snapshot import read_snapshot
+
+
+class Loopback:
+    """One end of an in-memory CAN bus, the frames sent being received by `peer`."""
+
+    def __init__(self):
+        self.frames = queue.Queue()
+        self.peer = None
+
+    def send(self, can_id: int, data: bytes):
+        self.peer.frames.put((can_id, bytes(data)))
+
+    def recv(self, timeout: float):
+        try:
+            return self.frames.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        pass
+
+
+def loopback_pair():
+    a, b = Loopback(), Loopback()
+    a.peer, b.peer = b, a
+    return a, b
+
+
+@pytest.fixture
+def sdo_bus(simulator, plan):
+    """Start the SDO server of the left motor on a bus, return its SDO node and the server."""
+
+    stop = threading.Event()
+    threads = []
+    clients = []
+
+    def start(client_bus=None, server_bus=None, **options):
+        if client_bus is None:
+            client_bus, server_bus = loopback_pair()
+        server = sdo_server.SDOServer({plan.node_id: plan.instance_id}, **options)
+
+        def serve():
+            while not stop.is_set():
+                server.serve(server_bus, 0.05)
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        threads.append((thread, server_bus))
+
+        client = sdo.SDOClient(client_bus, timeout=0.2)
+        clients.append(client)
+        return sdo.SDONode(client, plan.node_id), server
+
+    yield start
+
+    stop.set()
+    for client in clients:
+        client.close()
+    for thread, server_bus in threads:
+        thread.join()
+        server_bus.close()
+
+
+def snapshot_fields(swd, plan, node=None):
+    return snapshot_file.snapshot_fields(read_snapshot(swd, plan.operations, sdo=node), plan)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"block": False}, {"switch": False}, {"expedited": False}, {"block": False, "expedited": False}],
+    ids=["block", "no block", "no switch", "segmented", "no block segmented"],
+)
+def test_sdo_read_matches_dbus(commissioned, sdo_bus, plan, options):
+    node, server = sdo_bus(**options)
+    swd = SWDClients(plan.instance_id)
+
+    assert snapshot_fields(swd, plan, node) == snapshot_fields(swd, plan)
+    assert server.requests[plan.node_id] > 0
+
+
+def test_sdo_read_falls_back_on_dbus(commissioned, sdo_bus, simulator, plan, capsys):
+    node, server = sdo_bus(aborts={(simulator.VL_VELOCITY_ACCELERATION, 1): sdo_server.ABORT_NO_OBJECT}, dropped={(simulator.POLARITY, 0)})
+    swd = SWDClients(plan.instance_id)
+
+    assert snapshot_fields(swd, plan, node) == snapshot_fields(swd, plan)
+    output = capsys.readouterr().out
+    assert "aborted with 0x06020000" in output and "timed out" in output
+
+
+def test_fix_reads_the_written_objects_over_dbus(commissioned, sdo_bus, simulator, plan):
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000})
+    commissioned.store("ALL")
+
+    swd = SWDClients(plan.instance_id)
+    swd.sdo, _ = sdo_bus()
+    getters = simulator.call_counts().get("getVelocityModeParameters", 0)
+
+    assert check_commissioning.check_motor(swd, plan, fix=True) == []
+    assert [operation.name for operation in swd.written] == ["VelocityModeParameters()"]
+    assert simulator.call_counts().get("getVelocityModeParameters", 0) > getters
+
+
+def test_sdo_read_on_vcan(commissioned, sdo_bus, plan):
+    try:
+        server_bus = sdo.CANBus("vcan0", [(sdo.SDO_REQUEST, 0x780)])
+    except (AttributeError, OSError) as e:
+        pytest.skip(f"vcan0 unavailable: {e}")
+    client_bus = sdo.CANBus("vcan0", [(sdo.SDO_RESPONSE, 0x780)])
+
+    node, _ = sdo_bus(client_bus, server_bus)
+    swd = SWDClients(plan.instance_id)
+
+    assert snapshot_fields(swd, plan, node) == snapshot_fields(swd, plan)
@@ -0,0 +1,85 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import json
+
+import check_commissioning
+from commissioning import SWDClients
+import signatures
+
+
+def check(plan, fast=True):
+    swd = SWDClients(plan.instance_id)
+    mismatches = check_commissioning.check_motor(swd, plan, fast=fast)
+    return mismatches, "check snapshot" in swd.timings
+
+
+def test_fast_check_after_full_check(commissioned, simulator, plan):
+    assert check(plan) == ([], True)
+    assert check(plan) == ([], False)
+
+
+def test_fast_check_detects_safety_drift(commissioned, simulator, plan):
+    check(plan, fast=False)
+    commissioned.write({(simulator.SLS, 1): 500})
+
+    mismatches, full = check(plan)
+
+    assert not full
+    assert [(mismatch.operation.name, mismatch.field) for mismatch in mismatches] == [("SLSParameters(SLS_1)", "velocity_limit_u32")]
+
+
+def test_fast_check_reads_safety_control_word_mappings(commissioned, simulator, plan):
+    check(plan, fast=False)
+    # Mapping modified while the SRDO configuration stays valid
+    commissioned.write({(simulator.SAFETY_CONTROLWORD_MAPPING + 1, 1): 0})
+    commissioned.write({(simulator.SRDO_CONFIGURATION_VALID, 0): simulator.SRDO_CONFIGURATION_VALID_VALUE})
+
+    mismatches, full = check(plan)
+
+    assert not full
+    assert [(mismatch.operation.name, mismatch.field) for mismatch in mismatches] == [("SafetyControlWordMapping(CAN_2)", "safety_function_0")]
+
+
+def test_invalid_srdo_configuration_needs_full_check(commissioned, simulator, plan):
+    check(plan, fast=False)
+    with open(signatures.signature_path(plan.instance_id, plan)) as f:
+        recorded = json.load(f)
+    commissioned.write({(simulator.SRDO_CONFIGURATION_VALID, 0): 0})
+
+    # The full check reports the invalid configuration, every time
+    for _ in range(2):
+        mismatches, full = check(plan)
+        assert full
+        assert [(mismatch.operation.getter, mismatch.expected, mismatch.actual) for mismatch in mismatches] == [("getSRDOConfigurationValidity", True, False)]
+
+    # Fixed, the signatures recorded before are valid again
+    assert check_commissioning.check_motor(SWDClients(plan.instance_id), plan, fix=True, fast=True) == []
+    assert check(plan) == ([], False)
+    with open(signatures.signature_path(plan.instance_id, plan)) as f:
+        assert json.load(f) == recorded
+
+
+def test_stale_signature_is_recorded_again(commissioned, simulator, plan):
+    check(plan, fast=False)
+    path = signatures.signature_path(plan.instance_id, plan)
+    with open(path) as f:
+        recorded = json.load(f)
+    with open(path, "w") as f:
+        json.dump({**recorded, "SLSParameters(SLS_1)": recorded["SLSParameters(SLS_1)"] ^ 1}, f)
+
+    assert check(plan) == ([], False)
+
+    with open(path) as f:
+        assert json.load(f) == recorded
+
+
+def test_fast_check_scope_is_printed(commissioned, simulator, capsys):
+    check_commissioning.main(["left"])
+    assert "Check commissioning succeeded !" in capsys.readouterr().out
+
+    check_commissioning.main(["left", "--fast"])
+    out = capsys.readouterr().out
+    assert "Check commissioning succeeded !" not in out
+    assert check_commissioning.FAST_CHECK_SCOPE in out
@@ -0,0 +1,84 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import struct
+
+import pytest
+
+import commissioning
+import snapshot_file
+from snapshot import read_snapshot
+
+
+def save(path, plan):
+    snapshot = read_snapshot(commissioning.SWDClients(plan.instance_id), plan.operations)
+    snapshot_file.save_snapshot(str(path), snapshot, plan)
+    return snapshot
+
+
+def test_round_trip(commissioned, plan, tmp_path):
+    snapshot = save(tmp_path / "left.snap", plan)
+
+    f = snapshot_file.SnapshotFile(str(tmp_path / "left.snap"))
+    try:
+        assert (f.instance_id, f.node_id, f.profile_hash) == (plan.instance_id, plan.node_id, plan.hash)
+
+        expected = {}
+        for name, kind, value in snapshot_file.snapshot_fields(snapshot, plan):
+            expected[name] = bool(value) if kind == snapshot_file.TYPE_BOOL else value
+        assert dict(f.fields()) == expected
+        assert f.count == len(expected)
+    finally:
+        f.close()
+
+
+def test_diff(commissioned, simulator, plan, tmp_path):
+    save(tmp_path / "a.snap", plan)
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000})
+    save(tmp_path / "b.snap", plan)
+
+    a = snapshot_file.SnapshotFile(str(tmp_path / "a.snap"))
+    b = snapshot_file.SnapshotFile(str(tmp_path / "b.snap"))
+    try:
+        assert snapshot_file.diff_snapshot_files(a, a) == []
+        assert snapshot_file.diff_snapshot_files(a, b) == [("VelocityModeParameters().vl_velocity_acceleration_delta_speed", 1500, 1000)]
+    finally:
+        a.close()
+        b.close()
+
+
+def test_diff_of_different_fields(tmp_path):
+    snapshot_file.write_snapshot_file(str(tmp_path / "a.snap"), [("x", snapshot_file.TYPE_INT, 1), ("y", snapshot_file.TYPE_BOOL, 1)])
+    snapshot_file.write_snapshot_file(str(tmp_path / "b.snap"), [("x", snapshot_file.TYPE_INT, 2), ("z", snapshot_file.TYPE_INT, -3)])
+
+    a = snapshot_file.SnapshotFile(str(tmp_path / "a.snap"))
+    b = snapshot_file.SnapshotFile(str(tmp_path / "b.snap"))
+    try:
+        assert sorted(snapshot_file.diff_snapshot_files(a, b)) == [("x", 1, 2), ("y", True, None), ("z", None, -3)]
+    finally:
+        a.close()
+        b.close()
+
+
+def test_truncated_file(tmp_path):
+    path = tmp_path / "a.snap"
+    snapshot_file.write_snapshot_file(str(path), [("x", snapshot_file.TYPE_INT, 1), ("y", snapshot_file.TYPE_BOOL, 1)])
+    data = path.read_bytes()
+
+    for size in [snapshot_file.HEADER.size + 10, len(data) - 1]:
+        path.write_bytes(data[:size])
+        with pytest.raises(ValueError, match="truncated"):
+            snapshot_file.SnapshotFile(str(path))
+
+
+def test_invalid_name_offsets(tmp_path):
+    path = tmp_path / "a.snap"
+    snapshot_file.write_snapshot_file(str(path), [("x", snapshot_file.TYPE_INT, 1), ("y", snapshot_file.TYPE_BOOL, 1)])
+    data = bytearray(path.read_bytes())
+
+    # Offset of the second name after the end of the name table
+    struct.pack_into("<I", data, snapshot_file.HEADER.size + 17 * 2 + 4, 100)
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        snapshot_file.SnapshotFile(str(path))
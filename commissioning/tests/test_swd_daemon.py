@@ -0,0 +1,80 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+import base64
+import json
+import os
+import socketserver
+import stat
+import threading
+
+import pytest
+
+import profiles
+import snapshot_file
+import swd_daemon
+
+
+def run_job(request):
+    return swd_daemon.run_job(request, {}, threading.Lock())
+
+
+def test_snapshot_and_diff(commissioned, simulator, plan, tmp_path):
+    a = run_job({"job": "snapshot", "side": "left", "path": str(tmp_path / "a.snap")})
+    commissioned.write({(simulator.VL_VELOCITY_ACCELERATION, 1): 1000})
+    b = run_job({"job": "snapshot", "side": "left"})
+
+    # The snapshot is sent back, never written by the service
+    assert not (tmp_path / "a.snap").exists()
+    f = snapshot_file.SnapshotFile("a", base64.b64decode(a["result"]))
+    assert f.instance_id == plan.instance_id
+    f.close()
+
+    diff = run_job({"job": "diff", "a": a["result"], "b": b["result"]})
+    assert not diff["ok"]
+    assert diff["result"] == [["VelocityModeParameters().vl_velocity_acceleration_delta_speed", 1500, 1000]]
+
+
+def test_profile_content(commissioned, simulator):
+    with open(profiles.PROFILES["left"]) as f:
+        profile = json.load(f)
+    profile["velocity_mode"]["vl_velocity_acceleration_delta_speed"] = 1200
+
+    response = run_job({"job": "check", "side": "left", "profile": json.dumps(profile)})
+
+    assert response["result"] == ["VelocityModeParameters().vl_velocity_acceleration_delta_speed: expected 1200, got 1500"]
+
+
+def test_profile_path_is_not_opened(simulator):
+    with pytest.raises(profiles.ProfileError):
+        run_job({"job": "check", "side": "left", "profile": profiles.PROFILES["left"]})
+
+
+@pytest.mark.parametrize("workers", [0, -1, True, "2", 1.5])
+def test_invalid_workers(simulator, workers):
+    with pytest.raises(ValueError, match="workers"):
+        run_job({"job": "check", "side": "left", "workers": workers})
+
+
+def test_default_socket(monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmp_path))
+    assert swd_daemon.default_socket() == str(tmp_path / "swd-commissioning.sock")
+
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    assert os.path.basename(os.path.dirname(swd_daemon.default_socket())) == f"swd-commissioning-{os.getuid()}"
+
+
+def test_socket_is_private(tmp_path):
+    path = tmp_path / "run" / "swd-commissioning.sock"
+
+    with swd_daemon.listen(str(path), socketserver.StreamRequestHandler):
+        assert stat.S_IMODE(os.stat(path.parent).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+
+def test_socket_in_shared_directory(tmp_path):
+    os.chmod(tmp_path, 0o777)
+
+    with pytest.raises(PermissionError):
+        swd_daemon.listen(str(tmp_path / "swd-commissioning.sock"), socketserver.StreamRequestHandler)
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""Timed spans of the D-Bus calls.
+
+When the SWD_TRACE environment variable is set, the D-Bus clients of `SWDClients`
+are wrapped so that every call records a span (service, method, arguments, error
+code, duration), and the commissioning phases are recorded as well. The spans are
+written at exit to the SWD_TRACE file, in the Chrome trace format read by
+chrome://tracing and https://ui.perfetto.dev.
+
+    SWD_TRACE=trace.json python3 swd_left_4_commissioning.py
+    python3 tracing.py trace.json     # slowest calls
+"""
+
+import atexit
+from enum import Enum
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+
+class Span:
+    def __init__(self, instance_id: str, service: str, method: str, args: str, error: Optional[int], start: float, duration: float, thread: str):
+        self.instance_id = instance_id
+        self.service = service
+        self.method = method
+        self.args = args
+        self.error = error
+        self.start = start
+        self.duration = duration
+        self.thread = thread
+
+    @property
+    def name(self) -> str:
+        return f"{self.method}({self.args})"
+
+
+def format_argument(value) -> str:
+    if isinstance(value, Enum):
+        return value.name
+    if isinstance(value, int) and not isinstance(value, bool) and value > 0xFFFF:
+        return f"0x{value:X}"
+    attributes = getattr(value, "__dict__", None)
+    if attributes is not None:
+        return "{" + ", ".join(f"{name}={format_argument(attribute)}" for name, attribute in attributes.items() if not name.startswith("_")) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(format_argument(item) for item in value) + "]"
+    return repr(value)
+
+
+def error_code(result) -> Optional[int]:
+    """Error code of the result of a D-Bus call: the last element of a tuple, or the result itself."""
+
+    if isinstance(result, tuple) and result:
+        result = result[-1]
+    return result if isinstance(result, int) else None
+
+
+class Tracer:
+    """Spans of the calls of every traced client, in recording order."""
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self.origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def wrap(self, client, service: str, instance_id: str) -> "TracedClient":
+        return TracedClient(self, client, service, instance_id)
+
+    def phase(self, instance_id: str, name: str, start: float, duration: float):
+        """Record a commissioning phase, see commissioning.timed()."""
+        self.record(Span(instance_id, "phase", name, "", None, start, duration, threading.current_thread().name))
+
+    def to_chrome(self) -> Dict[str, Any]:
+        """Spans in the Chrome trace event format: one process per instance, one track per thread."""
+
+        events = []
+        pids: Dict[str, int] = {}
+        tids: Dict[tuple, int] = {}
+
+        for span in self.spans:
+            if span.instance_id not in pids:
+                pids[span.instance_id] = len(pids) + 1
+                events.append({"name": "process_name", "ph": "M", "pid": pids[span.instance_id], "args": {"name": span.instance_id}})
+            pid = pids[span.instance_id]
+
+            if (pid, span.thread) not in tids:
+                tids[(pid, span.thread)] = len(tids) + 1
+                events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tids[(pid, span.thread)], "args": {"name": span.thread}})
+
+            event = {
+                "name": span.name if span.service != "phase" else span.method,
+                "cat": span.service,
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6, 1),
+                "dur": round(span.duration * 1e6, 1),
+                "pid": pid,
+                "tid": tids[(pid, span.thread)],
+            }
+            if span.service != "phase":
+                event["args"] = {"service": span.service, "method": span.method, "args": span.args, "error": span.error}
+            events.append(event)
+
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def export(self, path: str):
+        with open(path, "w") as f:
+            json.dump(self.to_chrome(), f)
+
+
+class TracedClient:
+    """Proxy of a D-Bus client recording a span for every method call."""
+
+    def __init__(self, tracer: Tracer, client, service: str, instance_id: str):
+        self._tracer = tracer
+        self._client = client
+        self._service = service
+        self._instance_id = instance_id
+
+    def __getattr__(self, name: str):
+        attribute = getattr(self._client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args):
+            start = time.perf_counter()
+            result = None
+            try:
+                result = attribute(*args)
+                return result
+            finally:
+                self._tracer.record(
+                    Span(
+                        self._instance_id,
+                        self._service,
+                        name,
+                        ", ".join(format_argument(arg) for arg in args),
+                        error_code(result),
+                        start,
+                        time.perf_counter() - start,
+                        threading.current_thread().name,
+                    )
+                )
+
+        return call
+
+
+_tracer: Optional[Tracer] = None
+_tracer_lock = threading.Lock()
+
+
+def default_tracer() -> Optional[Tracer]:
+    """Tracer of the process if SWD_TRACE is set, written to SWD_TRACE at exit."""
+
+    global _tracer
+
+    path = os.environ.get("SWD_TRACE")
+    if not path:
+        return None
+
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+            atexit.register(_tracer.export, path)
+        return _tracer
+
+
+# =======================
+#        SUMMARY
+# =======================
+
+
+def load_spans(path: str) -> List[dict]:
+    """Call spans of a trace file, as dictionaries with the instance, name, error and duration (ms)."""
+
+    with open(path) as f:
+        events = json.load(f)["traceEvents"]
+
+    processes = {event["pid"]: event["args"]["name"] for event in events if event["ph"] == "M" and event["name"] == "process_name"}
+    return [
+        {"instance_id": processes.get(event["pid"], ""), "name": event["name"], "method": event["args"]["method"], "error": event["args"]["error"], "duration": event["dur"] / 1000}
+        for event in events
+        if event["ph"] == "X" and event["cat"] != "phase"
+    ]
+
+
+def print_summary(spans: List[dict], count: int = 20):
+    print(f"{'instance':<12}  {'duration':>10}  {'error':>5}  call")
+    for span in sorted(spans, key=lambda span: -span["duration"])[:count]:
+        print(f"{span['instance_id']:<12}  {span['duration']:>8.1f}ms  {str(span['error']):>5}  {span['name']}")
+
+    methods: Dict[str, List[float]] = {}
+    for span in spans:
+        methods.setdefault(span["method"], []).append(span["duration"])
+
+    print(f"\n{'method':<36}  {'calls':>5}  {'total':>10}  {'max':>10}")
+    for method, durations in sorted(methods.items(), key=lambda item: -sum(item[1])):
+        print(f"{method:<36}  {len(durations):>5}  {sum(durations):>8.1f}ms  {max(durations):>8.1f}ms")
+
+
+# =======================
+#      MAIN PROGRAM
+# =======================
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Print the slowest D-Bus calls of a trace")
+    parser.add_argument("trace", help="trace file written with SWD_TRACE")
+    parser.add_argument("--count", type=int, default=20, help="number of calls printed (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    print_summary(load_spans(args.trace), args.count)
+
+
+if __name__ == "__main__":
+
+    main(sys.argv[1:])
@@ -0,0 +1,81 @@
+#
+# Copyright (C) 2023 ez-Wheel. All Rights Reserved.
+#
+
+from typing import Any, List, Optional
+
+from profiles import Operation, Plan, Step
+from snapshot import Snapshot
+
+
+class Mismatch:
+    """Field of an object whose value differs from the plan."""
+
+    def __init__(self, operation: Operation, field: str, expected: Any, actual: Any, fixable: Optional[bool] = None):
+        self.operation = operation
+        self.field = field
+        self.expected = expected
+        self.actual = actual
+        # The state of a step has no setter, but is restored by its `on_write` call
+        self.fixable = operation.setter is not None if fixable is None else fixable
+
+    def __str__(self) -> str:
+        # CAN IDs and mapped objects read better in hexadecimal
+        hexadecimal = "can_id" in self.field or self.field == "items"
+        return f"{self.operation.name}.{self.field}: expected {format_value(self.expected, hexadecimal)}, got {format_value(self.actual, hexadecimal)}"
+
+
+def format_value(value, hexadecimal: bool = False) -> str:
+    if isinstance(value, list):
+        return "[" + ", ".join(format_value(item, hexadecimal) for item in value) + "]"
+    if hasattr(value, "name"):
+        return value.name
+    if hexadecimal and isinstance(value, int) and not isinstance(value, bool):
+        return hex(value)
+    return str(value)
+
+
+def verify_operation(snapshot: Snapshot, operation: Operation) -> List[Mismatch]:
+    """Compare an object of the snapshot with the plan, return all the mismatches."""
+
+    value, error = snapshot.read(operation)
+    if error != 1:
+        return [Mismatch(operation, "error", 1, error)]
+
+    return [Mismatch(operation, field, expected, actual) for field, expected, actual in operation.mismatches(value)]
+
+
+def verify_step(snapshot: Snapshot, step: Step) -> List[Mismatch]:
+    """Compare every object of the step in the snapshot with the plan, return all the mismatches.
+
+    The `state` of the step, e.g. the SRDO configuration validity, is checked too.
+    """
+
+    mismatches = []
+    for operation in step.operations:
+        mismatches += verify_operation(snapshot, operation)
+
+    if step.state is not None:
+        for mismatch in verify_operation(snapshot, step.state):
+            mismatches.append(Mismatch(mismatch.operation, mismatch.field, mismatch.expected, mismatch.actual, step.on_write is not None))
+
+    return mismatches
+
+
+def verify(snapshot: Snapshot, plan: Plan) -> List[Mismatch]:
+    """Compare every object of the plan in the snapshot, return all the mismatches."""
+
+    mismatches = []
+    for step in plan.steps:
+        mismatches += verify_step(snapshot, step)
+    return mismatches
+
+
+def print_report(mismatches: List[Mismatch]):
+    if not mismatches:
+        return
+
+    print(f"\n{len(mismatches)} mismatch(es):")
+    for mismatch in mismatches:
+        suffix = "" if mismatch.fixable else " (not fixable)"
+        print(f"  {mismatch}{suffix}")